@@ -1,7 +1,10 @@
 import os
 import io
 import json
+import threading
 import traceback
+import uuid
+from datetime import datetime
 import pandas as pd
 import mojimoji
 import ezdxf
@@ -9,8 +12,9 @@ import math
 import ast
 import numpy as np
 from urllib.parse import quote
-from flask import Flask, render_template, request, redirect, url_for, flash, make_response, session
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, make_response, session, jsonify, send_file, abort
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, bindparam, case, or_
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
@@ -19,6 +23,18 @@ from itertools import combinations
 
 # shape_definitions.pyから全てインポート
 from shape_definitions import *
+from revision_matcher import STATE_VERSION, AnalysisState, analyze_revision, diff_detections
+from entity_store import EntityTable
+from drawing_cache import DrawingCache, save_upload, sha256_file
+from dxf_stream import read_entity_table
+from dxf_blocks import add_block_counts, load_block_shapes, split_block_shapes
+from dxf_writer import write_table_dxf
+from project_store import item_colors, search_item, search_key, search_version, table_from_workbook, table_sheets
+from text_index import TextIndex, text_index_path
+from job_queue import JOB_DONE, JOB_ERROR, JOB_QUEUED, JOB_RUNNING, JobQueue, job_result_path
+from metrics import metrics, profile_summary, profiled
+from result_store import PAGE_SIZE, handle_page, result_colors, save_handles, split_results
+from xlsx_stream import XLSX_MIMETYPE, iter_xlsx
 
 # --- アプリケーションとデータベースの初期設定 (変更なし) ---
 app = Flask(__name__)
@@ -29,35 +45,210 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# 変換済み図面のキャッシュ (内容ハッシュ -> EntityTable) の保存先と合計サイズの上限
+app.config['DRAWING_CACHE_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'cache')
+app.config['DRAWING_CACHE_MAX_BYTES'] = 2 * 1024 ** 3
+# 図形解析のワーカープロセス数 (0 または 1 ならリクエスト内で逐次解析する)
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', 0))
+drawing_cache = DrawingCache(app.config['DRAWING_CACHE_FOLDER'], app.config['DRAWING_CACHE_MAX_BYTES'])
+# バックグラウンドジョブの結果ファイルの保存先と、同時に実行する重い処理の数
+app.config['JOB_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'jobs')
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+# 解析1回分の cProfile を取れるようにするか (ALLOW_PROFILING=1)、プロファイルの保存先
+app.config['ALLOW_PROFILING'] = os.environ.get('ALLOW_PROFILING') == '1'
+app.config['PROFILE_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'profiles')
+# 図形解析の結果 (検出図形のハンドル) の保存先と、ユーザーごとに残す結果の数
+app.config['RESULT_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'results')
+app.config['ANALYSIS_RESULTS_KEEP'] = 20
+# ブロック名 -> 図形キーの対応表 (BLOCK_SHAPES_FILE の JSON)。対応付けたブロックの参照は形状を判定せずに数える
+app.config['BLOCK_SHAPES'] = load_block_shapes(os.environ['BLOCK_SHAPES_FILE'], SHAPE_DEFINITIONS) if os.environ.get('BLOCK_SHAPES_FILE') else {}
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 # ... (以降のDBモデル定義、ヘルパー関数、認証ルートは変更なし) ...
 class User(UserMixin, db.Model): id = db.Column(db.Integer, primary_key=True); username = db.Column(db.String(100), unique=True, nullable=False); password_hash = db.Column(db.String(200), nullable=False); projects = db.relationship('Project', backref='author', lazy=True, cascade="all, delete-orphan")
-class Project(db.Model): id = db.Column(db.Integer, primary_key=True); name = db.Column(db.String(100), nullable=False); user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False); kouji_basho = db.Column(db.String(200), default='（未設定）'); gokei_kingaku = db.Column(db.String(100), default=''); page_number = db.Column(db.String(50), default=''); original_dxf_path = db.Column(db.String(300)); converted_excel_path = db.Column(db.String(300)); items = db.relationship('ReportItem', backref='project', lazy='dynamic', cascade="all, delete-orphan")
-class ReportItem(db.Model): id = db.Column(db.Integer, primary_key=True); project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False); order = db.Column(db.Integer, nullable=False, default=0); item_type = db.Column(db.String(50), nullable=False); hinmei = db.Column(db.String(200)); hinshitsu = db.Column(db.String(200), default=''); suryo = db.Column(db.Integer); tani = db.Column(db.String(50), default=''); search_params = db.Column(db.String(500)); color = db.Column(db.Integer, default=1)
+class Project(db.Model): id = db.Column(db.Integer, primary_key=True); name = db.Column(db.String(100), nullable=False); user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True); kouji_basho = db.Column(db.String(200), default='（未設定）'); gokei_kingaku = db.Column(db.String(100), default=''); page_number = db.Column(db.String(50), default=''); original_dxf_path = db.Column(db.String(300)); converted_excel_path = db.Column(db.String(300)); entity_store_path = db.Column(db.String(300)); source_hash = db.Column(db.String(64)); items = db.relationship('ReportItem', backref='project', lazy='dynamic', cascade="all, delete-orphan")
+class Job(db.Model): id = db.Column(db.String(32), primary_key=True); user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False); project_id = db.Column(db.Integer, db.ForeignKey('project.id')); kind = db.Column(db.String(20), nullable=False); status = db.Column(db.String(20), nullable=False, default=JOB_QUEUED); progress = db.Column(db.Float, default=0.0); message = db.Column(db.String(500)); result_path = db.Column(db.String(300)); result_name = db.Column(db.String(300)); result_mimetype = db.Column(db.String(100)); analysis_id = db.Column(db.String(32)); created_at = db.Column(db.DateTime, default=datetime.utcnow); finished_at = db.Column(db.DateTime)
+class ReportItem(db.Model): __table_args__ = (db.Index('ix_report_item_project_order', 'project_id', 'order'),); id = db.Column(db.Integer, primary_key=True); project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False); order = db.Column(db.Integer, nullable=False, default=0); item_type = db.Column(db.String(50), nullable=False); hinmei = db.Column(db.String(200)); hinshitsu = db.Column(db.String(200), default=''); suryo = db.Column(db.Integer); tani = db.Column(db.String(50), default=''); search_params = db.Column(db.String(500)); color = db.Column(db.Integer, default=1)
+class SearchResult(db.Model): __table_args__ = (db.UniqueConstraint('project_id', 'params_hash'),); id = db.Column(db.Integer, primary_key=True); project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False, index=True); params_hash = db.Column(db.String(64), nullable=False); source_hash = db.Column(db.String(64), nullable=False); detector_version = db.Column(db.String(50), nullable=False); count = db.Column(db.Integer, nullable=False); gids = db.Column(db.LargeBinary, nullable=False)
+class AnalysisResult(db.Model): id = db.Column(db.String(32), primary_key=True); user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True); filename = db.Column(db.String(300)); source_hash = db.Column(db.String(64), nullable=False); summary = db.Column(db.Text, nullable=False); diagnostics = db.Column(db.Text); result_path = db.Column(db.String(300), nullable=False); created_at = db.Column(db.DateTime, default=datetime.utcnow)
 @login_manager.user_loader
 def load_user(user_id): return User.query.get(int(user_id))
 def distance(p1,p2): return np.linalg.norm(p1-p2)
-def str_to_tuple_parser(s):
-    try: return ast.literal_eval(s)
-    except: return (0,0,0)
-def add_entity_to_dxf(msp, entity_type, row):
-    try:
-        color = int(row.get('color', 256))
-        attribs = {'color': color}
-        if 'linetype' in row and pd.notna(row['linetype']): attribs['linetype'] = row['linetype']
-        if entity_type == 'line': msp.add_line(str_to_tuple_parser(row['start']), str_to_tuple_parser(row['end']), dxfattribs=attribs)
-        elif entity_type == 'circle': msp.add_circle(str_to_tuple_parser(row['center']), row['radius'], dxfattribs=attribs)
-        elif entity_type == 'arc': msp.add_arc(str_to_tuple_parser(row['center']), row['radius'], row['start_angle'], row['end_angle'], dxfattribs=attribs)
-        elif entity_type == 'text':
-            text_attribs = {'height': row.get('height', 2.5), 'color': color}
-            if 'style' in row and pd.notna(row['style']): text_attribs['style'] = row['style']
-            msp.add_text(str(row['text']), dxfattribs=text_attribs).set_pos(str_to_tuple_parser(row['insert']))
-    except: pass
+def load_drawing_table(filepath, content_hash=None):
+    """DXFを EntityTable に変換する。同じ内容の図面を変換済みならキャッシュから読み込む"""
+    key = content_hash or sha256_file(filepath)
+    with metrics.stage('drawing.load'): return drawing_cache.get_or_build(key, lambda: read_entity_table(filepath))  # 図面全体を展開せずに必要な図形だけ読む
+def upgrade_schema():
+    """既存DBに後から追加した列と索引を足す (create_all は既存テーブルを変更しないため)"""
+    added = {'project': {'entity_store_path': 'VARCHAR(300)', 'source_hash': 'VARCHAR(64)'}, 'job': {'analysis_id': 'VARCHAR(32)'}}
+    indexes = {'ix_project_user_id': 'project (user_id)', 'ix_report_item_project_order': 'report_item (project_id, "order")'}
+    with db.engine.begin() as conn:
+        for table_name, columns in added.items():
+            existing = {c['name'] for c in db.inspect(conn).get_columns(table_name)}
+            for name, ddl in columns.items():
+                if name not in existing: conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {name} {ddl}")
+        for name, target in indexes.items(): conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+def load_project_table(project):
+    """プロジェクトの図形データ (EntityTable) を読み込む。旧形式 (変換済みExcelのみ) のプロジェクトはここで .npz に移行する"""
+    if project.entity_store_path and os.path.exists(project.entity_store_path): return EntityTable.load(project.entity_store_path)
+    if not project.converted_excel_path or not os.path.exists(project.converted_excel_path): raise FileNotFoundError("プロジェクトの図形データが見つかりません")
+    table = table_from_workbook(project.converted_excel_path)
+    project.entity_store_path = os.path.splitext(project.converted_excel_path)[0] + '.npz'
+    table.save(project.entity_store_path); db.session.commit()
+    return table
+def load_project_text_index(project, table):
+    """プロジェクトの文字検索インデックスを読み込む。無いか古い場合は table から作って保存する"""
+    path = text_index_path(project.entity_store_path)
+    index = TextIndex.load(path) if os.path.exists(path) else None
+    if index is None or len(index) != table.counts['TEXT']:
+        index = TextIndex.from_table(table); index.save(path)
+    return index
+def project_source_hash(project):
+    """プロジェクトの元図面の SHA-256 (旧プロジェクトはここで計算して保存する)"""
+    if not project.source_hash:
+        path = project.original_dxf_path if project.original_dxf_path and os.path.exists(project.original_dxf_path) else project.entity_store_path
+        project.source_hash = sha256_file(path); db.session.commit()
+    return project.source_hash
+def project_searcher(project, table):
+    """明細項目の検索関数 search(item_type, params)。結果は (プロジェクト, 検索条件のハッシュ) ごとにDBに保存し、
+    元図面か検出処理の版が変わるまで使い回す (2回目以降の出力は色の付け替えだけになる)"""
+    index = []
+    def search(item_type, params):
+        key, version, source = search_key(item_type, params), search_version(item_type), project_source_hash(project)
+        saved = SearchResult.query.filter_by(project_id=project.id, params_hash=key).first()
+        if saved and saved.source_hash == source and saved.detector_version == version: return saved.count, np.frombuffer(saved.gids, dtype=np.int64)
+        if item_type == 'text_search' and not index: index.append(load_project_text_index(project, table))
+        count, gids = search_item(table, item_type, params, index[0] if index else None)
+        saved = saved or SearchResult(project_id=project.id, params_hash=key)
+        saved.source_hash, saved.detector_version, saved.count, saved.gids = source, version, int(count), np.asarray(gids, dtype=np.int64).tobytes()
+        db.session.add(saved); db.session.commit()
+        return count, gids
+    return search
+def migrate_legacy_projects():
+    """変換済みExcelしか持たない全プロジェクトを .npz に移行し、移行した件数を返す"""
+    projects = [p for p in Project.query.all() if not (p.entity_store_path and os.path.exists(p.entity_store_path)) and p.converted_excel_path and os.path.exists(p.converted_excel_path)]
+    for project in projects: load_project_table(project)
+    return len(projects)
+def update_job(job_id, **fields):
+    """ジョブの状態をDBに書き込む (ジョブ実行スレッドから呼ばれる)"""
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        if job is None: return  # 実行中にプロジェクトごと削除された
+        for key, value in fields.items(): setattr(job, key, value)
+        if fields.get('status') in (JOB_DONE, JOB_ERROR): job.finished_at = datetime.utcnow()
+        db.session.commit()
+job_queue = JobQueue(app.config['JOB_WORKERS'], update_job)
+def fail_interrupted_jobs():
+    """前回の起動中に終わらなかったジョブを失敗扱いにする (スレッドと一緒に消えているため)"""
+    Job.query.filter(Job.status.in_([JOB_QUEUED, JOB_RUNNING])).update({'status': JOB_ERROR, 'message': 'サーバーの再起動により中断されました'}, synchronize_session=False)
+    db.session.commit()
+def start_job(kind, fn, project_id=None):
+    """ジョブを登録してすぐに返す。fn(job_id, progress) は結果ファイルの情報を返す"""
+    job = Job(id=uuid.uuid4().hex, user_id=current_user.id, project_id=project_id, kind=kind)
+    db.session.add(job); db.session.commit()
+    job_id = job.id
+    job_queue.submit(job_id, lambda progress: fn(job_id, progress))
+    return jsonify(job_status_dict(job)), 202
+def job_status_dict(job):
+    return {'id': job.id, 'kind': job.kind, 'status': job.status, 'progress': job.progress, 'message': job.message, 'status_url': url_for('job_status', job_id=job.id), 'download_url': url_for('job_download', job_id=job.id) if job.status == JOB_DONE else None}
+def get_job_or_404(job_id): return Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+def analysis_state_path(content_hash):
+    """図面の解析状態の保存先。変換済み図面のキャッシュと同じ場所に置き、同じ上限で古いものから削除する"""
+    return os.path.join(drawing_cache.directory, f"{content_hash}-state-v{STATE_VERSION}.npz")
+def load_analysis_state(content_hash):
+    path = analysis_state_path(content_hash)
+    try: state = AnalysisState.load(path); os.utime(path); return state
+    except (FileNotFoundError, ValueError, KeyError, OSError): return None
+def save_analysis_state(content_hash, state):
+    path = analysis_state_path(content_hash)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f: state.save(f)
+    os.replace(tmp_path, path); drawing_cache.evict()
+def run_analysis(filepath, content_hash, selected_shapes, progress=None, base_hash=None, profile=False):
+    """図面を読み込んで選択された図形を探索し、(結果, 診断情報) を返す。progress には (割合, メッセージ) を渡す
+
+    同じ図面か base_hash (改訂前の図面) の解析状態があれば、変わった図形の近くだけを判定し直す。
+    base_hash の解析状態があれば、図形ごとに改訂前からの検出の追加・削除を results[key]['revision'] に入れる。
+    診断情報はこの解析の段階ごとの処理時間と判定数 (metrics)、判定したアンカー数 (stats)、
+    profile=True の場合は cProfile の上位の関数 (profile) と保存したファイル名 (profile_name)。
+    """
+    with metrics.capture() as captured:
+        if not profile:
+            results, stats = _run_analysis(filepath, content_hash, selected_shapes, progress, base_hash)
+            return results, {'metrics': captured.snapshot(), 'stats': stats}
+        os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
+        name = f"analysis_{datetime.utcnow():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:8]}.prof"
+        path = os.path.join(app.config['PROFILE_FOLDER'], name)
+        with profiled(path): results, stats = _run_analysis(filepath, content_hash, selected_shapes, progress, base_hash)
+        return results, {'metrics': captured.snapshot(), 'stats': stats, 'profile': profile_summary(path), 'profile_name': name}
+def _run_analysis(filepath, content_hash, selected_shapes, progress, base_hash):
+    if progress: progress(0.0, '図面を読み込んでいます')
+    # 図形種別ごとの列指向配列に変換 (同じ図面の再解析ではキャッシュから読み込む)
+    content_hash = content_hash or sha256_file(filepath)
+    table = load_drawing_table(filepath, content_hash)
+    # 対応表にあるブロックの参照はブロック名で数え、その図形は形状の判定から除く
+    table, block_handles = split_block_shapes(table, app.config['BLOCK_SHAPES'], selected_shapes)
+    if progress: progress(0.2, '図形を探索しています')
+    previous = load_analysis_state(content_hash)
+    base = load_analysis_state(base_hash) if base_hash and base_hash != content_hash else None
+    # 空間インデックスを1回だけ構築し、各アンカーの近傍を半径検索して check_* 関数に渡す (解析状態が無く ANALYSIS_WORKERS > 1 ならタイル分割して並列に解析)
+    results, state, stats = analyze_revision(table, selected_shapes, previous or base, app.config['ANALYSIS_WORKERS'],
+                                             progress=(lambda f: progress(0.2 + 0.8 * f, '図形を探索しています')) if progress else None)
+    add_block_counts(results, block_handles)
+    if base is not None:
+        for shape_key, diff in diff_detections(base, state, selected_shapes).items(): results[shape_key]['revision'] = diff
+    save_analysis_state(content_hash, state)
+    return results, stats
+def save_analysis_result(user_id, filename, content_hash, results, diagnostics=None):
+    """解析結果を保存して結果IDを返す。ハンドルは .npz に、要約はDBに保存し、ユーザーの古い結果は削除する"""
+    summary, handles = split_results(results)
+    analysis_id = uuid.uuid4().hex
+    path = job_result_path(app.config['RESULT_FOLDER'], analysis_id, '.npz')
+    save_handles(path, handles)
+    db.session.add(AnalysisResult(id=analysis_id, user_id=user_id, filename=filename, source_hash=content_hash, summary=json.dumps(summary, ensure_ascii=False),
+                                  diagnostics=json.dumps(diagnostics, ensure_ascii=False) if diagnostics else None, result_path=path))
+    for old in AnalysisResult.query.filter_by(user_id=user_id).order_by(AnalysisResult.created_at.desc()).offset(app.config['ANALYSIS_RESULTS_KEEP']).all():
+        if os.path.exists(old.result_path): os.remove(old.result_path)
+        db.session.delete(old)
+    db.session.commit()
+    return analysis_id
+def get_analysis_result(analysis_id): return AnalysisResult.query.filter_by(id=analysis_id, user_id=current_user.id).first() if analysis_id else None
 def get_project_or_404(project_id):
     project = Project.query.get_or_404(project_id)
     return project if project.author == current_user else None
+# --- 明細項目の並び順 ---
+# order は ITEM_ORDER_STEP 間隔の疎なキー。追加は (project_id, order) の索引で最大値だけを引いて末尾に付け、
+# 移動は隣の項目とキーを入れ替えるので、どちらも項目数によらず1～2行しか書き換えない。
+# 同じキーの項目 (古いDBの連番と混ざった場合など) は (order, id) の順に並べ、入れ替えられないときだけ振り直す。
+ITEM_ORDER_STEP = 1024
+def project_items(project): return project.items.order_by(ReportItem.order, ReportItem.id)
+def next_item_order(project_id):
+    last = db.session.query(db.func.max(ReportItem.order)).filter(ReportItem.project_id == project_id).scalar()
+    return 0 if last is None else last + ITEM_ORDER_STEP
+def adjacent_item(item, direction):
+    """(order, id) の順で item の1つ前 ('up') か1つ後 ('down') の項目。無ければ None"""
+    query = ReportItem.query.filter(ReportItem.project_id == item.project_id)
+    if direction == 'up': return query.filter(or_(ReportItem.order < item.order, and_(ReportItem.order == item.order, ReportItem.id < item.id))).order_by(ReportItem.order.desc(), ReportItem.id.desc()).first()
+    if direction == 'down': return query.filter(or_(ReportItem.order > item.order, and_(ReportItem.order == item.order, ReportItem.id > item.id))).order_by(ReportItem.order, ReportItem.id).first()
+    return None
+def rebalance_items(project_id):
+    """プロジェクトの項目の order を今の並びのまま ITEM_ORDER_STEP 間隔に振り直す (1回の executemany)"""
+    ids = [row.id for row in db.session.query(ReportItem.id).filter(ReportItem.project_id == project_id).order_by(ReportItem.order, ReportItem.id)]
+    table = ReportItem.__table__
+    db.session.execute(table.update().where(table.c.id == bindparam('item_id')), [{'item_id': item_id, 'order': i * ITEM_ORDER_STEP} for i, item_id in enumerate(ids)])
+    db.session.expire_all()
+def update_items_from_form(project_id, form):
+    """フォームの hinmei_<項目ID> などの値で項目をまとめて更新する (小計の品質・単位はそのまま)"""
+    ids = [int(key[len('hinmei_'):]) for key in form if key.startswith('hinmei_') and key[len('hinmei_'):].isdigit()]
+    if not ids: return
+    table = ReportItem.__table__
+    is_subtotal = table.c.item_type == 'subtotal'
+    statement = table.update().where(table.c.project_id == project_id, table.c.id == bindparam('item_id')).values(
+        hinmei=bindparam('new_hinmei'), color=bindparam('new_color'),
+        hinshitsu=case((is_subtotal, table.c.hinshitsu), else_=bindparam('new_hinshitsu')), tani=case((is_subtotal, table.c.tani), else_=bindparam('new_tani')))
+    db.session.execute(statement, [{'item_id': i, 'new_hinmei': form.get(f'hinmei_{i}'), 'new_color': int(form.get(f'color_{i}', 1)),
+                                    'new_hinshitsu': form.get(f'hinshitsu_{i}'), 'new_tani': form.get(f'tani_{i}')} for i in ids])
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated: return redirect(url_for('home'))
@@ -107,6 +298,9 @@ def shape_analyzer():
                 print(f"Error removing temp file: {e}")
             session.pop('analyzer_filepath', None)
             session.pop('analyzer_filename', None)
+            session.pop('analyzer_hash', None)
+        session.pop('analysis_id', None)
+        session.pop('analyzer_base_hash', None); session.pop('analyzer_base_filename', None)
         return redirect(url_for('shape_analyzer'))
 
     if request.method == 'POST':
@@ -118,7 +312,13 @@ def shape_analyzer():
             filename = secure_filename(file.filename)
             # ユーザーごとに一意な一時ファイルパスを生成
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"analyzer_{current_user.id}_{filename}")
-            file.save(filepath)
+            # 改訂版としてアップロードした場合は、今の図面を改訂前として差分解析に使う
+            if request.form.get('revision') and session.get('analyzer_hash'):
+                session['analyzer_base_hash'], session['analyzer_base_filename'] = session['analyzer_hash'], session.get('analyzer_filename')
+            else:
+                session.pop('analyzer_base_hash', None); session.pop('analyzer_base_filename', None)
+            session['analyzer_hash'] = save_upload(file, filepath)  # 保存しながら内容ハッシュを計算
+            session.pop('analysis_id', None)
             session['analyzer_filepath'] = filepath
             session['analyzer_filename'] = filename
             return redirect(url_for('shape_analyzer'))
@@ -134,19 +334,11 @@ def shape_analyzer():
                 flash('探索する図形を1つ以上選択してください。'); return redirect(url_for('shape_analyzer'))
             
             try:
-                doc = ezdxf.readfile(filepath)
-                msp = doc.modelspace()
-                entities = [{'entity': e.dxftype(), 'handle': e.dxf.handle, **e.dxf.all_existing_dxf_attribs()} for e in msp]
-                
-                results, all_found_handles = {}, set()
-                for shape_key in selected_shapes:
-                    definition = SHAPE_DEFINITIONS[shape_key]
-                    count, found_handles_for_shape = 0, []
-                    # ... (探索ロジックは前回同様) ...
-                    # ...
-                    results[shape_key] = {'name': definition['name'], 'count': count, 'handles': list(found_handles_for_shape)}
-                
-                session['analysis_results'] = results # 結果をセッションに保存
+                content_hash = session.get('analyzer_hash') or sha256_file(filepath)
+                results, diagnostics = run_analysis(filepath, content_hash, selected_shapes, base_hash=session.get('analyzer_base_hash'), profile=profiling_requested())
+                # 結果はサーバー側に保存し、セッションには結果IDだけを置く
+                session['analysis_id'] = save_analysis_result(current_user.id, session.get('analyzer_filename'), content_hash, results,
+                                                              diagnostics if request.form.get('show_metrics') or profiling_requested() else None)
                 return redirect(url_for('shape_analyzer'))
             except Exception as e:
                 flash(f"図形探索中にエラーが発生しました: {e}"); traceback.print_exc()
@@ -154,20 +346,111 @@ def shape_analyzer():
         # --- 色変更済みファイルの生成処理 ---
         elif 'generate' in request.form:
             filepath = session.get('analyzer_filepath')
-            analysis_results = session.get('analysis_results')
-            if not filepath or not analysis_results:
+            analysis = get_analysis_result(session.get('analysis_id'))
+            if not filepath or not os.path.exists(filepath) or not analysis or analysis.source_hash != session.get('analyzer_hash'):
                 flash('先に解析を実行してください。'); return redirect(url_for('shape_analyzer'))
+            try:
+                chunks, mimetype, ext = generate_analysis_output(filepath, analysis, request.form.get('generate'),
+                                                                 {key: int(request.form.get(f"color_{key}", 1)) for key in json.loads(analysis.summary)})
+                name = os.path.splitext(analysis.filename or 'drawing')[0]
+                return download_response(chunks, mimetype, f"colored_{name}{ext}")
+            except Exception as e:
+                flash(f"ファイルの生成中にエラーが発生しました: {e}"); traceback.print_exc()
 
-            # ... (Excel/DXF生成ロジック) ...
-            
     # GETリクエストの場合、セッション情報に基づいて表示を切り替える
     filename = session.get('analyzer_filename')
-    results = session.get('analysis_results')
-    # 結果を表示した後はセッションから消去し、再解析を促す
-    if 'analysis_results' in session:
-        session.pop('analysis_results')
-        
-    return render_template('shape_analyzer.html', filename=filename, results=results, definitions=SHAPE_DEFINITIONS)
+    if 'job' in request.args:  # バックグラウンドで実行した解析の結果を表示する
+        job = get_job_or_404(request.args['job'])
+        if job.kind != 'analyze' or job.status != JOB_DONE or not job.analysis_id: abort(404)
+        session['analysis_id'] = job.analysis_id
+    analysis = get_analysis_result(session.get('analysis_id'))
+    results = json.loads(analysis.summary) if analysis else None
+    diagnostics = json.loads(analysis.diagnostics) if analysis and analysis.diagnostics else None
+
+    return render_template('shape_analyzer.html', filename=filename, base_filename=session.get('analyzer_base_filename'), analysis_id=analysis.id if analysis else None, results=results, diagnostics=diagnostics, allow_profiling=app.config['ALLOW_PROFILING'], definitions=SHAPE_DEFINITIONS, cache_stats=drawing_cache.stats())
+
+@app.route('/shape_analyzer/jobs', methods=['POST'])
+@login_required
+def start_analysis_job():
+    filepath, content_hash, base_hash = session.get('analyzer_filepath'), session.get('analyzer_hash'), session.get('analyzer_base_hash')
+    user_id, filename = current_user.id, session.get('analyzer_filename')
+    selected_shapes = request.form.getlist('shapes_to_find')
+    show_metrics, profile = bool(request.form.get('show_metrics')), profiling_requested()
+    if not filepath or not os.path.exists(filepath): return jsonify({'error': 'まずDXFファイルをアップロードしてください。'}), 400
+    if not selected_shapes: return jsonify({'error': '探索する図形を1つ以上選択してください。'}), 400
+    def analyze(job_id, progress):
+        results, diagnostics = run_analysis(filepath, content_hash, selected_shapes, progress, base_hash, profile)
+        diagnostics = diagnostics if show_metrics or profile else None
+        with app.app_context(): analysis_id = save_analysis_result(user_id, filename, content_hash, results, diagnostics)
+        path = job_result_path(app.config['JOB_FOLDER'], job_id, '.json')
+        with open(path, 'w', encoding='utf-8') as f: json.dump({'results': results, 'diagnostics': diagnostics}, f, ensure_ascii=False)
+        return {'result_path': path, 'result_name': 'analysis_results.json', 'result_mimetype': 'application/json', 'analysis_id': analysis_id}
+    return start_job('analyze', analyze)
+
+@app.route('/shape_analyzer/results/<analysis_id>/<shape_key>')
+@login_required
+def analysis_handles(analysis_id, shape_key):
+    """保存した解析結果の検出図形のハンドルを offset / limit でページ分けして返す"""
+    analysis = get_analysis_result(analysis_id)
+    if not analysis or shape_key not in json.loads(analysis.summary): abort(404)
+    offset, limit = max(request.args.get('offset', 0, type=int), 0), request.args.get('limit', PAGE_SIZE, type=int)
+    total, handles = handle_page(analysis.result_path, shape_key, offset, limit)
+    return jsonify({'shape_key': shape_key, 'total': total, 'offset': offset, 'handles': handles})
+
+def generate_analysis_output(filepath, analysis, kind, shape_colors):
+    """解析した図面の検出図形に色を付けた Excel / DXF を (バイト列の反復子, mimetype, 拡張子) で返す。Excel は書きながら返す"""
+    table = load_drawing_table(filepath, analysis.source_hash)
+    with metrics.stage('export.colors'): colors = result_colors(table, analysis.result_path, shape_colors)
+    if kind == 'dxf':
+        text = io.StringIO()
+        with metrics.stage('export.dxf'): write_table_dxf(table, text, colors)
+        return [text.getvalue().encode('utf-8')], 'application/dxf', '.dxf'
+    return timed_chunks('export.excel', iter_xlsx(table_sheets(table, colors))), XLSX_MIMETYPE, '.xlsx'
+def timed_chunks(name, chunks):
+    """バイト列の反復子をそのまま返し、全体を返し終えるまでの時間を metrics の name の段階として記録する"""
+    with metrics.stage(name): yield from chunks
+def download_response(chunks, mimetype, filename):
+    """バイト列の反復子を添付ファイルとして返す (長さを付けないので chunked で送られ、書けた分から届く)"""
+    return Response(chunks, mimetype=mimetype, headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"})
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id): return jsonify(job_status_dict(get_job_or_404(job_id)))
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    job = get_job_or_404(job_id)
+    if job.status != JOB_DONE or not job.result_path or not os.path.exists(job.result_path): return jsonify(job_status_dict(job)), 409
+    return send_file(job.result_path, mimetype=job.result_mimetype, as_attachment=True, download_name=job.result_name)
+
+@app.route('/drawing_cache')
+@login_required
+def drawing_cache_stats(): return jsonify(drawing_cache.stats())
+
+def profiling_requested(): return app.config['ALLOW_PROFILING'] and bool(request.form.get('profile'))
+
+@app.route('/metrics')
+@login_required
+def metrics_snapshot(): return jsonify(metrics.snapshot())
+
+@app.route('/metrics/reset', methods=['POST'])
+@login_required
+def reset_metrics(): metrics.reset(); return jsonify(metrics.snapshot())
+
+@app.route('/metrics/profiles/<name>')
+@login_required
+def download_profile(name):
+    if not app.config['ALLOW_PROFILING']: abort(404)
+    path = os.path.join(app.config['PROFILE_FOLDER'], secure_filename(name))
+    if not os.path.exists(path): abort(404)
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/drawing_cache/clear', methods=['POST'])
+@login_required
+def clear_drawing_cache():
+    drawing_cache.clear(); flash('解析キャッシュを削除しました。')
+    return redirect(url_for('shape_analyzer'))
 # ==============================================================================
 # === 機能②: テキスト探索と明細書作成 ==========================================
 # ==============================================================================
@@ -188,16 +471,14 @@ def create_project():
     file = request.files['dxf_file']
     filename = secure_filename(file.filename)
     dxf_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{current_user.id}_{project_name.replace(' ','_')}_{filename}")
-    file.save(dxf_path)
+    content_hash = save_upload(file, dxf_path)
     try:
-        doc = ezdxf.readfile(dxf_path)
-        excel_filename = f"converted_{os.path.splitext(filename)[0]}.xlsx"
-        excel_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{current_user.id}_{project_name.replace(' ','_')}_{excel_filename}")
-        with pd.ExcelWriter(excel_path) as writer:
-            for name in ['line', 'circle', 'arc', 'text']:
-                entities = list(doc.query(name.upper()))
-                if entities: pd.DataFrame([e.dxfattribs() for e in entities]).to_excel(writer, sheet_name=name, index=False)
-        new_project = Project(name=project_name, author=current_user, original_dxf_path=dxf_path, converted_excel_path=excel_path)
+        table = load_drawing_table(dxf_path, content_hash)
+        store_filename = f"entities_{os.path.splitext(filename)[0]}.npz"
+        store_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{current_user.id}_{project_name.replace(' ','_')}_{store_filename}")
+        table.save(store_path)
+        TextIndex.from_table(table).save(text_index_path(store_path))
+        new_project = Project(name=project_name, author=current_user, original_dxf_path=dxf_path, entity_store_path=store_path, source_hash=content_hash)
         db.session.add(new_project); db.session.commit()
         flash(f'プロジェクト「{project_name}」を作成しました。')
         return redirect(url_for('editor', project_id=new_project.id))
@@ -213,6 +494,13 @@ def delete_project(project_id):
     try:
         if project.original_dxf_path and os.path.exists(project.original_dxf_path): os.remove(project.original_dxf_path)
         if project.converted_excel_path and os.path.exists(project.converted_excel_path): os.remove(project.converted_excel_path)
+        if project.entity_store_path:
+            for path in (project.entity_store_path, text_index_path(project.entity_store_path)):
+                if os.path.exists(path): os.remove(path)
+        SearchResult.query.filter_by(project_id=project.id).delete()
+        for job in Job.query.filter_by(project_id=project.id).all():
+            if job.result_path and os.path.exists(job.result_path): os.remove(job.result_path)
+            db.session.delete(job)
     except Exception as e: flash(f"ファイルの削除中にエラー: {e}")
     db.session.delete(project); db.session.commit()
     flash(f'プロジェクト「{project.name}」を削除しました。')
@@ -223,7 +511,7 @@ def delete_project(project_id):
 def editor(project_id):
     project = get_project_or_404(project_id)
     if not project: return "アクセス権がありません", 403
-    items_from_db = project.items.order_by(ReportItem.order).all()
+    items_from_db = project_items(project).all()
     return render_template('editor.html', project=project, items=items_from_db)
 
 @app.route('/editor/<int:project_id>/add_item', methods=['POST'])
@@ -232,26 +520,14 @@ def add_item(project_id):
     project = get_project_or_404(project_id)
     if not project: return "アクセス権がありません", 403
     try:
-        xls = pd.ExcelFile(project.converted_excel_path)
+        table = load_project_table(project)
         item_type, hinmei, hinshitsu, tani, color = request.form.get('item_type'), request.form['hinmei'], request.form['hinshitsu'], request.form['tani'], int(request.form.get('color', 1))
-        count, search_params = 0, {}
-        if item_type == 'text_search':
-            query = request.form['search_query']
-            search_params = {'query': query}
-            if 'text' in xls.sheet_names:
-                df = pd.read_excel(xls, sheet_name='text')
-                normalized_query = mojimoji.zen_to_han(query, kana=False)
-                search_series = df['text'].astype(str).apply(lambda x: mojimoji.zen_to_han(x, kana=False))
-                count = search_series.str.contains(normalized_query, case=False, na=False).sum()
-        elif item_type == 'shape_search':
-            target = request.form['shape_target']
-            search_params = {'shape': target}
-            if target == 'vehicle' and 'arc' in xls.sheet_names: count, _ = find_vehicle_lights(pd.read_excel(xls, sheet_name='arc'))
-            elif target == 'pedestrian' and 'line' in xls.sheet_names: count, _ = find_pedestrian_lights(pd.read_excel(xls, sheet_name='line'))
-
-        last_item = project.items.order_by(ReportItem.order.desc()).first()
-        new_order = (last_item.order + 1) if last_item else 0
-        new_item = ReportItem(project_id=project.id, order=new_order, item_type=item_type, search_params=json.dumps(search_params), hinmei=hinmei, hinshitsu=hinshitsu, suryo=int(count), tani=tani, color=color)
+        search_params = {}
+        if item_type == 'text_search': search_params = {'query': request.form['search_query']}
+        elif item_type == 'shape_search': search_params = {'shape': request.form['shape_target']}
+        count, _ = project_searcher(project, table)(item_type, search_params)
+
+        new_item = ReportItem(project_id=project.id, order=next_item_order(project.id), item_type=item_type, search_params=json.dumps(search_params), hinmei=hinmei, hinshitsu=hinshitsu, suryo=int(count), tani=tani, color=color)
         db.session.add(new_item); db.session.commit()
     except Exception as e: flash(f"項目追加中にエラー: {e}"); traceback.print_exc()
     return redirect(url_for('editor', project_id=project.id))
@@ -261,9 +537,7 @@ def add_item(project_id):
 def add_subtotal(project_id):
     project = get_project_or_404(project_id)
     if not project: return "アクセス権がありません", 403
-    last_item = project.items.order_by(ReportItem.order.desc()).first()
-    new_order = (last_item.order + 1) if last_item else 0
-    new_item = ReportItem(project_id=project.id, order=new_order, item_type='subtotal', hinmei='計')
+    new_item = ReportItem(project_id=project.id, order=next_item_order(project.id), item_type='subtotal', hinmei='計')
     db.session.add(new_item); db.session.commit()
     return redirect(url_for('editor', project_id=project_id))
 
@@ -274,12 +548,7 @@ def update_all(project_id):
     if not project: return "アクセス権がありません", 403
     try:
         project.kouji_basho, project.gokei_kingaku, project.page_number = request.form.get('kouji_basho'), request.form.get('gokei_kingaku'), request.form.get('page_number')
-        items_to_update = project.items.order_by(ReportItem.order).all()
-        for i, item in enumerate(items_to_update):
-            item.hinmei = request.form.get(f'hinmei_{i}')
-            item.color = int(request.form.get(f'color_{i}', 1))
-            if item.item_type != 'subtotal':
-                item.hinshitsu = request.form.get(f'hinshitsu_{i}'); item.tani = request.form.get(f'tani_{i}')
+        update_items_from_form(project.id, request.form)
         db.session.commit()
         flash("ヘッダーとリストを更新しました。")
     except Exception as e: flash(f"更新中にエラー: {e}"); traceback.print_exc()
@@ -290,12 +559,12 @@ def update_all(project_id):
 def move_item(project_id, item_id, direction):
     project = get_project_or_404(project_id)
     if not project: return "アクセス権がありません", 403
-    items = list(project.items.order_by(ReportItem.order).all())
-    try: idx = next(i for i, item in enumerate(items) if item.id == item_id)
-    except StopIteration: return "項目が見つかりません", 404
-    if direction == 'up' and idx > 0: items[idx], items[idx - 1] = items[idx - 1], items[idx]
-    elif direction == 'down' and idx < len(items) - 1: items[idx], items[idx + 1] = items[idx + 1], items[idx]
-    for i, item in enumerate(items): item.order = i
+    item = ReportItem.query.filter_by(id=item_id, project_id=project.id).first()
+    if not item: return "項目が見つかりません", 404
+    neighbor = adjacent_item(item, direction)
+    if neighbor is not None and neighbor.order == item.order:  # キーが同じで入れ替えられないので振り直す
+        rebalance_items(project.id); neighbor = adjacent_item(item, direction)
+    if neighbor is not None: item.order, neighbor.order = neighbor.order, item.order
     db.session.commit()
     return redirect(url_for('editor', project_id=project_id))
 
@@ -308,42 +577,24 @@ def delete_item(project_id, item_id):
     db.session.delete(item); db.session.commit()
     return redirect(url_for('editor', project_id=project_id))
 
-def generate_modified_excel(project, items):
-    all_sheets = pd.read_excel(project.converted_excel_path, sheet_name=None)
-    for sheet_name in all_sheets:
-        if 'color' not in all_sheets[sheet_name].columns: all_sheets[sheet_name]['color'] = 256
-    for item in items:
-        params = json.loads(item.search_params) if item.search_params else {}
-        if item.item_type == 'text_search':
-            normalized_query = mojimoji.zen_to_han(params.get('query', ''), kana=False)
-            search_series = all_sheets['text']['text'].astype(str).apply(lambda x: mojimoji.zen_to_han(x, kana=False))
-            all_sheets['text'].loc[search_series.str.contains(normalized_query, case=False, na=False), 'color'] = item.color
-        elif item.item_type == 'shape_search':
-            shape = params.get('shape')
-            if shape == 'vehicle' and 'arc' in all_sheets:
-                _, indices = find_vehicle_lights(all_sheets['arc']); all_sheets['arc'].loc[indices, 'color'] = item.color
-            elif shape == 'pedestrian' and 'line' in all_sheets:
-                _, indices = find_pedestrian_lights(all_sheets['line']); all_sheets['line'].loc[indices, 'color'] = item.color
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        for sheet_name, df_sheet in all_sheets.items(): df_sheet.to_excel(writer, index=False, sheet_name=sheet_name)
-    output.seek(0)
-    return output
+def generate_modified_excel(project, items, progress=None):
+    """明細項目の色を付けた Excel を、書き出しながら返すバイト列の反復子で返す (色の割り当てまではここで済ませる)"""
+    with metrics.stage('project.load'): table = load_project_table(project)
+    with metrics.stage('export.colors'): colors = item_colors(table, items, project_searcher(project, table))
+    if progress: progress(0.2, 'Excelを書き出しています')
+    return timed_chunks('export.excel', iter_xlsx(table_sheets(table, colors)))
 
 @app.route('/editor/<int:project_id>/generate', methods=['POST'])
 @login_required
 def generate(project_id):
     project = get_project_or_404(project_id)
     if not project: return "アクセス権がありません", 403
-    items = project.items.order_by(ReportItem.order).all()
+    items = project_items(project).all()
     if not items: return "内訳リストが空です。", 400
     if 'report' in request.form: return render_template('report.html', project=project, report_items=items)
     elif 'excel' in request.form:
         try:
-            excel_output = generate_modified_excel(project, items)
-            filename = f"modified_{project.name}.xlsx"
-            encoded_filename = quote(filename)
-            return make_response(excel_output.getvalue(), 200, {'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'Content-Disposition': f"attachment; filename*=UTF-8''{encoded_filename}"})
+            return download_response(generate_modified_excel(project, items), XLSX_MIMETYPE, f"modified_{project.name}.xlsx")
         except Exception as e: traceback.print_exc(); return f"Excelファイル生成中にエラー: {e}"
     return "無効なリクエスト", 400
 
@@ -353,27 +604,59 @@ def generate_dxf(project_id):
     project = get_project_or_404(project_id)
     if not project: return "アクセス権がありません", 403
     try:
-        items = project.items.order_by(ReportItem.order).all()
-        excel_output = generate_modified_excel(project, items)
-        xls_from_mem = pd.ExcelFile(excel_output)
-        doc = ezdxf.new(dxfversion="R2010")
-        msp = doc.modelspace()
-        for sheet_name in ['line', 'circle', 'arc', 'text']:
-            if sheet_name in xls_from_mem.sheet_names:
-                df = pd.read_excel(xls_from_mem, sheet_name=sheet_name)
-                for _, row in df.iterrows(): add_entity_to_dxf(msp, sheet_name, row)
-        
-        dxf_output = io.StringIO()
-        doc.write(dxf_output); dxf_output.seek(0)
+        items = project_items(project).all()
+        dxf_output, stats = generate_modified_dxf(project, items)
         filename = f"recreated_{project.name}.dxf"
         encoded_filename = quote(filename)
         response = make_response(dxf_output.getvalue())
         response.headers['Content-Type'] = 'application/dxf'
         response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        response.headers['X-Skipped-Entities'] = str(stats.skipped_total)
         return response
     except Exception as e: traceback.print_exc(); return f"DXFファイル生成中にエラー: {e}"
 
+def generate_modified_dxf(project, items, progress=None):
+    """色を変更したDXFを (StringIO, WriteStats) で返す。書き出せなかった図形の件数は WriteStats に残る"""
+    with metrics.stage('project.load'): table = load_project_table(project)
+    with metrics.stage('export.colors'): colors = item_colors(table, items, project_searcher(project, table))
+    dxf_output = io.StringIO()
+    with metrics.stage('export.dxf'): stats = write_table_dxf(table, dxf_output, colors, progress)
+    dxf_output.seek(0)
+    return dxf_output, stats
+
+def export_excel(project, items, progress): return generate_modified_excel(project, items, progress), None
+def export_dxf(project, items, progress):
+    dxf_output, stats = generate_modified_dxf(project, items, progress)
+    return dxf_output.getvalue(), (f"{stats.written}件を書き出し、{stats.skipped_total}件を除外しました: {stats.skipped}" if stats.skipped else None)
+
+# 明細書の出力ジョブ: 種類 -> (生成関数 (データ (バイト列の反復子でもよい), 完了メッセージ) を返す, 拡張子, MIMEタイプ, ファイル名の接頭辞)
+EXPORT_JOBS = {
+    'excel': (export_excel, '.xlsx', XLSX_MIMETYPE, 'modified_'),
+    'dxf': (export_dxf, '.dxf', 'application/dxf', 'recreated_'),
+}
+
+@app.route('/editor/<int:project_id>/jobs/<kind>', methods=['POST'])
+@login_required
+def start_export_job(project_id, kind):
+    project = get_project_or_404(project_id)
+    if not project: return "アクセス権がありません", 403
+    if kind not in EXPORT_JOBS: abort(404)
+    if not project.items.count(): return jsonify({'error': '内訳リストが空です。'}), 400
+    generate_fn, ext, mimetype, prefix = EXPORT_JOBS[kind]
+    def export(job_id, progress):
+        with app.app_context():
+            project = db.session.get(Project, project_id)
+            items = project_items(project).all()
+            data, message = generate_fn(project, items, progress)
+            path = job_result_path(app.config['JOB_FOLDER'], job_id, ext)
+            with open(path, 'wb') as f:
+                for chunk in ([data] if isinstance(data, (str, bytes)) else data): f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            return {'result_path': path, 'result_name': f"{prefix}{project.name}{ext}", 'result_mimetype': mimetype, 'message': message}
+    return start_job(kind, export, project_id=project_id)
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+        fail_interrupted_jobs()
     app.run(host='0.0.0.0', port=5001, debug=True)
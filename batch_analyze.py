@@ -0,0 +1,139 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from drawing_cache import sha256_file
+from dxf_blocks import add_block_counts, load_block_shapes, split_block_shapes
+from dxf_stream import read_entity_table
+from revision_matcher import analyze_revision
+from shape_definitions import SHAPE_DEFINITIONS
+
+# --- DXFの一括解析 (コマンドライン) ---
+# ディレクトリ以下の DXF を複数プロセスで解析し、終わった順に1ファイル1行の JSONL (と CSV) に追記する。
+# 画面の図形解析と同じ SHAPE_DEFINITIONS / check_* 関数 (revision_matcher.analyze_revision) を使う。
+# JSONL に記録済みの内容ハッシュ (SHA-256) のファイルは読み飛ばすので、中断しても同じコマンドで再開できる。
+# 同じ内容のファイルが複数あれば、最初の1つだけを解析する。
+#
+#     python batch_analyze.py 図面のディレクトリ -o results.jsonl [--csv results.csv] [--workers 8] [--shapes key,...] [--block-shapes blocks.json]
+
+STATUS_OK, STATUS_ERROR = 'ok', 'error'
+CSV_FIELDS = ['path', 'sha256', 'status', 'entities', 'seconds', 'error']
+
+def find_dxf_files(root):
+    """root 以下の .dxf ファイルのパスをパス順に返す"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        found += [os.path.join(dirpath, name) for name in sorted(filenames) if name.lower().endswith('.dxf')]
+    return found
+
+def load_done(path, retry_errors=False):
+    """記録済みの JSONL から解析済みの内容ハッシュを集める。途中で切れた行は無視する"""
+    done = set()
+    if not os.path.exists(path): return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try: record = json.loads(line)
+            except ValueError: continue
+            if record.get('status') == STATUS_OK or not retry_errors: done.add(record.get('sha256'))
+    return done
+
+def analyze_file(path, content_hash, shape_keys, with_handles=False, block_shapes=None):
+    """1ファイルを解析して記録する辞書を返す (ワーカープロセスで実行)。block_shapes はブロック名 -> 図形キーの対応表"""
+    record = {'path': path, 'sha256': content_hash}
+    t0 = time.perf_counter()
+    try:
+        table, block_handles = split_block_shapes(read_entity_table(path), block_shapes or {}, shape_keys)
+        results, _, _ = analyze_revision(table, shape_keys)
+        add_block_counts(results, block_handles)
+        record.update({'status': STATUS_OK, 'entities': len(table), 'counts': {k: r['count'] for k, r in results.items()}})
+        if with_handles: record['handles'] = {k: r['handles'] for k, r in results.items()}
+    except Exception as e:  # 壊れた図面があっても残りの解析は続ける
+        record.update({'status': STATUS_ERROR, 'entities': 0, 'error': f"{type(e).__name__}: {e}"})
+    record['seconds'] = round(time.perf_counter() - t0, 4)
+    return record
+
+class ResultWriter:
+    """記録を JSONL (と CSV) に1件ずつ追記する"""
+
+    def __init__(self, jsonl_path, csv_path, shape_keys):
+        self.jsonl = open(jsonl_path, 'a', encoding='utf-8')
+        self.csv_file = self.csv = None
+        if csv_path:
+            new = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+            self.csv_file = open(csv_path, 'a', encoding='utf-8', newline='')
+            self.csv = csv.DictWriter(self.csv_file, fieldnames=CSV_FIELDS + shape_keys, extrasaction='ignore')
+            if new: self.csv.writeheader()
+
+    def write(self, record):
+        self.jsonl.write(json.dumps(record, ensure_ascii=False) + '\n'); self.jsonl.flush()
+        if self.csv:
+            self.csv.writerow({**record, **record.get('counts', {})}); self.csv_file.flush()
+
+    def close(self):
+        self.jsonl.close()
+        if self.csv_file: self.csv_file.close()
+
+def run_batch(root, jsonl_path, csv_path=None, shape_keys=None, workers=None, retry_errors=False, with_handles=False, block_shapes=None, log=print):
+    """root 以下の DXF を解析して記録し、集計 (ファイル数・図形数・時間) を返す"""
+    shape_keys = list(shape_keys or SHAPE_DEFINITIONS)
+    workers = workers or os.cpu_count() or 1
+    done = load_done(jsonl_path, retry_errors)
+    files = find_dxf_files(root)
+    summary = {'files': len(files), 'analyzed': 0, 'skipped': 0, 'errors': 0, 'entities': 0}
+    writer = ResultWriter(jsonl_path, csv_path, shape_keys)
+    t0 = time.perf_counter()
+    pending = set()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            def collect(block):
+                finished = wait(pending, return_when=FIRST_COMPLETED).done if block else [f for f in pending if f.done()]
+                for future in finished:
+                    pending.discard(future)
+                    record = future.result()
+                    writer.write(record)
+                    summary['analyzed'] += 1; summary['entities'] += record['entities']
+                    if record['status'] == STATUS_ERROR: summary['errors'] += 1; log(f"error: {record['path']}: {record['error']}")
+            for path in files:
+                content_hash = sha256_file(path)  # 解析済みかどうかは内容で判断する (名前の変更・移動は再解析しない)
+                if content_hash in done: summary['skipped'] += 1; continue
+                done.add(content_hash)
+                pending.add(executor.submit(analyze_file, path, content_hash, shape_keys, with_handles, block_shapes))
+                while len(pending) >= workers * 2: collect(True)
+                collect(False)
+            while pending: collect(True)
+    finally:
+        writer.close()
+    summary['seconds'] = time.perf_counter() - t0
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ディレクトリ以下のDXFを一括で図形解析し、JSONL/CSVに記録する')
+    parser.add_argument('root', help='DXFファイルを探すディレクトリ')
+    parser.add_argument('-o', '--output', required=True, help='結果を追記する JSONL ファイル (再開時はここから解析済みのファイルを判断する)')
+    parser.add_argument('--csv', help='ファイルごとの検出数を追記する CSV ファイル')
+    parser.add_argument('--shapes', help='探索する図形キーのカンマ区切り (既定: すべて)')
+    parser.add_argument('--workers', type=int, help='同時に解析するプロセス数 (既定: CPU数)')
+    parser.add_argument('--retry-errors', action='store_true', help='前回エラーになったファイルも解析し直す')
+    parser.add_argument('--handles', action='store_true', help='検出した図形のハンドルも JSONL に記録する')
+    parser.add_argument('--block-shapes', help='ブロック名 -> 図形キーの対応表 (JSON)。対応付けたブロックの参照は形状を判定せずに数える')
+    args = parser.parse_args(argv)
+    shape_keys = args.shapes.split(',') if args.shapes else None
+    unknown = [k for k in shape_keys or [] if k not in SHAPE_DEFINITIONS]
+    if unknown: parser.error(f"未知の図形キー: {', '.join(unknown)}")
+    try: block_shapes = load_block_shapes(args.block_shapes, SHAPE_DEFINITIONS) if args.block_shapes else None
+    except (OSError, ValueError) as e: parser.error(str(e))
+    summary = run_batch(args.root, args.output, args.csv, shape_keys, args.workers, args.retry_errors, args.handles, block_shapes)
+    minutes = summary['seconds'] / 60
+    print(f"{summary['analyzed']} 件を解析 (スキップ {summary['skipped']} 件, エラー {summary['errors']} 件) / {summary['seconds']:.1f} 秒")
+    if summary['analyzed'] and summary['seconds'] > 0:
+        print(f"スループット: {summary['analyzed'] / minutes:.1f} ファイル/分, {summary['entities'] / summary['seconds']:.0f} 図形/秒")
+    return 1 if summary['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""全図形定義を選択した場合の解析時間: 図形ごとの近傍検索と共有近傍検索 (shared_neighbor_sets) の比較
+
+    python benchmarks/bench_all_shapes.py [クラスタ数 ...]
+
+図形ごとに近傍検索する従来の方式と、アンカー種別ごとに最大半径で一度だけ検索して
+距離で絞り込む方式で、検索回数 (アンカー数の合計) と時間を比べ、結果が一致することを確認する。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import build_index, match_shape, neighbor_sets, plan_shapes, shared_neighbor_sets
+from synthetic import random_clusters
+
+DEFAULT_SIZES = [5_000, 20_000]
+
+def per_shape(table, index, shape_keys):
+    t_query = 0.0
+    results = {}
+    for key in shape_keys:
+        t0 = time.perf_counter(); ns = neighbor_sets(SHAPE_DEFINITIONS[key], table, index); t_query += time.perf_counter() - t0
+        count, gids = match_shape(key, table, index, ns=ns)
+        results[key] = (count, gids.tolist())
+    return results, t_query
+
+def fused(table, index, shape_keys):
+    t0 = time.perf_counter(); neighbors = shared_neighbor_sets(shape_keys, table, index); t_query = time.perf_counter() - t0
+    results = {}
+    for key in shape_keys:
+        count, gids = match_shape(key, table, index, ns=neighbors[key])
+        results[key] = (count, gids.tolist())
+    return results, t_query
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    shape_keys = list(SHAPE_DEFINITIONS)
+    print(f"{'entities':>9} {'queries old':>12} {'new':>8} {'query old[s]':>13} {'new[s]':>8} {'total old[s]':>13} {'new[s]':>8}")
+    for n_clusters in sizes:
+        table = random_clusters(n_clusters, rng)
+        index = build_index(table)
+        queries_old = sum(table.counts[SHAPE_DEFINITIONS[k]['anchor_type']] for k in shape_keys)
+        queries_new = sum(table.counts[t] for t in plan_shapes(shape_keys))
+        t0 = time.perf_counter(); old, t_query_old = per_shape(table, index, shape_keys); t_old = time.perf_counter() - t0
+        t0 = time.perf_counter(); new, t_query_new = fused(table, index, shape_keys); t_new = time.perf_counter() - t0
+        assert old == new
+        print(f"{len(table):>9} {queries_old:>12} {queries_new:>8} {t_query_old:>13.3f} {t_query_new:>8.3f} {t_old:>13.3f} {t_new:>8.3f}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,42 @@
+"""図形チェックの一括判定 (shape_batch.py) と check_* 関数の比較
+
+    python benchmarks/bench_batch_checks.py [クラスタ数 ...]
+
+一括判定を持つ図形定義ごとに、全アンカーの判定結果が check_* 関数と一致することを
+確認したうえで、判定にかかる時間を比較する。近傍検索の時間は含まない。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shape_batch import BATCH_CHECKS
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import build_index, evaluate_anchors, neighbor_sets
+from synthetic import random_clusters
+
+DEFAULT_SIZES = [2_000, 10_000]
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    for n_clusters in sizes:
+        table = random_clusters(n_clusters, rng)
+        index = build_index(table)
+        print(f"clusters={n_clusters} entities={len(table)}")
+        print(f"  {'shape':<24} {'anchors':>8} {'matched':>8} {'scalar[s]':>10} {'batch[s]':>9} {'speedup':>8}")
+        total_scalar = total_batch = 0.0
+        for key, definition in SHAPE_DEFINITIONS.items():
+            if definition['check_function'] not in BATCH_CHECKS: continue
+            ns = neighbor_sets(definition, table, index)
+            t0 = time.perf_counter(); scalar = evaluate_anchors(definition, table, ns, use_batch=False); t_scalar = time.perf_counter() - t0
+            t0 = time.perf_counter(); batch = evaluate_anchors(definition, table, ns, use_batch=True); t_batch = time.perf_counter() - t0
+            mismatch = np.nonzero(scalar != batch)[0]
+            assert not len(mismatch), f"{key}: batch and scalar disagree at anchors {ns.anchors[mismatch[:10]]}"
+            total_scalar += t_scalar; total_batch += t_batch
+            print(f"  {key:<24} {len(ns):>8} {int(batch.sum()):>8} {t_scalar:>10.3f} {t_batch:>9.4f} {t_scalar / t_batch:>7.0f}x")
+        print(f"  {'total':<24} {'':>8} {'':>8} {total_scalar:>10.3f} {total_batch:>9.4f} {total_scalar / total_batch:>7.0f}x")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
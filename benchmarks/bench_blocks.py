@@ -0,0 +1,112 @@
+"""ブロック参照 (INSERT) の展開: 参照ごとの展開 (ezdxf の virtual_entities) と、ブロック定義ごとのキャッシュと一括変換 (dxf_blocks.py) の比較
+
+    python benchmarks/bench_blocks.py [INSERT数 ...]
+
+図形定義ごとの既知の図形 (synthetic.SHAPE_TEMPLATES) をブロック定義にし (柱の円は入れ子のブロック)、
+ランダムな挿入点・回転・尺度 (一部は鏡像) で参照した図面をDXFに書き出して以下を比べる。
+- 参照ごと: ezdxf.readfile() で読み、INSERT ごとに virtual_entities() を入れ子まで展開して EntityTable にする
+- 一括: read_entity_table() (逐次読み込み)。うちブロックの展開 (dxf.blocks) の時間も表示する
+両者の図形の座標・半径・角度が一致することを確認する (ezdxf の鏡像は押し出し方向の反転なので WCS に直して比べる)。
+あわせて全図形定義の解析を、展開した図形の形状の判定だけで数える場合と、ブロック名と図形キーの対応表で
+数える場合 (split_block_shapes) とで比べる。対応表で数えた数は配置した参照の数と一致する。
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxf_blocks import add_block_counts, split_block_shapes
+from dxf_stream import read_entity_table
+from entity_store import EntityTableBuilder
+from metrics import metrics
+from revision_matcher import analyze_revision
+from shape_definitions import SHAPE_DEFINITIONS
+from synthetic import SHAPE_TEMPLATES
+
+DEFAULT_SIZES = [10_000, 30_000]
+POLE_BLOCK = 'POLE_CIRCLE'  # 柱の円 (半径1) の入れ子のブロック
+
+def write_drawing(n_inserts, path, rng):
+    """図形定義ごとのブロックを n_inserts 件参照した図面を書き出し、参照したブロック名のリストを返す"""
+    import ezdxf
+    doc = ezdxf.new(dxfversion='R2010')
+    doc.blocks.new(POLE_BLOCK).add_circle((0, 0), 1.0, dxfattribs={'color': 0})
+    for key, template in SHAPE_TEMPLATES.items():
+        block = doc.blocks.new(key.upper())
+        for etype, items in template(1.0).items():
+            for a, b in items:
+                if etype == 'LINE': block.add_line(a, b)
+                elif etype == 'CIRCLE' and b == 1.0 and tuple(a) == (0, 0): block.add_blockref(POLE_BLOCK, a)
+                elif etype == 'CIRCLE': block.add_circle(a, b)
+                else: block.add_arc(a, b, 0, 180)
+    msp = doc.modelspace()
+    names = [k.upper() for k in rng.choice(list(SHAPE_TEMPLATES), n_inserts)]
+    side = int(np.ceil(np.sqrt(n_inserts)))
+    for i, name in enumerate(names):
+        scale = rng.uniform(0.8, 1.2)
+        msp.add_blockref(name, (i % side * 50.0, i // side * 50.0), dxfattribs={
+            'xscale': -scale if i % 10 == 0 else scale, 'yscale': scale, 'rotation': rng.uniform(0, 360) if i % 2 else 0.0, 'color': 1 + i % 7})
+    doc.saveas(path)
+    return names
+
+def per_reference(path):
+    """ezdxf で図面全体を読み、INSERT ごとに図形を展開して EntityTable を作る"""
+    import ezdxf
+    def explode(insert):
+        for e in insert.virtual_entities():
+            if e.dxftype() == 'INSERT': yield from explode(e)
+            else: yield e
+    builder = EntityTableBuilder()
+    for e in ezdxf.readfile(path).modelspace():
+        for v in (explode(e) if e.dxftype() == 'INSERT' else [e]):
+            attribs = v.dxf.all_existing_dxf_attribs()
+            ocs = v.ocs()
+            for name in ('center', 'insert', 'start', 'end'):
+                if name in attribs and v.dxftype() != 'LINE': attribs[name] = ocs.to_wcs(attribs[name])
+            if v.dxftype() == 'ARC' and v.dxf.extrusion.z < 0:  # 押し出し方向が -Z の円弧は X を反転した向きになる
+                attribs['start_angle'], attribs['end_angle'] = 180 - v.dxf.end_angle, 180 - v.dxf.start_angle
+            builder.add_attribs(v.dxftype(), attribs)
+    return builder.build()
+
+def geometry(table):
+    """種別ごとの幾何の値を行単位で並べ替えた配列 (展開の順序によらず比べるため)"""
+    result = {}
+    for etype, cols in [('LINE', ['start', 'end']), ('CIRCLE', ['center', 'radius']), ('ARC', ['center', 'radius', 'start_angle', 'end_angle'])]:
+        values = np.column_stack([table.columns[etype][c].reshape(table.counts[etype], -1) for c in cols])
+        values = np.round(values, 6)
+        if etype == 'ARC': values[:, -2:] %= 360.0
+        result[etype] = values[np.lexsort(values.T[::-1])]
+    return result
+
+def main(sizes):
+    block_shapes = {k.upper(): k for k in SHAPE_TEMPLATES if k in SHAPE_DEFINITIONS}
+    shape_keys = list(SHAPE_DEFINITIONS)
+    print(f"{'inserts':>8} {'entities':>9} {'per-ref[s]':>11} {'stream[s]':>10} {'blocks[s]':>10} {'speedup':>8} "
+          f"{'shapes[s]':>10} {'by name[s]':>11} {'found':>7} {'by name':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            path = os.path.join(workdir, f"blocks_{n}.dxf")
+            names = write_drawing(n, path, np.random.default_rng(0))
+            t0 = time.perf_counter(); reference = per_reference(path); t_ref = time.perf_counter() - t0
+            with metrics.capture() as captured:
+                t0 = time.perf_counter(); table = read_entity_table(path); t_stream = time.perf_counter() - t0
+            t_blocks = captured.snapshot()['stages']['dxf.blocks']['total_ms'] / 1000
+            expected, actual = geometry(reference), geometry(table)
+            for etype in expected:
+                assert expected[etype].shape == actual[etype].shape and np.allclose(expected[etype], actual[etype], atol=1e-5), etype
+            t0 = time.perf_counter(); results, _, _ = analyze_revision(table, shape_keys); t_shapes = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            rest, found = split_block_shapes(table, block_shapes, shape_keys)
+            by_name, _, _ = analyze_revision(rest, shape_keys)
+            add_block_counts(by_name, found)
+            t_by_name = time.perf_counter() - t0
+            for key in block_shapes.values(): assert by_name[key].get('block_count', 0) == names.count(key.upper()), key
+            detected, counted = sum(r['count'] for r in results.values()), sum(r['count'] for r in by_name.values())
+            print(f"{n:>8} {len(table):>9} {t_ref:>11.2f} {t_stream:>10.2f} {t_blocks:>10.3f} {t_ref / t_stream:>7.1f}x "
+                  f"{t_shapes:>10.2f} {t_by_name:>11.2f} {detected:>7} {counted:>8}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
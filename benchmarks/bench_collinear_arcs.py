@@ -0,0 +1,121 @@
+"""円弧の整列判定 (find_collinear_arcs) の旧実装との比較
+
+    python benchmarks/bench_collinear_arcs.py
+
+1. 少数の円弧をランダムに行へ配置し、旧実装 (全組み合わせ探索) と判定が矛盾しないことを確認する。
+   新実装は指定方向に並ぶグループだけを受け付けるため、
+   「新実装で見つかる → 旧実装でも見つかる」「旧実装のグループが指定方向 → 新実装でも見つかる」を確かめる。
+   軸から COLLINEAR_ANGLE 未満だけ傾いた等間隔の並び (間隔は半径の数倍〜数十倍) と別の行の円弧を混ぜた集合でも確かめる。
+2. 50〜200個の円弧からなる意地の悪い近傍集合で、最悪ケースの処理時間を比較する。
+   旧実装は組み合わせ数が上限を超えるサイズでは、1組あたりの時間から推定値 (~) を示す。
+"""
+import math
+import os
+import sys
+import time
+from itertools import combinations
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shape_definitions import COLLINEAR_ANGLE, angle_between, find_all_collinear_arcs, find_collinear_arcs, magnitude
+
+LEGACY_MAX_COMBINATIONS = 200_000
+
+def legacy_find_collinear_arcs(arcs, num, is_horizontal=True):
+    """変更前の全組み合わせ探索による実装"""
+    if len(arcs) < num: return None
+    radii = [a['radius'] for a in arcs if a['radius'] > 0]
+    if not radii: return None
+    base_r = np.median(radii)
+    similar_arcs = [a for a in arcs if abs(a['radius'] - base_r) < base_r * 0.1]
+    if len(similar_arcs) < num: return None
+    sort_key = 0 if is_horizontal else 1
+    for group in combinations(similar_arcs, num):
+        centers = sorted([arc['center'] for arc in group], key=lambda p: p[sort_key])
+        vectors = [centers[i+1] - centers[i] for i in range(num - 1)]
+        magnitudes = [magnitude(v) for v in vectors]
+        if any(m < 1e-6 for m in magnitudes): continue
+        if not all(0.9 < (magnitudes[i] / magnitudes[0]) < 1.1 for i in range(1, len(magnitudes))): continue
+        if not all(angle_between(vectors[i], vectors[0]) < 5 or angle_between(vectors[i], vectors[0]) > 175 for i in range(1, len(vectors))): continue
+        return group
+    return None
+
+def arc(x, y, r=1.0):
+    return {'entity': 'ARC', 'center': np.array([x, y, 0.0]), 'radius': r}
+
+def axis_aligned(group, is_horizontal):
+    axis = np.array([1.0, 0, 0]) if is_horizontal else np.array([0, 1.0, 0])
+    centers = sorted([a['center'] for a in group], key=lambda p: p[0 if is_horizontal else 1])
+    a = angle_between(centers[1] - centers[0], axis)
+    return a < 5 or a > 175
+
+def check_agreement(trials, rng):
+    found = 0
+    for _ in range(trials):
+        n, num, is_horizontal = rng.integers(3, 10), rng.integers(2, 4), rng.random() < 0.5
+        rows = rng.integers(0, 3, n).astype(float) * 3
+        xs = rng.integers(0, 8, n) * 2.2 + rng.normal(0, 0.05, n)
+        arcs = [arc(x, y, rng.choice([1.0, 1.0, 1.05, 1.3])) if is_horizontal else arc(y, x, rng.choice([1.0, 1.05, 1.3])) for x, y in zip(xs, rows + rng.normal(0, 0.05, n))]
+        new, old = find_collinear_arcs(arcs, num, is_horizontal), legacy_find_collinear_arcs(arcs, num, is_horizontal)
+        if new is not None: assert old is not None
+        if old is not None and axis_aligned(old, is_horizontal): assert new is not None
+        found += new is not None
+    print(f"agreement: {trials} random sets checked, {found} with groups")
+
+def check_tilted(rng):
+    """軸から傾いた等間隔の並びを、旧実装と同じく新実装でも見つけることを確認する"""
+    cases = 0
+    for tilt in np.arange(0.5, COLLINEAR_ANGLE, 0.5):
+        for spacing in (2.5, 5.0, 10.0, 20.0, 40.0):
+            for num in (3, 4):
+                for is_horizontal in (True, False):
+                    t = np.radians(tilt * rng.choice([-1, 1]))
+                    offset = rng.uniform(-100, 100, 2)
+                    row = [(offset[0] + k * spacing * np.cos(t), offset[1] + k * spacing * np.sin(t)) for k in range(num)]
+                    others = [(rng.uniform(-100, 100), rng.uniform(-100, 100)) for _ in range(5)]  # 別の行の円弧 (並びにならない)
+                    arcs = [arc(x, y) if is_horizontal else arc(y, x) for x, y in row + others]
+                    old = legacy_find_collinear_arcs(arcs, num, is_horizontal)
+                    assert old is not None and axis_aligned(old, is_horizontal)
+                    assert find_collinear_arcs(arcs, num, is_horizontal) is not None, (tilt, spacing, num, is_horizontal)
+                    assert len(find_all_collinear_arcs(arcs, num, is_horizontal)) >= 1, (tilt, spacing, num, is_horizontal)
+                    cases += 1
+    print(f"tilted rows: {cases} sets checked (tilt < {COLLINEAR_ANGLE} deg, spacing 2.5-40 r)")
+
+def adversarial_sets(n, rng):
+    """(名前, 円弧リスト) の一覧。有効なグループが無く、旧実装は全組み合わせを調べることになる
+
+    座標を 3^k で並べると、どの3点も間隔比が2以上になり等間隔の組ができない。
+    """
+    return [
+        ("exponential spacing, one row", [arc(3.0 ** k, 0.0) for k in range(n)]),
+        ("exponential spacing, jittered", [arc(3.0 ** k * rng.uniform(0.98, 1.02), rng.normal(0, 0.05)) for k in range(n)]),
+        ("mixed radii, one row", [arc(3.0 ** k, 0.0, 1.0 + 0.05 * (k % 3)) for k in range(n)]),
+    ]
+
+def timed(fn, *args):
+    t0 = time.perf_counter(); result = fn(*args); return result, time.perf_counter() - t0
+
+def main():
+    rng = np.random.default_rng(0)
+    check_agreement(2000, rng)
+    check_tilted(rng)
+    print(f"{'arcs':>5} {'case':<30} {'legacy[s]':>10} {'new[s]':>8} {'all groups':>11} {'all[s]':>8}")
+    per_combination = None
+    for n in (50, 100, 150, 200):
+        for name, arcs in adversarial_sets(n, rng):
+            n_comb = math.comb(n, 3)
+            if n_comb <= LEGACY_MAX_COMBINATIONS:
+                result, t_legacy = timed(legacy_find_collinear_arcs, arcs, 3)
+                assert result is None
+                per_combination = t_legacy / n_comb
+                legacy = f"{t_legacy:.3f}"
+            else:
+                legacy = f"~{per_combination * n_comb:.1f}"  # 組み合わせ数から推定
+            result, t_new = timed(find_collinear_arcs, arcs, 3)
+            assert result is None
+            groups, t_all = timed(find_all_collinear_arcs, arcs, 3)
+            print(f"{n:>5} {name:<30} {legacy:>10} {t_new:>8.4f} {len(groups):>11} {t_all:>8.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""解析キャッシュ (drawing_cache.py) の有無による解析時間の比較
+
+    python benchmarks/bench_drawing_cache.py [クラスタ数 ...]
+
+合成図面をDXFに書き出し、同じ図面を2回解析する。1回目 (cold) はDXFの読み込みと変換を行い、
+2回目 (warm) はキャッシュの .npz から読み込む。解析は全図形定義を選択した場合の時間。
+"""
+import os
+import sys
+import tempfile
+import time
+
+import ezdxf
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from drawing_cache import DrawingCache, sha256_file
+from entity_store import EntityTable
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import find_shapes
+from synthetic import random_clusters, write_dxf
+
+DEFAULT_SIZES = [1_000, 5_000, 20_000]
+
+def analyze(cache, path):
+    t0 = time.perf_counter()
+    key = sha256_file(path)
+    t_hash = time.perf_counter() - t0
+    table = cache.get_or_build(key, lambda: EntityTable.from_modelspace(ezdxf.readfile(path).modelspace()))
+    t_load = time.perf_counter() - t0 - t_hash
+    results = find_shapes(table, list(SHAPE_DEFINITIONS))
+    return results, t_hash, t_load, time.perf_counter() - t0
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    print(f"{'entities':>9} {'dxf[MB]':>8} {'npz[MB]':>8} {'cold load[s]':>13} {'warm load[s]':>13} {'hash[s]':>8} {'cold total[s]':>14} {'warm total[s]':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_clusters in sizes:
+            cache = DrawingCache(os.path.join(tmp, 'cache'), 1 << 34)
+            cache.clear()
+            path = os.path.join(tmp, f"synthetic_{n_clusters}.dxf")
+            write_dxf(random_clusters(n_clusters, rng), path)
+            cold, _, t_cold_load, t_cold = analyze(cache, path)
+            warm, t_hash, t_warm_load, t_warm = analyze(cache, path)
+            assert cold == warm and cache.hits == 1 and cache.misses == 1
+            n = len(cache.load(sha256_file(path)))
+            print(f"{n:>9} {os.path.getsize(path) / 2**20:>8.1f} {cache.stats()['bytes'] / 2**20:>8.1f} {t_cold_load:>13.3f} {t_warm_load:>13.4f} {t_hash:>8.4f} {t_cold:>14.3f} {t_warm:>14.3f}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
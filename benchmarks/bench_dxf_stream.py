@@ -0,0 +1,51 @@
+"""DXFの読み込み: ezdxf.readfile() と逐次読み込み (dxf_stream.py) のピークメモリと処理速度の比較
+
+    python benchmarks/bench_dxf_stream.py [図形数 ...]
+
+合成図面をDXFファイルに書き出し、それぞれの方式で EntityTable を作る処理を別プロセスで実行して
+ピークRSS (ru_maxrss) と時間を測る。子プロセスの起動だけの RSS も基準として表示する。
+ru_maxrss は fork 元の値を引き継ぐため、親プロセスは図面を持たず、図面の生成も子プロセスで行う。
+"""
+import os
+import subprocess
+import sys
+import tempfile
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+DEFAULT_SIZES = [50_000, 200_000, 500_000]
+
+# 子プロセスで実行する読み込み処理。最後に (図形数, 秒) を出力する
+LOADERS = {
+    'baseline': "import ezdxf, entity_store, dxf_stream",
+    'readfile': "import ezdxf; from entity_store import EntityTable; t0 = time.perf_counter(); table = EntityTable.from_modelspace(ezdxf.readfile(path).modelspace())",
+    'stream': "from dxf_stream import read_entity_table; t0 = time.perf_counter(); table = read_entity_table(path)",
+}
+
+def write_drawing(n, path):
+    code = f"import sys; sys.path[:0] = [{ROOT!r}, {BENCH_DIR!r}]; import numpy as np; from bench_entity_store import synthetic_modelspace; synthetic_modelspace({n}, np.random.default_rng(0)).doc.saveas({path!r})"
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+def run_loader(name, path):
+    """子プロセスで読み込み、(図形数, 秒, ピークRSS[MB]) を返す"""
+    code = f"import sys, time; sys.path.insert(0, {ROOT!r}); path = {path!r}; {LOADERS[name]}"
+    if name != 'baseline': code += "; print(len(table), time.perf_counter() - t0)"
+    script = f"{code}\nimport resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    out = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout.split()
+    rss_mb = int(out[-1]) / 1024  # Linux の ru_maxrss は KB
+    return (int(out[0]), float(out[1]), rss_mb) if name != 'baseline' else (0, 0.0, rss_mb)
+
+def main(sizes):
+    print(f"{'entities':>9} {'dxf[MB]':>8} {'base RSS[MB]':>13} {'readfile RSS':>13} {'stream RSS':>11} {'readfile[s]':>12} {'stream[s]':>10} {'readfile[ent/s]':>16} {'stream[ent/s]':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"synthetic_{n}.dxf")
+            write_drawing(n, path)
+            _, _, base = run_loader('baseline', path)
+            n_read, t_read, rss_read = run_loader('readfile', path)
+            n_stream, t_stream, rss_stream = run_loader('stream', path)
+            assert n_read == n_stream == n
+            print(f"{n:>9} {os.path.getsize(path) / 2**20:>8.1f} {base:>13.0f} {rss_read:>13.0f} {rss_stream:>11.0f} {t_read:>12.2f} {t_stream:>10.2f} {n / t_read:>16.0f} {n / t_stream:>14.0f}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,71 @@
+"""DXF再変換: 従来の行ごとの書き出しと dxf_writer.write_table_dxf() の処理速度 (図形/秒) の比較
+
+    python benchmarks/bench_dxf_writer.py [図形数 ...]
+
+従来の方式は、シートごとの DataFrame (project_store.table_frames) を iterrows() で回し、
+座標文字列を ast.literal_eval で読み戻して ezdxf で1件ずつ作図してから doc.write() する。
+新しい方式の出力を ezdxf で読み直し、図形数と監査エラーが無いことも確認する。
+"""
+import ast
+import io
+import os
+import sys
+import time
+
+import ezdxf
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_entity_store import synthetic_modelspace
+from dxf_writer import write_table_dxf
+from entity_store import EntityTable
+from project_store import table_frames
+
+DEFAULT_SIZES = [10_000, 50_000, 100_000]
+
+def str_to_tuple_parser(s):
+    try: return ast.literal_eval(s)
+    except: return (0,0,0)
+
+def add_entity_to_dxf(msp, entity_type, row):
+    """従来の app.add_entity_to_dxf()"""
+    try:
+        color = int(row.get('color', 256))
+        attribs = {'color': color}
+        if 'linetype' in row and pd.notna(row['linetype']): attribs['linetype'] = row['linetype']
+        if entity_type == 'line': msp.add_line(str_to_tuple_parser(row['start']), str_to_tuple_parser(row['end']), dxfattribs=attribs)
+        elif entity_type == 'circle': msp.add_circle(str_to_tuple_parser(row['center']), row['radius'], dxfattribs=attribs)
+        elif entity_type == 'arc': msp.add_arc(str_to_tuple_parser(row['center']), row['radius'], row['start_angle'], row['end_angle'], dxfattribs=attribs)
+        elif entity_type == 'text':
+            text_attribs = {'height': row.get('height', 2.5), 'color': color}
+            if 'style' in row and pd.notna(row['style']): text_attribs['style'] = row['style']
+            msp.add_text(str(row['text']), dxfattribs=text_attribs).set_pos(str_to_tuple_parser(row['insert']))
+    except: pass
+
+def legacy_write(table):
+    doc = ezdxf.new(dxfversion="R2010")
+    msp = doc.modelspace()
+    for sheet_name, df in table_frames(table).items():
+        for _, row in df.iterrows(): add_entity_to_dxf(msp, sheet_name, row)
+    out = io.StringIO()
+    doc.write(out)
+    return out
+
+def new_write(table):
+    out = io.StringIO()
+    write_table_dxf(table, out)
+    return out
+
+def main(sizes):
+    print(f"{'entities':>9} {'legacy[s]':>10} {'new[s]':>8} {'legacy[ent/s]':>14} {'new[ent/s]':>11} {'speedup':>8}")
+    for n in sizes:
+        table = EntityTable.from_modelspace(synthetic_modelspace(n, np.random.default_rng(0)))
+        t0 = time.perf_counter(); legacy_write(table); t_legacy = time.perf_counter() - t0
+        t0 = time.perf_counter(); out = new_write(table); t_new = time.perf_counter() - t0
+        doc = ezdxf.read(io.StringIO(out.getvalue()))
+        assert len(doc.modelspace()) == n and not doc.audit().has_errors
+        print(f"{n:>9} {t_legacy:>10.2f} {t_new:>8.3f} {n / t_legacy:>14.0f} {n / t_new:>11.0f} {t_legacy / t_new:>7.0f}x")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,82 @@
+"""図形辞書リストと EntityTable のメモリ使用量・読み込み時間の比較
+
+    python benchmarks/bench_entity_store.py [図形数 ...]
+
+ezdxf で合成した図面のモデル空間から、従来の辞書リスト
+([{'entity': ..., 'handle': ..., **e.dxf.all_existing_dxf_attribs()} for e in msp])
+と EntityTable をそれぞれ作成し、図面本体を破棄した後の保持メモリ (tracemalloc) と
+所要時間を測る。
+あわせて全線分の長さを求める処理の時間も比較する。
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import ezdxf
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from entity_store import EntityTable
+
+DEFAULT_SIZES = [10_000, 50_000, 200_000]
+
+def synthetic_modelspace(n, rng):
+    """線分・円・円弧・文字を 5:2:2:1 の割合で配置した図面を作る"""
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    side = np.sqrt(n * 25.0)
+    xy = rng.uniform(0, side, size=(n, 2))
+    for i, (x, y) in enumerate(xy):
+        k = i % 10
+        if k < 5: msp.add_line((x, y), (x + 1.0, y + 0.5))
+        elif k < 7: msp.add_circle((x, y), 0.5)
+        elif k < 9: msp.add_arc((x, y), 0.5, 0, 180)
+        else: msp.add_text(f"ＴＥＸＴ{i}").set_placement((x, y))
+    return msp
+
+def dict_representation(msp):
+    return [{'entity': e.dxftype(), 'handle': e.dxf.handle, **e.dxf.all_existing_dxf_attribs()} for e in msp]
+
+def measure(n, build):
+    """図面を作って変換し、(変換結果, 変換時間, 図面本体を破棄した後も残るメモリ量) を返す
+
+    tracemalloc は割り当てのたびに記録するため、時間は記録を止めた別の変換で測る。
+    """
+    msp = synthetic_modelspace(n, np.random.default_rng(0))
+    t0 = time.perf_counter()
+    build(msp)
+    elapsed = time.perf_counter() - t0
+    del msp
+    gc.collect()
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    msp = synthetic_modelspace(n, np.random.default_rng(0))
+    result = build(msp)
+    del msp
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained - baseline
+
+def main(sizes):
+    print(f"{'entities':>9} {'dict[MB]':>9} {'table[MB]':>10} {'ratio':>6} {'dict[s]':>8} {'table[s]':>9} {'len dict[s]':>12} {'len table[s]':>13}")
+    for n in sizes:
+        entities, t_dict, m_dict = measure(n, dict_representation)
+        table, t_table, m_table = measure(n, EntityTable.from_modelspace)
+
+        t0 = time.perf_counter()
+        dict_lengths = [np.linalg.norm(l['end'] - l['start']) for l in entities if l['entity'] == 'LINE']
+        t_len_dict = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        table_lengths = table.sizes('LINE') * 2
+        t_len_table = time.perf_counter() - t0
+        assert np.allclose(dict_lengths, table_lengths)
+
+        print(f"{n:>9} {m_dict / 2**20:>9.1f} {m_table / 2**20:>10.1f} {m_dict / m_table:>5.0f}x {t_dict:>8.2f} {t_table:>9.2f} {t_len_dict:>12.3f} {t_len_table:>13.4f}")
+        del entities, table
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,57 @@
+"""処理時間の計測 (metrics.py) の負荷
+
+    python benchmarks/bench_metrics.py [クラスタ数 ...]
+
+check_* 関数を1件ずつ呼ぶ図形定義について、計測なしのループと evaluate_anchors (判定数・
+合計時間と SAMPLE_EVERY 件に1件の個別時間を記録する) の判定結果が一致することを確認し、
+時間を比較する。計測の負荷だけを比べるため、evaluate_anchors は近傍数の下限による絞り込み (use_rules) を
+使わず、計測なしのループと同じく全アンカーで check_* 関数を呼ぶ。両者が同じアンカー数・同じ check_* 関数を
+判定したこと (記録された判定数・合格数、絞り込みと一括判定が使われていないこと) も確認してから時間を表示する。あわせて metrics.stage() 1回あたりの時間を表示する。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import shape_definitions
+from metrics import metrics
+from shape_batch import BATCH_CHECKS
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import build_index, evaluate_anchors, neighbor_sets, scalar_check
+from synthetic import random_clusters
+
+DEFAULT_SIZES = [2_000, 10_000]
+STAGE_CALLS = 100_000
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    t0 = time.perf_counter()
+    for _ in range(STAGE_CALLS):
+        with metrics.stage('bench.stage'): pass
+    print(f"metrics.stage(): {(time.perf_counter() - t0) / STAGE_CALLS * 1e6:.2f} us/call")
+    for n_clusters in sizes:
+        table = random_clusters(n_clusters, rng)
+        index = build_index(table)
+        print(f"clusters={n_clusters} entities={len(table)}")
+        print(f"  {'shape':<24} {'anchors':>8} {'plain[s]':>9} {'metered[s]':>11} {'overhead':>9}")
+        total_plain = total_metered = 0.0
+        for key, definition in SHAPE_DEFINITIONS.items():
+            if definition['check_function'] in BATCH_CHECKS: continue
+            ns = neighbor_sets(definition, table, index)
+            check = getattr(shape_definitions, definition['check_function'])
+            name = definition['check_function']
+            t0 = time.perf_counter(); plain = np.array([scalar_check(check, table, ns, q) for q in range(len(ns))], dtype=bool); t_plain = time.perf_counter() - t0
+            with metrics.capture() as captured:
+                t0 = time.perf_counter(); metered = evaluate_anchors(definition, table, ns, use_batch=False, use_rules=False); t_metered = time.perf_counter() - t0
+            recorded = captured.snapshot()['checks'][name]
+            assert np.array_equal(plain, metered), f"{key}: instrumented evaluation disagrees"
+            assert recorded['calls'] == len(plain) and recorded['rejected'] == 0 and not recorded['batch'], f"{key}: evaluated different anchors ({recorded})"
+            assert recorded['passed'] == int(np.count_nonzero(plain)), f"{key}: recorded pass count disagrees"
+            total_plain += t_plain; total_metered += t_metered
+            print(f"  {key:<24} {len(ns):>8} {t_plain:>9.3f} {t_metered:>11.3f} {(t_metered / t_plain - 1) * 100:>8.1f}%")
+        print(f"  {'total':<24} {'':>8} {total_plain:>9.3f} {total_metered:>11.3f} {(total_metered / total_plain - 1) * 100:>8.1f}%")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
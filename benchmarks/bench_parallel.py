@@ -0,0 +1,41 @@
+"""タイル分割による並列解析 (parallel_matcher.py) のワーカー数ごとの解析時間
+
+    python benchmarks/bench_parallel.py [クラスタ数 ...]
+
+全図形定義を選択し、逐次解析 (find_shapes) と 1/2/4/8 ワーカーの並列解析で時間を比べ、
+結果が一致することを確認する。プロセスプールの起動時間を除くため、各ワーカー数で一度
+空の解析を流してから計測する。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_matcher import find_shapes_parallel
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import find_shapes
+from synthetic import random_clusters
+
+DEFAULT_SIZES = [5_000, 20_000]
+WORKERS = [1, 2, 4, 8]
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    shape_keys = list(SHAPE_DEFINITIONS)
+    print(f"cpus={os.cpu_count()}")
+    print(f"{'entities':>9} {'serial[s]':>10} " + ' '.join(f"{f'{w} workers[s]':>13}" for w in WORKERS))
+    warm = random_clusters(10, rng)
+    for w in WORKERS: find_shapes_parallel(warm, shape_keys, w)
+    for n_clusters in sizes:
+        table = random_clusters(n_clusters, rng)
+        t0 = time.perf_counter(); expected = find_shapes(table, shape_keys); t_serial = time.perf_counter() - t0
+        times = []
+        for w in WORKERS:
+            t0 = time.perf_counter(); result = find_shapes_parallel(table, shape_keys, w); times.append(time.perf_counter() - t0)
+            assert result == expected, f"{w} workers: result differs from find_shapes()"
+        print(f"{len(table):>9} {t_serial:>10.3f} " + ' '.join(f"{t:>13.3f}" for t in times))
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
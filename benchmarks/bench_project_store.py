@@ -0,0 +1,113 @@
+"""明細書プロジェクトの図形データ: 変換済みExcel (旧) と EntityTable の .npz (新) の比較
+
+    python benchmarks/bench_project_store.py [クラスタ数 ...]
+
+合成図面 (文字を含む) を旧 create_project() と同じ手順でExcelに変換し、項目追加 (テキスト探索) と
+Excel出力の時間を旧方式 (毎回 pd.read_excel) と新方式 (.npz を読み込み) で比べる。
+旧形式のExcelから table_from_workbook() で移行した表が元の表と一致することも確認する。
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import ezdxf
+import mojimoji
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from entity_store import ENTITY_TYPES, EntityTable
+from project_store import item_colors, search_item, table_frames, table_from_workbook
+from synthetic import random_clusters, write_dxf
+
+DEFAULT_SIZES = [500, 2_000, 5_000]
+QUERY = 'ＨＨ'
+
+def write_drawing(n_clusters, rng, path):
+    """合成図面に文字 (一部は検索語を含む) を加えてDXFに書き出す"""
+    write_dxf(random_clusters(n_clusters, rng), path)
+    doc = ezdxf.readfile(path)
+    msp = doc.modelspace()
+    for k in range(n_clusters):
+        label = f"HH-{k}" if rng.random() < 0.3 else f"Ｐ{k}"
+        msp.add_text(label, dxfattribs={'height': 2.5}).set_placement((k * 40.0, 5.0))
+    doc.saveas(path)
+
+def legacy_convert(doc, path):
+    """旧 create_project() のExcel変換"""
+    with pd.ExcelWriter(path) as writer:
+        for name in ['line', 'circle', 'arc', 'text']:
+            entities = list(doc.query(name.upper()))
+            if entities: pd.DataFrame([e.dxfattribs() for e in entities]).to_excel(writer, sheet_name=name, index=False)
+
+def legacy_add_item(path, query):
+    """旧 add_item() のテキスト探索"""
+    xls = pd.ExcelFile(path)
+    df = pd.read_excel(xls, sheet_name='text')
+    normalized_query = mojimoji.zen_to_han(query, kana=False)
+    search_series = df['text'].astype(str).apply(lambda x: mojimoji.zen_to_han(x, kana=False))
+    return search_series.str.contains(normalized_query, case=False, na=False).sum()
+
+def legacy_generate(path, items):
+    """旧 generate_modified_excel() (テキスト探索の項目のみ)"""
+    all_sheets = pd.read_excel(path, sheet_name=None)
+    for item in items:
+        normalized_query = mojimoji.zen_to_han(json.loads(item.search_params)['query'], kana=False)
+        search_series = all_sheets['text']['text'].astype(str).apply(lambda x: mojimoji.zen_to_han(x, kana=False))
+        all_sheets['text'].loc[search_series.str.contains(normalized_query, case=False, na=False), 'color'] = item.color
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for sheet_name, df_sheet in all_sheets.items(): df_sheet.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output
+
+def new_add_item(path, query):
+    return search_item(EntityTable.load(path), 'text_search', {'query': query})[0]
+
+def new_generate(path, items):
+    table = EntityTable.load(path)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for sheet_name, df_sheet in table_frames(table, item_colors(table, items)).items(): df_sheet.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+def check_migration(table, migrated):
+    for etype in ENTITY_TYPES:
+        for col, arr in table.columns[etype].items():
+            if col in ('layer', 'linetype', 'style'):
+                assert [table.strings[c] for c in arr] == [migrated.strings[c] for c in migrated.columns[etype][col]], (etype, col)
+            else:
+                assert np.allclose(arr, migrated.columns[etype][col]), (etype, col)
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    items = [SimpleNamespace(item_type='text_search', search_params=json.dumps({'query': QUERY}), color=3)]
+    print(f"{'entities':>9} {'xlsx[MB]':>9} {'npz[MB]':>8} {'add_item old[s]':>16} {'new[s]':>8} {'generate old[s]':>16} {'new[s]':>8} {'migrate[s]':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_clusters in sizes:
+            dxf_path = os.path.join(tmp, f"synthetic_{n_clusters}.dxf")
+            xlsx_path, npz_path = dxf_path[:-4] + '.xlsx', dxf_path[:-4] + '.npz'
+            write_drawing(n_clusters, rng, dxf_path)
+            doc = ezdxf.readfile(dxf_path)
+            legacy_convert(doc, xlsx_path)
+            table = EntityTable.from_modelspace(doc.modelspace())
+            table.save(npz_path)
+            old_count, t_old_add = timed(legacy_add_item, xlsx_path, QUERY)
+            new_count, t_new_add = timed(new_add_item, npz_path, QUERY)
+            assert old_count == new_count, (old_count, new_count)
+            _, t_old_gen = timed(legacy_generate, xlsx_path, items)
+            _, t_new_gen = timed(new_generate, npz_path, items)
+            migrated, t_migrate = timed(table_from_workbook, xlsx_path)
+            check_migration(table, migrated)
+            print(f"{len(table):>9} {os.path.getsize(xlsx_path) / 2**20:>9.2f} {os.path.getsize(npz_path) / 2**20:>8.2f} {t_old_add:>16.3f} {t_new_add:>8.4f} {t_old_gen:>16.3f} {t_new_gen:>8.3f} {t_migrate:>11.3f}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
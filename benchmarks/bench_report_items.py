@@ -0,0 +1,151 @@
+"""明細項目の編集: 連番の order を全項目で振り直す従来の方式と、疎なキー・複合索引・一括 UPDATE (app.py) の比較
+
+    python benchmarks/bench_report_items.py [1プロジェクトの項目数 ...]
+
+app.py の ReportItem と同じ形の表 (SQLite) に、項目数 n のプロジェクトを PROJECTS 件入れ、そのうち1件を編集する。
+従来の表は索引なし、新しい表は (project_id, order) の索引付き。以下の操作の1回あたりの時間と、移動1回で読み込んだ項目の数を比べる
+(従来の振り直しも SQLAlchemy が値の変わった2行だけを UPDATE するが、そのために全項目を読み込む)。
+- 追加: 従来は order の降順の先頭の項目を読んで +1、新しい方式は order の最大値 + ITEM_ORDER_STEP
+- 移動: 従来は全項目を読んで入れ替え、全項目の order を振り直す。新しい方式は隣の項目とキーを入れ替える
+- 一括更新: 従来は全項目を読んでフォームの値を1件ずつ代入、新しい方式はフォームの項目IDで一括 UPDATE
+同じ操作の後で、両者の項目の並びと値が一致することを確認する。
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, and_, bindparam, case, create_engine, event, func, or_
+from sqlalchemy.orm import Session, declarative_base
+
+DEFAULT_SIZES = [1_000, 5_000]
+PROJECTS = 20
+APPENDS, MOVES, UPDATES = 50, 50, 3
+ITEM_ORDER_STEP = 1024  # app.py と同じ
+
+Base = declarative_base()
+
+def _columns():
+    return {'id': Column(Integer, primary_key=True), 'project_id': Column(Integer, ForeignKey('project.id'), nullable=False), 'order': Column(Integer, nullable=False, default=0),
+            'item_type': Column(String(50), nullable=False), 'hinmei': Column(String(200)), 'hinshitsu': Column(String(200), default=''), 'suryo': Column(Integer),
+            'tani': Column(String(50), default=''), 'search_params': Column(String(500)), 'color': Column(Integer, default=1)}
+
+class Project(Base): __tablename__ = 'project'; id = Column(Integer, primary_key=True)
+OldItem = type('OldItem', (Base,), {'__tablename__': 'old_item', **_columns()})
+NewItem = type('NewItem', (Base,), {'__tablename__': 'new_item', '__table_args__': (Index('ix_new_item_project_order', 'project_id', 'order'),), **_columns()})
+
+# --- 従来の方式 ---
+def old_append(s, pid, **values):
+    last = s.query(OldItem).filter_by(project_id=pid).order_by(OldItem.order.desc()).first()
+    s.add(OldItem(project_id=pid, order=(last.order + 1) if last else 0, **values)); s.commit()
+
+def old_move(s, pid, item_id, direction):
+    items = list(s.query(OldItem).filter_by(project_id=pid).order_by(OldItem.order).all())
+    idx = next(i for i, item in enumerate(items) if item.id == item_id)
+    if direction == 'up' and idx > 0: items[idx], items[idx - 1] = items[idx - 1], items[idx]
+    elif direction == 'down' and idx < len(items) - 1: items[idx], items[idx + 1] = items[idx + 1], items[idx]
+    for i, item in enumerate(items): item.order = i
+    s.commit()
+
+def old_update_all(s, pid, form):
+    """form のキーは新しい方式と同じ項目ID (従来のフォームは並び順の番号だったが、読み込みと代入の手間は同じ)"""
+    for item in s.query(OldItem).filter_by(project_id=pid).order_by(OldItem.order).all():
+        item.hinmei = form.get(f'hinmei_{item.id}')
+        item.color = int(form.get(f'color_{item.id}', 1))
+        if item.item_type != 'subtotal': item.hinshitsu = form.get(f'hinshitsu_{item.id}'); item.tani = form.get(f'tani_{item.id}')
+    s.commit()
+
+# --- 新しい方式 (app.py の next_item_order / adjacent_item / rebalance_items / update_items_from_form と同じ文) ---
+def new_append(s, pid, **values):
+    last = s.query(func.max(NewItem.order)).filter(NewItem.project_id == pid).scalar()
+    s.add(NewItem(project_id=pid, order=0 if last is None else last + ITEM_ORDER_STEP, **values)); s.commit()
+
+def _adjacent(s, item, direction):
+    q = s.query(NewItem).filter(NewItem.project_id == item.project_id)
+    if direction == 'up': return q.filter(or_(NewItem.order < item.order, and_(NewItem.order == item.order, NewItem.id < item.id))).order_by(NewItem.order.desc(), NewItem.id.desc()).first()
+    return q.filter(or_(NewItem.order > item.order, and_(NewItem.order == item.order, NewItem.id > item.id))).order_by(NewItem.order, NewItem.id).first()
+
+def _rebalance(s, pid):
+    ids = [row.id for row in s.query(NewItem.id).filter(NewItem.project_id == pid).order_by(NewItem.order, NewItem.id)]
+    t = NewItem.__table__
+    s.execute(t.update().where(t.c.id == bindparam('item_id')), [{'item_id': item_id, 'order': i * ITEM_ORDER_STEP} for i, item_id in enumerate(ids)])
+    s.expire_all()
+
+def new_move(s, pid, item_id, direction):
+    item = s.query(NewItem).filter_by(id=item_id, project_id=pid).first()
+    neighbor = _adjacent(s, item, direction)
+    if neighbor is not None and neighbor.order == item.order: _rebalance(s, pid); neighbor = _adjacent(s, item, direction)
+    if neighbor is not None: item.order, neighbor.order = neighbor.order, item.order
+    s.commit()
+
+def new_update_all(s, pid, form):
+    ids = [int(key[len('hinmei_'):]) for key in form if key.startswith('hinmei_')]
+    t = NewItem.__table__
+    is_subtotal = t.c.item_type == 'subtotal'
+    statement = t.update().where(t.c.project_id == pid, t.c.id == bindparam('item_id')).values(
+        hinmei=bindparam('new_hinmei'), color=bindparam('new_color'),
+        hinshitsu=case((is_subtotal, t.c.hinshitsu), else_=bindparam('new_hinshitsu')), tani=case((is_subtotal, t.c.tani), else_=bindparam('new_tani')))
+    s.execute(statement, [{'item_id': i, 'new_hinmei': form.get(f'hinmei_{i}'), 'new_color': int(form.get(f'color_{i}', 1)),
+                           'new_hinshitsu': form.get(f'hinshitsu_{i}'), 'new_tani': form.get(f'tani_{i}')} for i in ids])
+    s.commit()
+
+def _item_values(i):
+    return {'item_type': 'subtotal', 'hinmei': '計'} if i % 10 == 9 else {'item_type': 'text_search', 'hinmei': f"品名{i}", 'hinshitsu': 'SUS', 'tani': '基', 'suryo': i, 'color': 1 + i % 7}
+
+def _fill(engine, n):
+    """両方の表に同じ項目を入れる (ID も同じ)。従来は連番、新しい方式は ITEM_ORDER_STEP 間隔"""
+    with engine.begin() as conn:
+        conn.execute(Project.__table__.insert(), [{'id': p} for p in range(1, PROJECTS + 1)])
+        rows = [{'id': (p - 1) * n + i + 1, 'project_id': p, 'order': i, 'suryo': None, 'hinshitsu': '', 'tani': '', 'color': 1, 'search_params': '{}', **_item_values(i)}
+                for p in range(1, PROJECTS + 1) for i in range(n)]
+        conn.execute(OldItem.__table__.insert(), rows)
+        conn.execute(NewItem.__table__.insert(), [{**r, 'order': r['order'] * ITEM_ORDER_STEP} for r in rows])
+
+def _snapshot(s, model, pid):
+    return [(i.id, i.hinmei, i.hinshitsu, i.tani, i.color) for i in s.query(model).filter_by(project_id=pid).order_by(model.order, model.id)]
+
+loaded = {'items': 0}
+
+@event.listens_for(Base, 'load', propagate=True)
+def _count_loaded(target, context): loaded['items'] += 1
+
+def main(sizes):
+    print(f"{'items':>6} {'append[ms] old':>15} {'new':>7} {'move[ms] old':>13} {'new':>7} {'loaded old':>11} {'new':>4} "
+          f"{'update_all[ms] old':>19} {'new':>7}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            engine = create_engine(f"sqlite:///{os.path.join(workdir, f'items_{n}.db')}")
+            Base.metadata.create_all(engine)
+            _fill(engine, n)
+            pid = PROJECTS // 2
+            timings = {}
+            for name, append, move, update_all in (('old', old_append, old_move, old_update_all), ('new', new_append, new_move, new_update_all)):
+                rng = np.random.default_rng(0)
+                with Session(engine) as s:
+                    t0 = time.perf_counter()
+                    for i in range(APPENDS): append(s, pid, **_item_values(n + i))
+                    t_append = (time.perf_counter() - t0) / APPENDS
+                    ids = [item_id for item_id, *_ in _snapshot(s, OldItem if name == 'old' else NewItem, pid)]
+                    moves = [(int(ids[k]), 'up' if k % 2 else 'down') for k in rng.integers(0, len(ids), MOVES)]
+                    loaded['items'] = 0
+                    t0 = time.perf_counter()
+                    for item_id, direction in moves: move(s, pid, item_id, direction)
+                    t_move, rows = (time.perf_counter() - t0) / MOVES, loaded['items'] / MOVES
+                    t0 = time.perf_counter()
+                    for u in range(UPDATES):
+                        form = {}
+                        for item_id in ids:
+                            form[f'hinmei_{item_id}'] = f"品名{item_id}-{u}"
+                            if item_id % 10 != 0: form.update({f'hinshitsu_{item_id}': f"品質{u}", f'tani_{item_id}': '式', f'color_{item_id}': str(1 + (item_id + u) % 7)})
+                        update_all(s, pid, form)
+                    t_update = (time.perf_counter() - t0) / UPDATES
+                    timings[name] = (t_append, t_move, rows, t_update, _snapshot(s, OldItem if name == 'old' else NewItem, pid))
+            assert timings['old'][4] == timings['new'][4]
+            old, new = timings['old'], timings['new']
+            print(f"{n:>6} {old[0] * 1000:>15.2f} {new[0] * 1000:>7.2f} {old[1] * 1000:>13.1f} {new[1] * 1000:>7.2f} {old[2]:>11.0f} {new[2]:>4.0f} "
+                  f"{old[3] * 1000:>19.1f} {new[3] * 1000:>7.1f}")
+            engine.dispose()
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,80 @@
+"""図形解析の結果: セッション (署名付きCookie) に置く従来の方式と、サーバー側に保存する方式 (result_store.py) の比較
+
+    python benchmarks/bench_result_store.py [図形定義ごとの図形数 ...]
+
+既知の図形を配置した図面 (synthetic.plant_shapes) を全図形定義で解析し、検出図形のハンドルを含む結果について
+以下を比べる。従来は結果全体をセッションに入れ、結果画面の出力フォームにも JSON として埋め込んでいた。
+- Cookie: Flask のセッションの Cookie の大きさ (ブラウザが毎回送る)
+- 応答: 結果画面に埋め込む結果の大きさ (従来は結果全体の JSON、新しい方式は件数などの要約だけ)
+- 1リクエストあたりの時間: 従来は Cookie の検証と読み込み、新しい方式は結果IDの Cookie の読み込みと要約の取得
+  (app.py の AnalysisResult 表と同じ形の SQLite の表で代用する)
+- ハンドルの1ページ目 (PAGE_SIZE 件) の取得時間
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_store import PAGE_SIZE, handle_page, save_handles, split_results
+from revision_matcher import analyze_revision
+from shape_definitions import SHAPE_DEFINITIONS
+from synthetic import plant_shapes
+
+DEFAULT_SIZES = [50, 500]
+REQUESTS = 50
+COOKIE_LIMIT = 4093  # 多くのブラウザが1つの Cookie に許す大きさ
+
+def _per_request(fn):
+    t0 = time.perf_counter()
+    for _ in range(REQUESTS): fn()
+    return (time.perf_counter() - t0) / REQUESTS
+
+def _app():
+    app = Flask(__name__, root_path=tempfile.gettempdir())
+    app.config['SECRET_KEY'] = 'benchmark'
+    return app
+
+def main(sizes):
+    serializer = SecureCookieSessionInterface().get_signing_serializer(_app())
+    print(f"{'matches':>8} {'cookie[B] old':>14} {'new':>6} {'page[B] old':>12} {'new':>7} {'req[ms] old':>12} {'new':>7} {'handles page[ms]':>17}")
+    with tempfile.TemporaryDirectory() as workdir:
+        conn = sqlite3.connect(os.path.join(workdir, 'results.db'))
+        conn.execute("CREATE TABLE analysis_result (id TEXT PRIMARY KEY, user_id INTEGER, summary TEXT, result_path TEXT)")
+        for instances in sizes:
+            table, _, _ = plant_shapes(instances, np.random.default_rng(0))
+            results, _, _ = analyze_revision(table, list(SHAPE_DEFINITIONS))
+            matches = sum(len(r['handles']) for r in results.values())
+            # 従来: 結果全体をセッションに入れ、結果画面にも埋め込む
+            old_cookie = serializer.dumps({'_user_id': '1', 'analyzer_filename': 'drawing.dxf', 'analysis_results': results})
+            old_page = len(json.dumps(results).encode('utf-8'))
+            t_old = _per_request(lambda: serializer.loads(old_cookie))
+            # 新しい方式: ハンドルは .npz、要約はDB、セッションには結果IDだけ
+            summary, handles = split_results(results)
+            analysis_id = f"{instances:032x}"
+            path = os.path.join(workdir, f"{analysis_id}.npz")
+            save_handles(path, handles)
+            conn.execute("INSERT INTO analysis_result VALUES (?, ?, ?, ?)", (analysis_id, 1, json.dumps(summary, ensure_ascii=False), path))
+            new_cookie = serializer.dumps({'_user_id': '1', 'analyzer_filename': 'drawing.dxf', 'analysis_id': analysis_id})
+            def load_new():
+                session = serializer.loads(new_cookie)
+                row = conn.execute("SELECT summary, result_path FROM analysis_result WHERE id = ? AND user_id = ?", (session['analysis_id'], 1)).fetchone()
+                return json.loads(row[0])
+            assert load_new() == {k: {f: v for f, v in r.items() if f != 'handles'} for k, r in results.items()}
+            new_page = len(json.dumps(load_new()).encode('utf-8'))
+            t_new = _per_request(load_new)
+            key = max(results, key=lambda k: len(results[k]['handles']))
+            total, page = handle_page(path, key, 0, PAGE_SIZE)
+            assert total == len(results[key]['handles']) and page == results[key]['handles'][:PAGE_SIZE]
+            t_page = _per_request(lambda: handle_page(path, key, 0, PAGE_SIZE))
+            over = ' (over cookie limit)' if len(old_cookie) > COOKIE_LIMIT else ''
+            print(f"{matches:>8} {len(old_cookie):>14} {len(new_cookie):>6} {old_page:>12} {new_page:>7} {t_old * 1000:>12.2f} {t_new * 1000:>7.3f} {t_page * 1000:>17.3f}{over}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,42 @@
+"""改訂図面の差分解析 (revision_matcher.analyze_revision) と全体の解析 (find_shapes) の比較
+
+    python benchmarks/bench_revision.py [クラスタ数 ...]
+
+全図形定義を選択して元の図面を解析したあと、図形の一部 (FRACTIONS) を変更した改訂版を
+全体の解析と差分解析で解析し、時間と実際に判定したアンカー数を比べる。結果が全体の解析と
+一致すること、追加・削除された検出の差が検出数の差と一致することも確認する。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from revision_matcher import analyze_revision, diff_detections
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import find_shapes
+from synthetic import random_clusters, revise
+
+DEFAULT_SIZES = [5_000, 20_000]
+FRACTIONS = [0.001, 0.01, 0.05]
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    shape_keys = list(SHAPE_DEFINITIONS)
+    print(f"{'entities':>9} {'changed':>8} {'full[s]':>8} {'revision[s]':>12} {'anchors':>8} {'evaluated':>10} {'added':>6} {'removed':>8}")
+    for n_clusters in sizes:
+        table = random_clusters(n_clusters, rng)
+        base, state, _ = analyze_revision(table, shape_keys)
+        for fraction in FRACTIONS:
+            revised = revise(table, fraction, rng)
+            t0 = time.perf_counter(); full = find_shapes(revised, shape_keys); t_full = time.perf_counter() - t0
+            t0 = time.perf_counter(); results, new_state, stats = analyze_revision(revised, shape_keys, state); t_rev = time.perf_counter() - t0
+            assert results == full
+            report = diff_detections(state, new_state, shape_keys)
+            added, removed = sum(len(r['added']) for r in report.values()), sum(len(r['removed']) for r in report.values())
+            assert added - removed == sum(full[k]['count'] - base[k]['count'] for k in shape_keys)
+            print(f"{len(revised):>9} {stats['changed']:>8} {t_full:>8.3f} {t_rev:>12.3f} {stats['anchors']:>8} {stats['evaluated']:>10} {added:>6} {removed:>8}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,48 @@
+"""近傍数の下限による事前除外 (shape_matcher.compile_rule) の効果
+
+    python benchmarks/bench_rule_engine.py [クラスタ数 ...]
+
+一括判定の無い図形定義 (check_* 関数を1件ずつ呼ぶもの) について、全アンカーを check_* 関数で
+判定する場合と、entity_counts から求めた近傍数の下限で除外してから参照する種別の近傍だけを渡す場合の
+判定結果が一致することを確認し、除外したアンカーの割合と時間を比較する。
+ランダムなクラスタの図面 (random_clusters) と、既知の図形とノイズを配置した図面 (plant_shapes) で測る。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shape_batch import BATCH_CHECKS
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import build_index, evaluate_anchors, feasible_anchors, neighbor_sets
+from synthetic import plant_shapes, random_clusters
+
+DEFAULT_SIZES = [10_000, 50_000]
+
+def compare(label, table):
+    index = build_index(table)
+    print(f"{label} entities={len(table)}")
+    print(f"  {'shape':<24} {'anchors':>8} {'rejected':>9} {'plain[s]':>9} {'rules[s]':>9} {'speedup':>8}")
+    total_plain = total_rules = 0.0
+    for key, definition in SHAPE_DEFINITIONS.items():
+        if definition['check_function'] in BATCH_CHECKS: continue
+        ns = neighbor_sets(definition, table, index)
+        t0 = time.perf_counter(); plain = evaluate_anchors(definition, table, ns, use_rules=False); t_plain = time.perf_counter() - t0
+        t0 = time.perf_counter(); ruled = evaluate_anchors(definition, table, ns); t_rules = time.perf_counter() - t0
+        mismatch = np.nonzero(plain != ruled)[0]
+        assert not len(mismatch), f"{key}: rule engine disagrees at anchors {ns.anchors[mismatch[:10]]}"
+        rejected = 1 - feasible_anchors(definition, ns).mean() if len(ns) else 0.0
+        total_plain += t_plain; total_rules += t_rules
+        print(f"  {key:<24} {len(ns):>8} {rejected:>8.1%} {t_plain:>9.3f} {t_rules:>9.3f} {t_plain / t_rules:>7.1f}x")
+    print(f"  {'total':<24} {'':>8} {'':>9} {total_plain:>9.3f} {total_rules:>9.3f} {total_plain / total_rules:>7.1f}x")
+
+def main(sizes):
+    for n_clusters in sizes:
+        compare(f"random_clusters={n_clusters}", random_clusters(n_clusters, np.random.default_rng(0)))
+        instances = max(n_clusters // (8 * len(SHAPE_DEFINITIONS)), 1)  # 図形数をおおむねそろえる
+        compare(f"plant_shapes={instances}", plant_shapes(instances, np.random.default_rng(0))[0])
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
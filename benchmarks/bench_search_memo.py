@@ -0,0 +1,68 @@
+"""明細書の出力: 項目ごとに毎回検索する従来の方式と、保存した検索結果を使い回す方式 (app.project_searcher) の比較
+
+    python benchmarks/bench_search_memo.py [クラスタ数 ...]
+
+車両灯器・歩行者用灯器・テキスト探索の3項目を持つプロジェクトについて、DXF再変換を
+EXPORTS 回続けて行う。従来は毎回全項目を検索し直す。新しい方式は1回目に検索結果を
+(検索条件のハッシュ -> 数, gid 列) として保存し、2回目以降は読み出して色を付け替えるだけになる。
+保存先は app.py の SearchResult 表と同じ形の SQLite の表 (メモリ上) で代用する。
+"""
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dxf_writer import write_table_dxf
+from project_store import item_colors, search_key, search_version, table_searcher
+from synthetic import random_clusters
+
+DEFAULT_SIZES = [2_000, 10_000]
+EXPORTS = 3
+ITEMS = [SimpleNamespace(item_type='shape_search', search_params=json.dumps({'shape': 'vehicle'}), color=1),
+         SimpleNamespace(item_type='shape_search', search_params=json.dumps({'shape': 'pedestrian'}), color=2),
+         SimpleNamespace(item_type='text_search', search_params=json.dumps({'query': 'HH'}), color=3)]
+
+def memo_searcher(conn, table, source):
+    """app.project_searcher() と同じ手順 (DBの代わりに sqlite3 を使う)"""
+    search_table = table_searcher(table)
+    def search(item_type, params):
+        key, version = search_key(item_type, params), search_version(item_type)
+        row = conn.execute("SELECT source_hash, detector_version, count, gids FROM search_result WHERE params_hash = ?", (key,)).fetchone()
+        if row and row[0] == source and row[1] == version: return row[2], np.frombuffer(row[3], dtype=np.int64)
+        count, gids = search_table(item_type, params)
+        conn.execute("INSERT OR REPLACE INTO search_result VALUES (?, ?, ?, ?, ?)", (key, source, version, int(count), np.asarray(gids, dtype=np.int64).tobytes()))
+        return count, gids
+    return search
+
+def export(table, search=None):
+    """(色番号, 色付けまでの時間, 出力全体の時間)"""
+    t0 = time.perf_counter()
+    colors = item_colors(table, ITEMS, search)
+    t_colors = time.perf_counter() - t0
+    write_table_dxf(table, io.StringIO(), colors)
+    return colors, t_colors, time.perf_counter() - t0
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    print(f"{'entities':>9} {'search old[s]':>14} {'new 1st':>8} {'new 2nd+':>9} {'export old[s]':>14} {'new 1st':>8} {'new 2nd+':>9}")
+    for n_clusters in sizes:
+        table = random_clusters(n_clusters, rng)
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE TABLE search_result (params_hash TEXT PRIMARY KEY, source_hash TEXT, detector_version TEXT, count INTEGER, gids BLOB)")
+        t_old, t_new = [], []
+        for _ in range(EXPORTS):
+            old, *times = export(table); t_old.append(times)
+            new, *times = export(table, memo_searcher(conn, table, 'source')); t_new.append(times)
+            assert np.array_equal(old, new)
+        (search_old, export_old), (search_first, export_first) = np.mean(t_old, axis=0), t_new[0]
+        search_later, export_later = np.mean(t_new[1:], axis=0)
+        print(f"{len(table):>9} {search_old:>14.3f} {search_first:>8.3f} {search_later:>9.4f} {export_old:>14.3f} {export_first:>8.3f} {export_later:>9.3f}")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,65 @@
+"""総当たり検索とグリッドインデックス検索の比較ベンチマーク
+
+    python benchmarks/bench_spatial_index.py
+
+図形数を増やした合成図面 (密度一定) で、アンカー1件あたりの近傍検索時間を比較する。
+総当たりはアンカー数 × 図形数に比例するため、サンプルしたアンカーの時間から全体を推定する。
+"+outlier" の行は同じ図面の遠く (OUTLIER) に図形を1つ足したもの。セル幅が図面全体の外接矩形で決まると
+グリッドが1セルになり、一括検索が全点を候補に展開してしまうので、離れた図形があっても時間が変わらないことを確かめる。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spatial_index import GridIndex, brute_force_radius
+
+SIZES = [1_000, 10_000, 50_000, 200_000]
+ANCHOR_RATIO = 0.3   # 図形のうちアンカー (円) の割合
+SEARCH_RADIUS_RATIO = 10.0
+SAMPLE_ANCHORS = 300
+OUTLIER_SIZES = [100_000]
+OUTLIER = (1e6, 1e6)
+
+def synthetic_drawing(n, rng):
+    """1図形あたり約25平方単位の密度で代表点と半径を生成する"""
+    side = np.sqrt(n * 25.0)
+    points = rng.uniform(0, side, size=(n, 2))
+    radii = rng.uniform(0.3, 1.0, size=n)
+    return points, radii
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'entities':>15} {'anchors':>8} {'build[s]':>9} {'brute[s]':>10} {'index[s]':>9} {'batch[s]':>9} {'speedup':>8} {'cell':>6}")
+    cases = [(n, False) for n in SIZES] + [(n, True) for n in OUTLIER_SIZES]
+    for n, outlier in cases:
+        points, radii = synthetic_drawing(n, rng)
+        if outlier: points, radii = np.vstack([points, OUTLIER]), np.append(radii, 1.0)
+        anchors = np.nonzero(rng.random(n) < ANCHOR_RATIO)[0]
+        query_radii = radii[anchors] * SEARCH_RADIUS_RATIO
+        sample = rng.choice(len(anchors), size=min(SAMPLE_ANCHORS, len(anchors)), replace=False)
+
+        t0 = time.perf_counter(); index = GridIndex(points); t_build = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        brute = [brute_force_radius(points, points[anchors[q]], query_radii[q]) for q in sample]
+        t_brute = (time.perf_counter() - t0) / len(sample) * len(anchors)
+
+        t0 = time.perf_counter()
+        single = [index.query_radius(points[anchors[q]], query_radii[q]) for q in sample]
+        t_single = (time.perf_counter() - t0) / len(sample) * len(anchors)
+
+        t0 = time.perf_counter()
+        offsets, indices, _ = index.query_radius_batch(points[anchors], query_radii)
+        t_batch = time.perf_counter() - t0
+
+        for k, q in enumerate(sample):
+            assert np.array_equal(brute[k], single[k])
+            assert np.array_equal(brute[k], indices[offsets[q]:offsets[q + 1]])
+        label = f"{n}+outlier" if outlier else str(n)
+        print(f"{label:>15} {len(anchors):>8} {t_build:>9.3f} {t_brute:>10.3f} {t_single:>9.3f} {t_batch:>9.3f} {t_brute / t_batch:>7.0f}x {index.cell_size:>6.1f}")
+
+if __name__ == '__main__':
+    main()
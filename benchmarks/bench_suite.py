@@ -0,0 +1,129 @@
+"""既知の図形を配置した合成図面による、読み込み・図形ごとの解析・検出精度のベンチマーク
+
+    python benchmarks/bench_suite.py [図形定義ごとの図形数 ...] [--noise 比率] [--density 個数] [--seed 値] [--output 結果.json]
+
+synthetic.plant_shapes で全図形定義の既知の図形とノイズを配置した図面をDXFに書き出し、
+DXFの読み込み (read_entity_table)、図形定義ごとの解析 (analyze_revision)、全図形定義をまとめた解析の
+時間とメモリの最大使用量 (tracemalloc、時間とは別に計測) を測る。検出のアンカーが同じ図形定義の
+既知の図形に含まれていれば正解とし、図形定義ごとの適合率・再現率と、別の図形定義の図形での誤検出の内訳を求める。
+結果は shape_definitions.py / app.py / shape_matcher.py のハッシュとともに JSON で書き出すので、
+版の違う結果どうしを比べて性能や検出精度の変化を確認できる。
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from dxf_stream import read_entity_table
+from dxf_writer import write_table_dxf
+from revision_matcher import analyze_revision
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import DETECTOR_VERSION
+from synthetic import plant_shapes
+
+DEFAULT_SIZES = [20, 200]
+TRACKED_FILES = ['shape_definitions.py', 'shape_batch.py', 'shape_matcher.py', 'app.py']
+
+def _measure(fn):
+    """fn() を実行し、(戻り値, 秒) を返す"""
+    t0 = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - t0
+
+def _peak_bytes(fn):
+    """fn() の実行中に確保されたメモリの最大量 (tracemalloc、NumPy の配列を含む)"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _versions():
+    files = {}
+    for name in TRACKED_FILES:
+        with open(os.path.join(ROOT, name), 'rb') as f: files[name] = hashlib.sha256(f.read()).hexdigest()
+    try: commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): commit = None
+    return {'git_commit': commit, 'detector_version': DETECTOR_VERSION, 'files_sha256': files}
+
+def score(detections, owner, planted, shape_key):
+    """検出 ((アンカーの gid, 使った gid), ...) を既知の図形と照らし合わせる"""
+    expected = sum(1 for k in planted if k == shape_key)
+    found, false_positive, confused = set(), 0, {}
+    for anchor, _ in detections:
+        i = owner[anchor]
+        if i >= 0 and planted[i] == shape_key: found.add(int(i)); continue
+        false_positive += 1
+        other = planted[i] if i >= 0 else 'noise'
+        confused[other] = confused.get(other, 0) + 1
+    true_positive = len(detections) - false_positive
+    return {'planted': expected, 'detected': len(detections), 'true_positive': true_positive, 'false_positive': false_positive,
+            'precision': round(true_positive / len(detections), 4) if detections else None,
+            'recall': round(len(found) / expected, 4) if expected else None,
+            'false_positive_sources': dict(sorted(confused.items()))}
+
+def run(instances, noise_ratio, density, seed, workdir):
+    rng = np.random.default_rng(seed)
+    planted_table, owner, planted = plant_shapes(instances, rng, noise_ratio, density)
+    path = os.path.join(workdir, f"suite_{instances}.dxf")
+    with open(path, 'w', encoding='utf-8') as f: write_table_dxf(planted_table, f)
+    table, ingest = _measure(lambda: read_entity_table(path))
+    assert len(table) == len(planted_table) == len(owner)
+    drawing = {'entities': len(table), 'counts': {t: int(n) for t, n in table.counts.items()}, 'dxf_bytes': os.path.getsize(path),
+               'planted_entities': int((owner >= 0).sum()), 'noise_entities': int((owner < 0).sum())}
+    report = {'params': {'instances_per_shape': instances, 'noise_ratio': noise_ratio, 'density': density, 'seed': seed},
+              'drawing': drawing, 'ingest': {'seconds': round(ingest, 4), 'peak_bytes': _peak_bytes(lambda: read_entity_table(path))}, 'shapes': {}}
+    for shape_key in SHAPE_DEFINITIONS:
+        (_, state, _), seconds = _measure(lambda: analyze_revision(table, [shape_key]))
+        result = score(state.detections(shape_key), owner, planted, shape_key)
+        result.update({'seconds': round(seconds, 4), 'peak_bytes': _peak_bytes(lambda: analyze_revision(table, [shape_key]))})
+        report['shapes'][shape_key] = result
+    _, seconds = _measure(lambda: analyze_revision(table, list(SHAPE_DEFINITIONS)))
+    report['all_shapes'] = {'seconds': round(seconds, 4), 'peak_bytes': _peak_bytes(lambda: analyze_revision(table, list(SHAPE_DEFINITIONS)))}
+    return report
+
+def main(sizes, noise_ratio=1.0, density=20, seed=0, output=None):
+    reports = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for instances in sizes:
+            report = run(instances, noise_ratio, density, seed, workdir)
+            reports.append(report)
+            d = report['drawing']
+            print(f"instances={instances} entities={d['entities']} (noise {d['noise_entities']}) dxf={d['dxf_bytes'] / 1e6:.1f}MB "
+                  f"ingest={report['ingest']['seconds']:.3f}s peak={report['ingest']['peak_bytes'] / 1e6:.1f}MB "
+                  f"all shapes={report['all_shapes']['seconds']:.3f}s")
+            print(f"  {'shape':<24} {'planted':>8} {'detected':>9} {'precision':>10} {'recall':>7} {'time[s]':>8} {'peak[MB]':>9}  false positives")
+            for key, s in report['shapes'].items():
+                sources = ', '.join(f"{k}:{v}" for k, v in s['false_positive_sources'].items())
+                print(f"  {key:<24} {s['planted']:>8} {s['detected']:>9} {s['precision'] if s['precision'] is not None else '-':>10} "
+                      f"{s['recall']:>7} {s['seconds']:>8.3f} {s['peak_bytes'] / 1e6:>9.1f}  {sources}")
+    result = {'generated_at': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(), 'numpy': np.__version__,
+              'versions': _versions(), 'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'runs': reports}
+    output = output or os.path.join(ROOT, 'benchmarks', 'results', f"suite_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"wrote {output}")
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='合成図面による読み込み・解析・検出精度のベンチマーク')
+    parser.add_argument('sizes', nargs='*', type=int, help='図形定義ごとに配置する図形の数')
+    parser.add_argument('--noise', type=float, default=1.0, help='図形1つあたりのノイズのセル数')
+    parser.add_argument('--density', type=int, default=20, help='ノイズのセルごとの図形数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='結果のJSONファイル (既定: benchmarks/results/suite_<日時>.json)')
+    args = parser.parse_args()
+    main(args.sizes or DEFAULT_SIZES, args.noise, args.density, args.seed, args.output)
@@ -0,0 +1,53 @@
+"""テキスト探索: 全件を変換して走査する従来の検索と文字検索インデックス (text_index.TextIndex) の比較
+
+    python benchmarks/bench_text_index.py [TEXT数 ...]
+
+従来の方式は検索のたびに全ての TEXT を mojimoji で半角にし、pandas の str.contains で調べる。
+新しい方式はインデックスを一度だけ作り (プロジェクト作成時)、検索ごとに n-gram の候補だけを調べる。
+検索語ごとに一致した行が同じであることも確認する。
+"""
+import os
+import sys
+import time
+
+import mojimoji
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from entity_store import EntityTableBuilder
+from text_index import TextIndex
+
+DEFAULT_SIZES = [10_000, 50_000, 100_000]
+QUERIES = ['ＨＨ', 'hh-1', 'Ｐ', '信号', 'ケーブル', 'φ50', 'no-such-label']
+WORDS = ['信号柱', 'ケーブル', '制御機', 'HH', 'ＨＨ', 'Ｐ', 'φ50', 'VVF', '歩灯', '車灯', '撤去', '新設']
+
+def synthetic_texts(n, rng):
+    builder = EntityTableBuilder()
+    for k in range(n):
+        label = ''.join(rng.choice(WORDS, size=rng.integers(1, 4)))
+        builder.add_attribs('TEXT', {'text': f"{label}-{k}", 'insert': (float(k), 0.0, 0.0), 'height': 2.5})
+    return builder.build()
+
+def legacy_mask(table, query):
+    """従来の project_store.text_search_mask()"""
+    normalized_query = mojimoji.zen_to_han(query, kana=False)
+    search_series = pd.Series([mojimoji.zen_to_han(t, kana=False) for t in table.texts()], dtype=object)
+    return search_series.str.contains(normalized_query, case=False, na=False).to_numpy(dtype=bool)
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    print(f"{'texts':>8} {'build[s]':>9} {'old/query[ms]':>14} {'new/query[ms]':>14} {'speedup':>8}")
+    for n in sizes:
+        table = synthetic_texts(n, rng)
+        t0 = time.perf_counter(); index = TextIndex.from_table(table); t_build = time.perf_counter() - t0
+        t_old = t_new = 0.0
+        for query in QUERIES:
+            t0 = time.perf_counter(); old = legacy_mask(table, query); t_old += time.perf_counter() - t0
+            t0 = time.perf_counter(); new = index.mask(query); t_new += time.perf_counter() - t0
+            assert np.array_equal(old, new), query
+        t_old, t_new = t_old / len(QUERIES) * 1000, t_new / len(QUERIES) * 1000
+        print(f"{n:>8} {t_build:>9.2f} {t_old:>14.1f} {t_new:>14.2f} {t_old / t_new:>7.0f}x")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
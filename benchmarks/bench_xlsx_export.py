@@ -0,0 +1,98 @@
+"""Excel出力: pandas.ExcelWriter (openpyxl) による従来の出力、openpyxl の write-only モード、逐次出力 (xlsx_stream.py) の比較
+
+    python benchmarks/bench_xlsx_export.py [行数 ...]
+
+LINE/CIRCLE/ARC を合わせて指定の行数にした図面を、gid ごとの色番号の配列 (明細項目の色の割り当て結果と同じ形) を
+付けて出力し、以下を測る。
+- 最初のバイトまでの時間: 従来と write-only は保存し終えるまで送れないので全体の時間と同じ。
+  逐次出力は応答に最初のバイト列 (ブックの構成) を渡すまでと、最初の行を渡すまで
+- 全体の時間
+- メモリの最大使用量 (tracemalloc、時間とは別に計測)。逐次出力は受け取ったバイト列を捨てる (応答に書いたとみなす)
+小さな図面で、逐次出力したブックを読み戻した内容が table_frames() と一致することを確認する。
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from project_store import table_frames, table_sheets
+from synthetic import table_from_arrays
+from xlsx_stream import iter_xlsx
+
+DEFAULT_SIZES = [50_000, 200_000]
+
+def random_table(n, rng):
+    n_line, n_circle = int(n * 0.6), int(n * 0.2)
+    n_arc = n - n_line - n_circle
+    xyz = lambda k: np.column_stack([rng.uniform(0, 10_000, (k, 2)), np.zeros(k)])
+    return table_from_arrays(LINE={'start': xyz(n_line), 'end': xyz(n_line)}, CIRCLE={'center': xyz(n_circle), 'radius': rng.uniform(0.3, 2, n_circle)},
+                             ARC={'center': xyz(n_arc), 'radius': rng.uniform(0.3, 2, n_arc), 'start_angle': rng.uniform(0, 360, n_arc), 'end_angle': rng.uniform(0, 360, n_arc)})
+
+def pandas_export(table, colors):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for sheet_name, df_sheet in table_frames(table, colors).items(): df_sheet.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+def write_only_export(table, colors):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for sheet_name, header, chunks in table_sheets(table, colors):
+        ws = wb.create_sheet(sheet_name)
+        ws.append(header)
+        for columns in chunks:
+            for row in zip(*(v.tolist() if isinstance(v, np.ndarray) else v for v in columns.values())): ws.append(row)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def stream_export(table, colors, marks=None):
+    """逐次出力のバイト列を捨てながら受け取り、合計の大きさを返す。marks に最初の2つのバイト列を受け取った時刻を入れる"""
+    total = 0
+    for chunk in iter_xlsx(table_sheets(table, colors)):
+        if marks is not None and len(marks) < 2: marks.append(time.perf_counter())
+        total += len(chunk)
+    return total
+
+def _peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def check(rng):
+    table = random_table(2000, rng)
+    colors = rng.integers(1, 8, len(table))
+    got = pd.read_excel(io.BytesIO(b''.join(iter_xlsx(table_sheets(table, colors)))), sheet_name=None, dtype={'handle': str})
+    for sheet, expected in table_frames(table, colors).items():
+        actual = got[sheet]
+        assert list(actual.columns) == list(expected.columns) and len(actual) == len(expected), sheet
+        for col in expected.columns:
+            if expected[col].dtype.kind in 'iuf': assert np.array_equal(actual[col].to_numpy(), expected[col].to_numpy()), (sheet, col)
+            else: assert actual[col].fillna('').astype(str).tolist() == expected[col].astype(str).tolist(), (sheet, col)
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    check(rng)
+    print(f"{'rows':>8} {'xlsx[MB]':>9} {'pandas[s]':>10} {'write-only[s]':>14} {'stream[s]':>10} {'stream TTFB[ms]':>16} {'first rows[ms]':>15} "
+          f"{'pandas peak[MB]':>16} {'write-only peak':>16} {'stream peak':>12}")
+    for n in sizes:
+        table = random_table(n, rng)
+        colors = rng.integers(1, 8, len(table))
+        t0 = time.perf_counter(); data = pandas_export(table, colors); t_pandas = time.perf_counter() - t0
+        t0 = time.perf_counter(); write_only_export(table, colors); t_write_only = time.perf_counter() - t0
+        marks = []
+        t0 = time.perf_counter(); size = stream_export(table, colors, marks); t_stream = time.perf_counter() - t0
+        peaks = [_peak_bytes(lambda: fn(table, colors)) / 2**20 for fn in (pandas_export, write_only_export, stream_export)]
+        print(f"{n:>8} {size / 2**20:>9.1f} {t_pandas:>10.2f} {t_write_only:>14.2f} {t_stream:>10.2f} {(marks[0] - t0) * 1000:>16.1f} {(marks[1] - t0) * 1000:>15.1f} "
+              f"{peaks[0]:>16.0f} {peaks[1]:>16.0f} {peaks[2]:>12.1f}  (pandas xlsx {len(data) / 2**20:.1f}MB)")
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,175 @@
+"""ベンチマーク用の合成図面データ
+
+ezdxf を経由せずに EntityTable を直接組み立てる。各クラスタは円のアンカーの周囲に
+同心円・縦横の線分・円弧などをランダムに配置したもので、check_* 関数の判定条件の
+境界付近 (本数の過不足、わずかな傾きやずれ) が一定の割合で現れるようにしている。
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from entity_store import ENTITY_TYPES, GEOMETRY_COLUMNS, EntityTable
+
+def table_from_arrays(**geometry):
+    """種別ごとの幾何配列から EntityTable を作る (例: LINE={'start': ..., 'end': ...})"""
+    columns, next_handle = {}, 0x100
+    for etype in ENTITY_TYPES:
+        given = geometry.get(etype, {})
+        n = len(next(iter(given.values()))) if given else 0
+        cols = {'handle': np.arange(next_handle, next_handle + n, dtype=np.uint64), 'color': np.full(n, 256, dtype=np.int16)}
+        next_handle += n
+        for col, (_, dim, default) in GEOMETRY_COLUMNS[etype].items():
+            if col in given: cols[col] = np.asarray(given[col], dtype=np.float64).reshape((n, dim) if dim else (n,))
+            else: cols[col] = np.full((n, dim) if dim else n, default or 0.0, dtype=np.float64)
+        columns[etype] = cols  # 文字列の列は EntityTable が既定値 (レイヤー '0' など) で補う
+    columns['TEXT']['text_offsets'] = np.zeros(columns['TEXT']['handle'].size + 1, dtype=np.int64)
+    columns['TEXT']['text_data'] = np.zeros(0, dtype=np.uint8)
+    return EntityTable(columns, ['0', 'BYLAYER', 'Standard'])
+
+def _xyz(xy):
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    return np.column_stack([xy, np.zeros(len(xy))])
+
+def random_clusters(n_clusters, rng, spacing=40.0):
+    """円アンカーを中心とするランダムなクラスタを格子状に並べた EntityTable を作る"""
+    lines_s, lines_e, circ_c, circ_r, arc_c, arc_r = [], [], [], [], [], []
+    side = int(np.ceil(np.sqrt(n_clusters)))
+    for k in range(n_clusters):
+        p = np.array([k % side, k // side], dtype=np.float64) * spacing + rng.uniform(-2, 2, 2)
+        r = rng.uniform(0.5, 1.5)
+        circ_c.append(p); circ_r.append(r)
+        if rng.random() < 0.4:  # 同心円 (ときどき少しずらす)
+            circ_c.append(p + rng.normal(0, 0.08, 2)); circ_r.append(r * rng.uniform(0.4, 0.8))
+        if rng.random() < 0.3:  # 別の円とそれを結ぶ線分
+            q = p + rng.uniform(-3, 3, 2) * r
+            circ_c.append(q); circ_r.append(rng.uniform(0.5, 1.5))
+            jitter = rng.normal(0, 0.05 * r, (2, 2))
+            lines_s.append(p + jitter[0]); lines_e.append(q + jitter[1])
+        for _ in range(rng.integers(0, 9)):  # 縦横 (わずかな傾き込み) またはランダムな線分
+            length = rng.uniform(0.5, 2.5) * r
+            kind = rng.random()
+            if kind < 0.4: d = np.array([length, rng.normal(0, 0.08 * length)])
+            elif kind < 0.8: d = np.array([rng.normal(0, 0.08 * length), length])
+            else: d = rng.normal(0, length, 2)
+            s = p + rng.uniform(-1.2, 1.2, 2) * r
+            lines_s.append(s); lines_e.append(s + d)
+        for _ in range(rng.integers(0, 3)):
+            arc_c.append(p + rng.uniform(-1.2, 1.2, 2) * r); arc_r.append(rng.uniform(0.2, 0.8) * r)
+        if rng.random() < 0.2:  # 四角形 (ハンドホール候補)
+            w, h = rng.uniform(0.5, 2, 2) * r
+            corners = p + np.array([[3, 3], [3 + w, 3], [3 + w, 3 + h], [3, 3 + h]]) + rng.normal(0, 0.03, (4, 2))
+            for i in range(4):
+                lines_s.append(corners[i]); lines_e.append(corners[(i + 1) % 4])
+    return table_from_arrays(
+        LINE={'start': _xyz(lines_s), 'end': _xyz(lines_e)},
+        CIRCLE={'center': _xyz(circ_c), 'radius': circ_r},
+        ARC={'center': _xyz(arc_c), 'radius': arc_r, 'start_angle': np.zeros(len(arc_r)), 'end_angle': np.full(len(arc_r), 180.0)},
+    )
+
+def write_dxf(table, path):
+    """EntityTable の LINE/CIRCLE/ARC を ezdxf で DXF ファイルに書き出す"""
+    import ezdxf
+    doc = ezdxf.new(dxfversion="R2010")
+    msp = doc.modelspace()
+    lines, circles, arcs = table.columns['LINE'], table.columns['CIRCLE'], table.columns['ARC']
+    for s, e in zip(lines['start'].tolist(), lines['end'].tolist()): msp.add_line(s, e)
+    for c, r in zip(circles['center'].tolist(), circles['radius'].tolist()): msp.add_circle(c, r)
+    for c, r, a0, a1 in zip(arcs['center'].tolist(), arcs['radius'].tolist(), arcs['start_angle'].tolist(), arcs['end_angle'].tolist()): msp.add_arc(c, r, a0, a1)
+    doc.saveas(path)
+
+def revise(table, fraction, rng, shift=3.0):
+    """図形の fraction の割合を変更した改訂版の EntityTable を作る (半分を移動、1/4 を削除、1/4 ぶんを別の場所に複製して追加)
+
+    変更しない図形はハンドルも幾何も元のまま、追加した図形には新しいハンドルを振る。
+    """
+    columns = {}
+    next_handle = int(max((table.columns[t]['handle'].max(initial=0) for t in ENTITY_TYPES), default=0)) + 1
+    for etype in ENTITY_TYPES:
+        cols, n = table.columns[etype], table.counts[etype]
+        if etype == 'TEXT' or not n:
+            columns[etype] = dict(cols); continue
+        k = int(round(n * fraction))
+        picked = rng.choice(n, size=k, replace=False)
+        moved, deleted, copied = picked[:k // 2], picked[k // 2:k // 2 + k // 4], picked[k // 2 + k // 4:]
+        offset = np.append(rng.uniform(-shift, shift, 2), 0.0)
+        new = {col: arr.copy() for col, arr in cols.items()}
+        for col, (_, dim, _) in GEOMETRY_COLUMNS[etype].items():
+            if dim: new[col][moved] += offset
+        keep = np.ones(n, dtype=bool); keep[deleted] = False
+        added = {col: arr[copied].copy() for col, arr in cols.items()}
+        for col, (_, dim, _) in GEOMETRY_COLUMNS[etype].items():
+            if dim: added[col] += rng.uniform(-shift, shift, (len(copied), 1)) * np.array([1.0, 1.0, 0.0])
+        added['handle'] = np.arange(next_handle, next_handle + len(copied), dtype=np.uint64); next_handle += len(copied)
+        columns[etype] = {col: np.concatenate([new[col][keep], added[col]]) for col in cols}
+    return EntityTable(columns, table.strings)
+
+# --- 図形定義ごとの既知の図形 (plant_shapes で配置する) ---
+# 基準の半径 r (円アンカーの半径、円弧・線分アンカーは大きさ) で、中心 (0, 0) からの相対座標を返す。
+# 各図形は対応する check_* 関数の条件を満たし、検索半径内に余分な図形を含まない。
+# 円弧は (中心, 半径)、線分は (始点, 終点)、円は (中心, 半径) のリスト。
+
+def _h_arcs(y, r, x0=2.0, step=1.6, n=3):
+    return [((r * (x0 + step * i), r * y), 0.8 * r) for i in range(n)]
+
+SHAPE_TEMPLATES = {
+    'dedicated_pole': lambda r: {'CIRCLE': [((0, 0), r), ((0, 0), 0.6 * r)]},
+    'kanden_pole': lambda r: {'CIRCLE': [((0, 0), r)], 'LINE': [((0.5 * r, 0), (0.5 * r, r)), ((0.5 * r, 0), (1.5 * r, 0))]},
+    'lighting_pole': lambda r: {'CIRCLE': [((0, 0), r)], 'ARC': [((0, 0.3 * r), 0.5 * r)],
+                                'LINE': [((-0.4 * r, -0.3 * r), (0.4 * r, -0.3 * r)), ((-0.3 * r, -0.4 * r), (-0.3 * r, 0.4 * r)), ((0.3 * r, -0.4 * r), (0.3 * r, 0.4 * r))]},
+    'lighting_type3': lambda r: {'CIRCLE': [((0, 0), r), ((0, 0), 0.6 * r)], 'LINE': [((r, 0), (1.8 * r, 0)), ((-r, 0), (-1.8 * r, 0))]},
+    'lighting_type2': lambda r: {'CIRCLE': [((0, 0), r), ((3 * r, 0), r)], 'LINE': [((0, 0), (3 * r, 0))]},
+    'traffic_light_h3': lambda r: {'CIRCLE': [((0, 0), r)], 'ARC': _h_arcs(3, r), 'LINE': [((0, r), (2 * r, 2.2 * r))]},
+    'traffic_light_h3_double': lambda r: {'CIRCLE': [((0, 0), r)], 'ARC': _h_arcs(3, r) + _h_arcs(-3, r), 'LINE': [((0, r), (2 * r, 2.2 * r))]},
+    'light_box_only_h3': lambda r: {'ARC': [((1.4 * r * i, 0), r) for i in range(3)]},
+    'traffic_light_v3': lambda r: {'CIRCLE': [((0, 0), r)], 'ARC': [((3 * r, r * (2 + 1.6 * i)), 0.8 * r) for i in range(3)], 'LINE': [((r, 0), (2.2 * r, 2 * r))]},
+    'advance_light': lambda r: {'CIRCLE': [((0, 0), r)], 'ARC': _h_arcs(3, r, n=2)},
+    'arrow_light_straight': lambda r: {'ARC': [((0.8 * r * i, 0), r) for i in range(3)] + [((0.8 * r, 0.2 * r), 0.4 * r)]},
+    'pedestrian_light_clasp': lambda r: {'CIRCLE': [((0, 0), r)], 'LINE': [
+        seg for x0 in (1.5 * r, -2.5 * r) for seg in (((x0, -0.5 * r), (x0 + r, -0.5 * r)), ((x0, 0.5 * r), (x0 + r, 0.5 * r)),
+                                                      ((x0, -0.5 * r), (x0, 0.5 * r)), ((x0 + r, -0.5 * r), (x0 + r, 0.5 * r)))]},
+    'controller': lambda r: {'CIRCLE': [((0, 0), r)], 'LINE': [((-1.2 * r, -1.2 * r), (1.2 * r, -1.2 * r)), ((-1.2 * r, 1.2 * r), (1.2 * r, 1.2 * r)),
+                                                              ((-1.2 * r, -1.2 * r), (-1.2 * r, 1.2 * r)), ((1.2 * r, -1.2 * r), (1.2 * r, 1.2 * r)),
+                                                              ((-1.5 * r, -0.3 * r), (1.5 * r, 0.3 * r))]},
+    'accessory_device': lambda r: {'CIRCLE': [((0, 0), r)], 'LINE': [((-r, 0), (r, 0))] + [((x, -0.5 * r), (x + 0.3 * r, -0.8 * r)) for x in (-0.6 * r, -0.2 * r, 0.2 * r, 0.6 * r)]},
+    'sensor_arm': lambda r: {'CIRCLE': [((0, 0), r)], 'LINE': [((r, 0), (6 * r, 0))], 'ARC': [((8 * r, 0), 0.5 * r)]},
+    'handhole': lambda r: {'LINE': [((0, 0), (1.6 * r, 0)), ((0, r), (1.6 * r, r)), ((0, 0), (0, r)), ((1.6 * r, 0), (1.6 * r, r))]},
+}
+
+def plant_shapes(instances, rng, noise_ratio=1.0, density=20, spacing=50.0, shape_keys=None):
+    """図形定義ごとに instances 個の既知の図形と、ノイズの図形を格子状のセルに配置した EntityTable を作る
+
+    セルの数は (図形数) × (1 + noise_ratio) で、図形を置かないセルにはランダムな線分・円・円弧を
+    density 個ずつ置く。図形とノイズは検索半径 (最大 15r) より十分離れる。
+    (table, owner, planted) を返す。owner は gid ごとの図形の番号 (ノイズは -1)、planted は番号ごとの図形キー。
+    """
+    shape_keys = list(shape_keys or SHAPE_TEMPLATES)
+    planted = [k for k in shape_keys for _ in range(instances)]
+    n_noise = int(round(len(planted) * noise_ratio))
+    side = int(np.ceil(np.sqrt(len(planted) + n_noise)))
+    cells = rng.permutation(side * side)[:len(planted) + n_noise]
+    parts = {'LINE': ([], [], []), 'CIRCLE': ([], [], []), 'ARC': ([], [], [])}  # (幾何, 幾何, 図形の番号)
+    for i, cell in enumerate(cells):
+        p = np.array([cell % side, cell // side], dtype=np.float64) * spacing + rng.uniform(-2, 2, 2)
+        if i < len(planted):
+            shape = SHAPE_TEMPLATES[planted[i]](rng.uniform(0.8, 1.2))
+            for etype, items in shape.items():
+                for a, b in items:
+                    if etype == 'LINE': parts[etype][0].append(p + a); parts[etype][1].append(p + b)
+                    else: parts[etype][0].append(p + a); parts[etype][1].append(b)
+                    parts[etype][2].append(i)
+            continue
+        for _ in range(density):
+            q, kind = p + rng.uniform(-15, 15, 2), rng.random()
+            etype = 'LINE' if kind < 0.6 else 'CIRCLE' if kind < 0.8 else 'ARC'
+            if etype == 'LINE': parts[etype][0].append(q); parts[etype][1].append(q + rng.normal(0, 1.5, 2))
+            else: parts[etype][0].append(q); parts[etype][1].append(rng.uniform(0.3, 1.5))
+            parts[etype][2].append(-1)
+    (ls, le, lo), (cc, cr, co), (ac, ar, ao) = parts['LINE'], parts['CIRCLE'], parts['ARC']
+    table = table_from_arrays(
+        LINE={'start': _xyz(ls), 'end': _xyz(le)},
+        CIRCLE={'center': _xyz(cc), 'radius': cr},
+        ARC={'center': _xyz(ac), 'radius': ar, 'start_angle': np.zeros(len(ar)), 'end_angle': np.full(len(ar), 180.0)},
+    )
+    return table, np.array(lo + co + ao, dtype=np.int64), planted
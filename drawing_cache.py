@@ -0,0 +1,94 @@
+import hashlib
+import os
+import threading
+
+from entity_store import FORMAT_VERSION, EntityTable
+
+# --- 解析済み図面のキャッシュ ---
+# アップロードされたDXFの内容 (SHA-256) をキーに、変換済みの EntityTable を .npz として
+# uploads 配下に保存する。同じ図面を選び直して再解析するときはDXFの読み込みを省略できる。
+# 合計サイズが上限を超えたら、最後に使われた時刻 (ファイルの更新時刻) の古い順に削除する。
+
+HASH_CHUNK_SIZE = 1 << 20
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''): digest.update(chunk)
+    return digest.hexdigest()
+
+def save_upload(file_storage, path):
+    """アップロードを書き出しながら SHA-256 を計算し、16進文字列を返す"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: file_storage.stream.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk); f.write(chunk)
+    return digest.hexdigest()
+
+class DrawingCache:
+    """内容ハッシュ -> EntityTable のディスクキャッシュ (サイズ上限付き LRU)"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory, self.max_bytes = directory, max_bytes
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}-v{FORMAT_VERSION}.npz")
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'): continue
+            try: st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError: continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def load(self, key):
+        """キャッシュがあれば EntityTable を返し、最終使用時刻を更新する。無ければ None"""
+        path = self._path(key)
+        try:
+            table = EntityTable.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            with self._lock: self.misses += 1
+            return None
+        with self._lock: self.hits += 1
+        return table
+
+    def store(self, key, table):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f: table.save(f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_build(self, key, build):
+        """キャッシュにあればそれを、無ければ build() で作って保存したものを返す"""
+        table = self.load(key)
+        if table is None:
+            table = build()
+            self.store(key, table)
+        return table
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes: break
+            try: os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError: pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self._entries():
+            try: os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError: pass
+        with self._lock: self.hits = self.misses = 0
+
+    def stats(self):
+        entries = self._entries()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes}
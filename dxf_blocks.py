@@ -0,0 +1,230 @@
+import json
+
+import numpy as np
+
+from entity_store import ENTITY_TYPES, GEOMETRY_COLUMNS, INSERT_COLUMNS, EntityTableBuilder
+
+# --- ブロック参照 (INSERT) の展開 ---
+# 灯器や柱などの記号はブロック定義として描かれ、モデル空間には INSERT (ブロック名・挿入点・尺度・回転) だけが並ぶ。
+# ezdxf の explode() / virtual_entities() のように参照ごとに図形を作り直すと、1万件の参照で数十万回の変換になる。
+# ここではブロック定義ごとに図形 (入れ子のブロックも展開したもの) を1度だけ列の配列にしてキャッシュし、
+# 同じブロックへの参照すべての変換 (回転・尺度・平行移動) を NumPy でまとめて適用する。
+# 展開した図形のハンドルはモデル空間の INSERT のハンドルとし、block の列に由来のブロック名の経路を入れる。
+# 押し出し方向 (OCS) は Z 軸のみ、ATTRIB (属性の文字) は対象外。
+
+BLOCK_SEPARATOR = '/'  # ブロック名の経路の区切り (AutoCAD のブロック名には使えない文字)
+
+class BlockDefinition:
+    """BLOCKS セクションの1ブロック: 基点と、定義内の図形の (種別, 属性) のリスト"""
+
+    def __init__(self, base_point=(0.0, 0.0, 0.0)):
+        self.base_point = base_point
+        self.records = []
+
+class Geometry:
+    """ブロック定義を展開した図形の列 (種別 -> 列名 -> 配列)、TEXT の文字列、入れ子のブロック参照の一覧"""
+
+    def __init__(self, columns, texts, inserts):
+        self.columns, self.texts, self.inserts = columns, texts, inserts
+
+    @classmethod
+    def concatenate(cls, parts):
+        columns = {t: {col: np.concatenate([p.columns[t][col] for p in parts]) for col in parts[0].columns[t]} for t in ENTITY_TYPES}
+        inserts = {col: np.concatenate([p.inserts[col] for p in parts]) for col in INSERT_COLUMNS}
+        return cls(columns, [s for p in parts for s in p.texts], inserts)
+
+class Transforms:
+    """同じブロックへの k 件の参照の変換: p' = M (p - 基点) + 挿入点 (Z は尺度だけ) と、参照の属性 (ByBlock の解決に使う)"""
+
+    def __init__(self, matrix, z_scale, offset, insert, handle, color, layer, linetype):
+        self.matrix, self.z_scale, self.offset, self.insert = matrix, z_scale, offset, insert
+        self.handle, self.color, self.layer, self.linetype = handle, color, layer, linetype
+
+    def __len__(self):
+        return len(self.offset)
+
+    def points(self, p):
+        """(n, 3) の座標を (k * n, 3) に変換する (参照ごとに n 件ずつ並ぶ)"""
+        xy = np.einsum('kij,nj->kni', self.matrix, p[:, :2]) + self.offset[:, None, :2]
+        z = p[None, :, 2] * self.z_scale[:, None] + self.offset[:, None, 2]
+        return np.concatenate([xy, z[:, :, None]], axis=2).reshape(-1, 3)
+
+    def directions(self, degrees):
+        """角度 (度) の向きの単位ベクトルを変換し、(変換後の角度 (k, n), 長さの倍率 (k, n)) を返す"""
+        rad = np.radians(degrees)
+        d = np.einsum('kij,nj->kni', self.matrix, np.column_stack([np.cos(rad), np.sin(rad)]))
+        return np.degrees(np.arctan2(d[..., 1], d[..., 0])) % 360.0, np.hypot(d[..., 0], d[..., 1])
+
+    @property
+    def det(self):
+        return self.matrix[:, 0, 0] * self.matrix[:, 1, 1] - self.matrix[:, 0, 1] * self.matrix[:, 1, 0]
+
+class BlockExpander:
+    """ブロック定義の展開結果をブロック名ごとにキャッシュし、参照に一括で配置する"""
+
+    def __init__(self, builder, blocks, stats=None):
+        self.builder, self.blocks, self.stats = builder, blocks, stats
+        self.cache, self.visiting, self.names = {}, set(), []
+        self.layer0, self.byblock = builder._code('0'), builder._code('BYBLOCK')
+
+    def _string(self, code):
+        """文字列表のコードから文字列を引く (builder の文字列表は追加順にコードを振る)"""
+        if code >= len(self.names): self.names = list(self.builder.strings)
+        return self.names[code]
+
+    def transforms(self, refs, base_point):
+        """INSERT の属性のリストから変換を作る。MINSERT (行・列の配列) は1件ずつの参照に展開する"""
+        get = lambda name, default: np.array([r.get(name, default) for r in refs], dtype=np.float64)
+        insert = np.array([(tuple(r.get('insert', ())) + (0.0, 0.0, 0.0))[:3] for r in refs], dtype=np.float64).reshape(-1, 3)
+        sx, sy, sz, rotation = get('xscale', 1.0), get('yscale', 1.0), get('zscale', 1.0), np.radians(get('rotation', 0.0))
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        handle = np.array([int(r['handle'], 16) if r.get('handle') else 0 for r in refs], dtype=np.uint64)
+        color = np.array([int(r.get('color', 256)) for r in refs], dtype=np.int16)
+        layer = np.array([self.builder._code(r.get('layer', '0')) for r in refs], dtype=np.int32)
+        linetype = np.array([self.builder._code(r.get('linetype', 'BYLAYER')) for r in refs], dtype=np.int32)
+        columns, rows = get('column_count', 1).astype(np.int64).clip(1), get('row_count', 1).astype(np.int64).clip(1)
+        cells = columns * rows
+        idx = np.repeat(np.arange(len(refs)), cells)
+        if len(idx) != len(refs):  # MINSERT: 回転した座標系で列・行の間隔ずつずらす
+            j = np.arange(len(idx)) - np.repeat(np.cumsum(cells) - cells, cells)
+            dx, dy = (j % columns[idx]) * get('column_spacing', 0.0)[idx], (j // columns[idx]) * get('row_spacing', 0.0)[idx]
+            insert = insert[idx] + np.column_stack([cos[idx] * dx - sin[idx] * dy, sin[idx] * dx + cos[idx] * dy, np.zeros(len(idx))])
+            sx, sy, sz, cos, sin = sx[idx], sy[idx], sz[idx], cos[idx], sin[idx]
+            handle, color, layer, linetype = handle[idx], color[idx], layer[idx], linetype[idx]
+        matrix = np.stack([np.column_stack([cos * sx, -sin * sy]), np.column_stack([sin * sx, cos * sy])], axis=1)
+        base = np.asarray(base_point, dtype=np.float64)
+        offset = insert - np.column_stack([matrix @ base[:2], sz * base[2]])
+        return Transforms(matrix, sz, offset, insert, handle, color, layer, linetype)
+
+    def flatten(self, name):
+        """ブロック定義の図形 (入れ子のブロックを展開済み、ブロックの座標系) を返す。定義が無いか循環する場合は None"""
+        if name in self.cache: return self.cache[name]
+        block = self.blocks.get(name)
+        if block is None or name in self.visiting: return None
+        self.visiting.add(name)
+        sub = EntityTableBuilder(self.builder.strings)
+        nested = {}
+        for etype, attribs in block.records:
+            if etype == 'INSERT': nested.setdefault(attribs.get('name', ''), []).append(attribs); continue
+            try: sub.add_attribs(etype, {**attribs, 'block': name})
+            except (TypeError, ValueError):
+                if self.stats: self.stats.invalid += 1
+        columns = sub.build_columns()
+        for cols in columns.values():
+            cols.pop('text_offsets', None); cols.pop('text_data', None)
+        texts = [chunk.decode('utf-8') for chunk in sub.text_chunks]
+        parts = [Geometry(columns, texts, _empty_inserts())]
+        for child, refs in nested.items():
+            geometry = self.flatten(child)
+            if geometry is None: continue
+            parts.append(self.place(geometry, self.transforms(refs, self.blocks[child].base_point), child, prefix=name))
+        self.visiting.discard(name)
+        self.cache[name] = Geometry.concatenate(parts)
+        return self.cache[name]
+
+    def place(self, geometry, t, name, prefix=None):
+        """展開済みのブロックの図形を k 件の参照に配置する。prefix は入れ子の場合の親ブロックの名前"""
+        k = len(t)
+        columns = {}
+        for etype, cols in geometry.columns.items():
+            n = len(cols['color'])
+            out = {'handle': np.repeat(t.handle, n)}
+            color = np.broadcast_to(cols['color'], (k, n))
+            out['color'] = np.where(color == 0, t.color[:, None], color).ravel()  # ByBlock (0) は参照の色
+            layer = np.broadcast_to(cols['layer'], (k, n))
+            out['layer'] = np.where(layer == self.layer0, t.layer[:, None], layer).ravel()  # レイヤー '0' の図形は参照のレイヤー
+            linetype = np.broadcast_to(cols['linetype'], (k, n))
+            out['linetype'] = np.where(linetype == self.byblock, t.linetype[:, None], linetype).ravel()
+            out['block'] = np.tile(self._prefixed(cols['block'], prefix), k)
+            if etype == 'TEXT': out['style'] = np.tile(cols['style'], k)
+            for col, (_, dim, _) in GEOMETRY_COLUMNS[etype].items():
+                if dim: out[col] = t.points(cols[col])
+            if etype in ('CIRCLE', 'ARC'):
+                out['radius'] = (np.sqrt(np.abs(t.det))[:, None] * cols['radius'][None, :]).ravel()
+            if etype == 'ARC':
+                start, _ = t.directions(cols['start_angle'])
+                end, _ = t.directions(cols['end_angle'])
+                mirrored = (t.det < 0)[:, None]  # 鏡像では反時計回りの向きが逆になるので始点と終点を入れ替える
+                out['start_angle'], out['end_angle'] = np.where(mirrored, end, start).ravel(), np.where(mirrored, start, end).ravel()
+            if etype == 'TEXT':
+                rotation, length = t.directions(cols['rotation'])
+                out['rotation'] = rotation.ravel()
+                out['height'] = (cols['height'][None, :] * np.abs(t.det)[:, None] / length).ravel()  # 文字の向きに垂直な方向の倍率
+            columns[etype] = out
+        m = len(geometry.inserts['handle'])
+        inserts = {'handle': np.concatenate([t.handle, np.repeat(t.handle, m)]),
+                   'block': np.concatenate([np.full(k, self.builder._code(_join(prefix, name)), dtype=np.int32),
+                                            np.tile(self._prefixed(geometry.inserts['block'], prefix), k)]),
+                   'insert': np.concatenate([t.insert, t.points(geometry.inserts['insert'])])}
+        return Geometry(columns, geometry.texts * k, inserts)
+
+    def _prefixed(self, codes, prefix):
+        """ブロック名の経路のコードの先頭に親ブロックの名前を付ける"""
+        if prefix is None or not len(codes): return codes
+        uniq, inverse = np.unique(codes, return_inverse=True)
+        mapped = np.array([self.builder._code(_join(prefix, self._string(c))) for c in uniq.tolist()], dtype=np.int32)
+        return mapped[inverse.ravel()]
+
+def _join(prefix, name):
+    return f"{prefix}{BLOCK_SEPARATOR}{name}" if prefix else name
+
+def _empty_inserts():
+    return {col: np.zeros((0, dim) if dim else 0, dtype=np.dtype(typecode)) for col, (typecode, dim) in INSERT_COLUMNS.items()}
+
+def expand_inserts(builder, blocks, inserts, stats=None):
+    """モデル空間の INSERT の属性のリストを、ブロックごとにまとめて展開して builder に追加する"""
+    expander = BlockExpander(builder, blocks, stats)
+    by_name = {}
+    for attribs in inserts: by_name.setdefault(attribs.get('name', ''), []).append(attribs)
+    for name, refs in by_name.items():
+        geometry = expander.flatten(name)
+        if geometry is None:
+            if stats: stats.invalid += len(refs)
+            continue
+        placed = expander.place(geometry, expander.transforms(refs, blocks[name].base_point), name)
+        for etype in ENTITY_TYPES: builder.extend(etype, placed.columns[etype], placed.texts)
+        builder.extend('INSERT', placed.inserts)
+        if stats:
+            stats.inserts += len(refs); stats.expanded += sum(len(c['handle']) for c in placed.columns.values())
+    return expander
+
+# --- ブロック名による数量の集計 ---
+# 機器の記号が決まったブロックで描かれている図面では、ブロック名と図形キーの対応表 (JSON: {"ブロック名": "図形キー"}) を
+# 渡すと、そのブロックの参照を形状の判定をせずに数える。対応付けたブロックを展開した図形は形状の判定から除くので、
+# 同じ機器を二重に数えることはない。入れ子の場合は最も外側の対応付けたブロックだけを数える。
+
+def load_block_shapes(path, shape_keys):
+    """ブロック名 -> 図形キーの対応表 (JSON) を読み込む。未知の図形キーがあれば ValueError"""
+    with open(path, encoding='utf-8') as f: block_shapes = json.load(f)
+    unknown = sorted({k for k in block_shapes.values() if k not in shape_keys})
+    if unknown: raise ValueError(f"ブロックの対応表に未知の図形キーがあります: {', '.join(unknown)}")
+    return block_shapes
+
+def split_block_shapes(table, block_shapes, shape_keys):
+    """(対応付けたブロックの図形を除いた EntityTable, 図形キー -> 数えたブロック参照のハンドル配列) を返す"""
+    mapped = {b: k for b, k in block_shapes.items() if k in shape_keys}
+    if not mapped or not len(table.inserts['handle']): return table, {}
+    # 文字列表のコードごとに、経路の中で最も外側の対応付けたブロックの位置 (無ければ -1)
+    outermost = np.full(len(table.strings), -1, dtype=np.int64)
+    for code, path in enumerate(table.strings):
+        for depth, name in enumerate(path.split(BLOCK_SEPARATOR) if path else ()):
+            if name in mapped: outermost[code] = depth; break
+    keep = np.concatenate([outermost[table.columns[t]['block']] < 0 for t in ENTITY_TYPES])
+    paths = table.inserts['block']
+    depth = np.array([s.count(BLOCK_SEPARATOR) for s in table.strings], dtype=np.int64)
+    counted = outermost[paths] == depth[paths]  # 参照自身が最も外側の対応付けたブロック
+    found = {}
+    for code in np.unique(paths[counted]).tolist():
+        shape_key = mapped[table.strings[code].rsplit(BLOCK_SEPARATOR, 1)[-1]]
+        found.setdefault(shape_key, []).append(table.inserts['handle'][paths == code][counted[paths == code]])
+    found = {k: np.concatenate(v) for k, v in found.items()}
+    return (table if keep.all() else table.subset(keep)), found
+
+def add_block_counts(results, found):
+    """ブロック名で数えた参照を解析結果 (図形キー -> {'count', 'handles', ...}) に加える"""
+    for shape_key, handles in found.items():
+        if shape_key not in results: continue
+        results[shape_key]['count'] += len(handles)
+        results[shape_key]['handles'] = results[shape_key]['handles'] + [format(h, 'X') for h in handles.tolist()]
+        results[shape_key]['block_count'] = len(handles)
+    return results
@@ -0,0 +1,139 @@
+from ezdxf.lldxf.const import DXFStructureError
+from ezdxf.lldxf.encoding import decode_dxf_unicode, has_dxf_unicode
+from ezdxf.tools.codepage import toencoding
+
+from dxf_blocks import BlockDefinition, expand_inserts
+from entity_store import EntityTableBuilder
+from metrics import metrics
+
+# --- DXFの逐次読み込み ---
+# ezdxf.readfile() は図面全体 (ブロック定義・オブジェクト・全エンティティ) をメモリに展開するため、
+# 大きな測量図面では数GBに達する。ここでは ASCII DXF のタグ (グループコードと値の2行) を
+# 先頭から1度だけ読み、ENTITIES セクションのうち解析・明細書で使う種別と属性だけを
+# EntityTableBuilder に渡す。読み込み中に保持するのは処理中の1図形分のタグだけである。
+# BLOCKS セクションのブロック定義と ENTITIES の INSERT は保持しておき、最後に dxf_blocks.expand_inserts() で
+# ブロックごとにまとめて展開する。
+# バイナリDXFは対象外 (read_entity_table() が ezdxf.readfile() にフォールバックする)。
+
+BINARY_DXF_SIGNATURE = b'AutoCAD Binary DXF'
+
+# 種別ごとに取り出すグループコード -> (属性名, 座標の成分 (0:X 1:Y 2:Z)、None は実数、'str'/'int' は文字列/整数)
+GROUP_CODES = {
+    'LINE': {10: ('start', 0), 20: ('start', 1), 30: ('start', 2), 11: ('end', 0), 21: ('end', 1), 31: ('end', 2)},
+    'CIRCLE': {10: ('center', 0), 20: ('center', 1), 30: ('center', 2), 40: ('radius', None)},
+    'ARC': {10: ('center', 0), 20: ('center', 1), 30: ('center', 2), 40: ('radius', None), 50: ('start_angle', None), 51: ('end_angle', None)},
+    'TEXT': {10: ('insert', 0), 20: ('insert', 1), 30: ('insert', 2), 40: ('height', None), 50: ('rotation', None), 7: ('style', 'str'), 1: ('text', 'str')},
+}
+COMMON_CODES = {5: ('handle', 'str'), 8: ('layer', 'str'), 6: ('linetype', 'str'), 62: ('color', 'int')}
+# ブロック参照 (MINSERT の行・列を含む) とブロック定義の開始・終了
+INSERT_CODES = {2: ('name', 'str'), 10: ('insert', 0), 20: ('insert', 1), 30: ('insert', 2), 41: ('xscale', None), 42: ('yscale', None), 43: ('zscale', None),
+                50: ('rotation', None), 70: ('column_count', 'int'), 71: ('row_count', 'int'), 44: ('column_spacing', None), 45: ('row_spacing', None)}
+ENTITY_RECORD_CODES = {**GROUP_CODES, 'INSERT': INSERT_CODES}
+BLOCK_RECORD_CODES = {**ENTITY_RECORD_CODES, 'BLOCK': {2: ('name', 'str'), 10: ('base_point', 0), 20: ('base_point', 1), 30: ('base_point', 2)}, 'ENDBLK': {}}
+
+def is_binary_dxf(path):
+    with open(path, 'rb') as f: return f.read(len(BINARY_DXF_SIGNATURE)) == BINARY_DXF_SIGNATURE
+
+def iter_tags(stream):
+    """(グループコード, 値のバイト列) を順に返す"""
+    for code_line in stream:
+        value = stream.readline()
+        if not value: raise DXFStructureError("DXFファイルが途中で終わっています")
+        try: code = int(code_line)
+        except ValueError: raise DXFStructureError(f"不正なグループコード: {code_line!r}")
+        yield code, value.rstrip(b'\r\n')
+
+class StreamStats:
+    """逐次読み込みで数えた件数 (取り込んだ図形、対象外の種別、ペーパー空間、不正な値、展開したブロック参照とその図形)"""
+
+    def __init__(self):
+        self.kept = self.skipped_types = self.paperspace = self.invalid = self.inserts = self.expanded = 0
+
+    def as_dict(self):
+        return {'kept': self.kept, 'skipped_types': self.skipped_types, 'paperspace': self.paperspace, 'invalid': self.invalid,
+                'inserts': self.inserts, 'expanded': self.expanded}
+
+def make_decoder(encoding, version):
+    """文字列の値 (バイト列) を str にする関数。R2007 (AC1021) 以降は UTF-8、それより前は \\U+XXXX の表記も戻す"""
+    if version >= 'AC1021': encoding = 'utf-8'
+    decode_unicode = version < 'AC1021'
+
+    def decode(value):
+        s = value.decode(encoding, errors='replace')
+        return decode_dxf_unicode(s) if decode_unicode and has_dxf_unicode(s) else s
+    return decode
+
+def iter_records(tags, decode, record_codes, stats):
+    """セクション内のレコードを ENDSEC まで読み、record_codes にある種別ごとに (種別, 属性, ペーパー空間か) を返す"""
+    etype, codes, attribs, points, paperspace = None, None, None, None, False
+    for code, value in tags:
+        if code == 0:
+            if etype is not None:
+                for name, xyz in points.items(): attribs[name] = tuple(xyz)
+                yield etype, attribs, paperspace
+            if value == b'ENDSEC': return
+            name = value.decode('ascii', 'replace')
+            if name in record_codes:
+                etype, codes, attribs, points, paperspace = name, record_codes[name], {}, {}, False
+            else:
+                etype = None; stats.skipped_types += 1
+            continue
+        if etype is None: continue
+        if code == 67: paperspace = value.strip() == b'1'; continue
+        target = codes.get(code) or COMMON_CODES.get(code)
+        if target is None: continue
+        name, kind = target
+        try:
+            if kind == 'str': attribs[name] = decode(value)
+            elif kind == 'int': attribs[name] = int(value)
+            elif kind is None: attribs[name] = float(value)
+            else: points.setdefault(name, [0.0, 0.0, 0.0])[kind] = float(value)
+        except ValueError: etype = None; stats.invalid += 1
+
+def read_blocks(records):
+    """BLOCKS セクションのレコードからブロック名 -> BlockDefinition を作る"""
+    blocks, current = {}, None
+    for etype, attribs, _ in records:
+        if etype == 'BLOCK': current = blocks[attribs.get('name', '')] = BlockDefinition(attribs.get('base_point', (0.0, 0.0, 0.0)))
+        elif etype == 'ENDBLK': current = None
+        elif current is not None: current.records.append((etype, attribs))
+    return blocks
+
+def stream_entities(stream, builder, stats=None):
+    """ASCII DXF のバイナリストリームからモデル空間の LINE/CIRCLE/ARC/TEXT (INSERT は展開したもの) を builder に追加する"""
+    stats = stats or StreamStats()
+    tags = iter_tags(stream)
+    encoding, version, header_var = 'cp1252', 'AC1009', None
+    # HEADER から文字コードと版を取り、BLOCKS セクションのブロック定義を読んで、ENTITIES セクションの先頭まで読み飛ばす
+    prev_code, in_entities, blocks = None, False, {}
+    for code, value in tags:
+        if code == 2 and prev_code == 0 and value == b'ENTITIES': in_entities = True; break
+        if code == 2 and prev_code == 0 and value == b'BLOCKS':
+            blocks = read_blocks(iter_records(tags, make_decoder(encoding, version), BLOCK_RECORD_CODES, StreamStats()))
+            prev_code = None; continue
+        if code == 9: header_var = value
+        elif header_var == b'$DWGCODEPAGE': encoding, header_var = toencoding(value.decode('ascii', 'replace')), None
+        elif header_var == b'$ACADVER': version, header_var = value.decode('ascii', 'replace'), None
+        prev_code = code
+    if not in_entities: return stats
+
+    inserts = []
+    for etype, attribs, paperspace in iter_records(tags, make_decoder(encoding, version), ENTITY_RECORD_CODES, stats):
+        if paperspace: stats.paperspace += 1; continue
+        if etype == 'INSERT': inserts.append(attribs); continue
+        try: builder.add_attribs(etype, attribs); stats.kept += 1
+        except (TypeError, ValueError): stats.invalid += 1
+    if inserts:
+        with metrics.stage('dxf.blocks'): expand_inserts(builder, blocks, inserts, stats)
+    return stats
+
+def read_entity_table(path, stats=None):
+    """DXFファイルを逐次読み込んで EntityTable を作る。バイナリDXFは ezdxf.readfile() で読む"""
+    builder = EntityTableBuilder()
+    with metrics.stage('dxf.parse'):
+        if is_binary_dxf(path):
+            import ezdxf
+            for e in ezdxf.readfile(path).modelspace(): builder.add(e)
+        else:
+            with open(path, 'rb') as f: stream_entities(f, builder, stats)
+    with metrics.stage('entities.build'): return builder.build()
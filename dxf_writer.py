@@ -0,0 +1,126 @@
+import io
+
+import ezdxf
+import numpy as np
+
+# --- EntityTable からのDXF一括出力 ---
+# ezdxf で図形を1件ずつ作って doc.write() すると、10万図形で数十秒かかる。ここでは
+# 図形を含まない文書 (レイヤー・線種・文字スタイルの表だけを持つ) を ezdxf で書き出し、
+# その ENTITIES セクションに、種別ごとの配列から直接組み立てたタグ列を差し込む。
+# ハンドルは ezdxf のハンドル生成器から連続した範囲を確保し、$HANDSEED もその先に進める。
+# 座標が有限でない図形や半径・文字高さが正でない図形は書き出さず、理由ごとの件数を返す。
+
+DXF_VERSION = 'R2010'
+ENTITIES_MARKER = '  0\nSECTION\n  2\nENTITIES\n'
+ENDSEC_MARKER = '  0\nENDSEC\n'
+DEFAULT_FONT = 'txt'  # 文字スタイルを追加するときのフォント (元図面のフォント情報は保持していない)
+
+class WriteStats:
+    """書き出した図形数と、書き出さなかった図形の理由ごとの件数"""
+
+    def __init__(self):
+        self.written, self.skipped = 0, {}
+
+    def skip(self, reason, count):
+        if count: self.skipped[reason] = self.skipped.get(reason, 0) + int(count)
+
+    @property
+    def skipped_total(self):
+        return sum(self.skipped.values())
+
+    def as_dict(self):
+        return {'written': self.written, 'skipped': dict(self.skipped)}
+
+def _valid_rows(etype, cols, stats):
+    """書き出せる行の bool 配列。書き出せない行は理由ごとに数える"""
+    n = len(cols['handle'])
+    ok = np.ones(n, dtype=bool)
+    if not n: return ok
+    geometry = [cols[c].reshape(n, -1) for c in cols if c in ('start', 'end', 'center', 'insert', 'radius', 'height', 'start_angle', 'end_angle', 'rotation')]
+    finite = np.all(np.isfinite(np.hstack(geometry)), axis=1) if geometry else ok
+    stats.skip(f"{etype}: 座標が不正", (~finite).sum()); ok &= finite
+    size = 'height' if etype == 'TEXT' else 'radius' if etype in ('CIRCLE', 'ARC') else None
+    if size:
+        positive = cols[size] > 0
+        stats.skip(f"{etype}: {size}が0以下", (ok & ~positive).sum()); ok &= positive
+    return ok
+
+def _num(arr):
+    return [repr(v) for v in arr.tolist()]
+
+def _name_tags(code, names, codes, default=None):
+    """文字列コードの配列をグループコード付きのタグ文字列に変換する。default (大文字で比較) と同じ名前は省略する"""
+    tags = [f"{code:>3}\n{name}\n" if name.upper() != default else '' for name in names]
+    return [tags[c] for c in codes.tolist()]
+
+def _entity_tags(table, etype, rows, handles, owner, colors):
+    """1種別分のタグ文字列のリストを作る"""
+    cols = {col: arr[rows] for col, arr in table.columns[etype].items() if not col.startswith('text_')}
+    common = [f"  0\n{etype}\n  5\n{h:X}\n330\n{owner}\n100\nAcDbEntity\n{lay}{lt} 62\n{c}\n"
+              for h, lay, lt, c in zip(handles.tolist(), _name_tags(8, table.strings, cols['layer']),
+                                       _name_tags(6, table.strings, cols['linetype'], 'BYLAYER'), colors.tolist())]
+    if etype == 'LINE':
+        (x1, y1, z1), (x2, y2, z2) = [map(_num, cols[c].T) for c in ('start', 'end')]
+        return [f"{e}100\nAcDbLine\n 10\n{a}\n 20\n{b}\n 30\n{c}\n 11\n{d}\n 21\n{f}\n 31\n{g}\n" for e, a, b, c, d, f, g in zip(common, x1, y1, z1, x2, y2, z2)]
+    x, y, z = map(_num, cols['insert' if etype == 'TEXT' else 'center'].T)
+    if etype == 'CIRCLE':
+        return [f"{e}100\nAcDbCircle\n 10\n{a}\n 20\n{b}\n 30\n{c}\n 40\n{r}\n" for e, a, b, c, r in zip(common, x, y, z, _num(cols['radius']))]
+    if etype == 'ARC':
+        return [f"{e}100\nAcDbCircle\n 10\n{a}\n 20\n{b}\n 30\n{c}\n 40\n{r}\n100\nAcDbArc\n 50\n{s}\n 51\n{t}\n"
+                for e, a, b, c, r, s, t in zip(common, x, y, z, _num(cols['radius']), _num(cols['start_angle']), _num(cols['end_angle']))]
+    # TEXT: 改行を含む文字列はDXFのタグを壊すため空白に置き換える
+    texts = [table.text(i).replace('\r', ' ').replace('\n', ' ') for i in rows.tolist()]
+    styles = _name_tags(7, table.strings, cols['style'], 'STANDARD')
+    return [f"{e}100\nAcDbText\n 10\n{a}\n 20\n{b}\n 30\n{c}\n 40\n{h}\n  1\n{t}\n" + (f" 50\n{r}\n" if r != '0.0' else '') + f"{st}100\nAcDbText\n"
+            for e, a, b, c, h, t, r, st in zip(common, x, y, z, _num(cols['height']), texts, _num(cols['rotation']), styles)]
+
+def _prepare_document(table, used):
+    """使われているレイヤー・線種・文字スタイルを登録した空の文書を作る"""
+    doc = ezdxf.new(dxfversion=DXF_VERSION, setup=['linetypes'])  # DASHED などの標準線種は定義済みにする
+    for code in sorted(used['layer']):
+        name = table.strings[code]
+        if name not in doc.layers: doc.layers.add(name)
+    for code in sorted(used['linetype']):
+        name = table.strings[code]
+        if name.upper() not in ('BYLAYER', 'BYBLOCK') and name not in doc.linetypes: doc.linetypes.add(name, pattern=[0.0], description=name)
+    for code in sorted(used['style']):
+        name = table.strings[code]
+        if name not in doc.styles: doc.styles.add(name, font=DEFAULT_FONT)
+    return doc
+
+def write_table_dxf(table, stream, colors=None, progress=None):
+    """EntityTable の LINE/CIRCLE/ARC/TEXT を DXF (R2010) として stream に書き出し、WriteStats を返す
+
+    colors は gid ごとの色番号 (省略時は図形自身の色)。
+    """
+    stats = WriteStats()
+    etypes = ('LINE', 'CIRCLE', 'ARC', 'TEXT')
+    valid = {t: np.nonzero(_valid_rows(t, table.columns[t], stats))[0] for t in etypes}
+    used = {'layer': set(), 'linetype': set(), 'style': set()}
+    for t in etypes:
+        for col in used:
+            if col in table.columns[t]: used[col].update(np.unique(table.columns[t][col][valid[t]]).tolist())
+    doc = _prepare_document(table, used)
+    # 全図形分のハンドルを連続して確保する
+    total = sum(len(rows) for rows in valid.values())
+    first = int(doc.entitydb.handles.next(), 16)
+    doc.entitydb.handles.reset(f"{first + total:X}")
+    owner = doc.modelspace().layout_key
+    skeleton = io.StringIO()
+    doc.write(skeleton)
+    text = skeleton.getvalue()
+    head_end = text.index(ENTITIES_MARKER) + len(ENTITIES_MARKER)
+    tail_start = text.index(ENDSEC_MARKER, head_end)
+    stream.write(text[:tail_start])  # 空の ENTITIES セクションの ENDSEC の直前まで
+    all_colors = colors if colors is not None else np.concatenate([table.columns[t]['color'] for t in etypes])
+    next_handle = first
+    for i, t in enumerate(etypes):
+        if progress: progress(i / len(etypes), f"{t} を書き出しています")
+        rows = valid[t]
+        if not len(rows): continue
+        handles = np.arange(next_handle, next_handle + len(rows)); next_handle += len(rows)
+        entity_colors = np.asarray(all_colors)[table.offsets[t] + rows]
+        stream.write(''.join(_entity_tags(table, t, rows, handles, owner, entity_colors)))
+        stats.written += len(rows)
+    stream.write(text[tail_start:])
+    return stats
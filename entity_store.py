@@ -0,0 +1,255 @@
+from array import array
+
+import numpy as np
+
+# --- 図形データの列指向ストア ---
+# ezdxf のエンティティを1件ずつ辞書にする代わりに、図形種別ごとの属性を連続した
+# NumPy 配列として保持する。check_* 関数には EntityView を渡し、従来の辞書と同じく
+# e['entity'], l['start'], c['radius'] のように参照できるようにする。
+
+ENTITY_TYPES = ('LINE', 'CIRCLE', 'ARC', 'TEXT')
+FORMAT_VERSION = 3  # 保存形式 (列構成や変換内容) を変えたら上げる。古いキャッシュは使われなくなる
+
+# 種別ごとの数値属性: 列名 -> (dxf属性名, 次元数 (0はスカラー), 既定値)
+GEOMETRY_COLUMNS = {
+    'LINE': {'start': ('start', 3, None), 'end': ('end', 3, None)},
+    'CIRCLE': {'center': ('center', 3, None), 'radius': ('radius', 0, 0.0)},
+    'ARC': {'center': ('center', 3, None), 'radius': ('radius', 0, 0.0), 'start_angle': ('start_angle', 0, 0.0), 'end_angle': ('end_angle', 0, 360.0)},
+    'TEXT': {'insert': ('insert', 3, None), 'height': ('height', 0, 2.5), 'rotation': ('rotation', 0, 0.0)},
+}
+# 文字列属性は図面全体で共有する文字列表へのコード (int32) として保持する
+# block はブロック参照 (INSERT) を展開した図形の由来 ('外側のブロック名/内側のブロック名'、モデル空間の図形は '')
+STRING_COLUMNS = {'layer': '0', 'linetype': 'BYLAYER', 'style': 'Standard', 'block': ''}
+TEXT_STRING_COLUMNS = ('layer', 'linetype', 'style', 'block')
+COMMON_STRING_COLUMNS = ('layer', 'linetype', 'block')
+# ブロック参照 (入れ子の参照を含む) の一覧: ハンドル (モデル空間の INSERT のもの)、ブロック名の経路のコード、挿入点
+INSERT_COLUMNS = {'handle': ('Q', 0), 'block': ('i', 0), 'insert': ('d', 3)}
+
+def string_columns(etype):
+    return TEXT_STRING_COLUMNS if etype == 'TEXT' else COMMON_STRING_COLUMNS
+
+class EntityTableBuilder:
+    """ezdxf のエンティティを1件ずつ受け取り、列ごとの array に溜めて EntityTable を作る
+
+    座標は (x, y, z) のタプルではなく平坦な倍精度の array に追記するため、大きな図面でも
+    変換途中のメモリは最終的な配列と同程度に収まる。
+    """
+
+    def __init__(self, strings=None):
+        self.strings = {} if strings is None else strings  # ブロック定義の展開では図面の builder と文字列表を共有する
+        self.insert_rows = {col: array(typecode) for col, (typecode, _) in INSERT_COLUMNS.items()}
+        self.rows = {t: {'handle': array('Q'), 'color': array('h')} for t in ENTITY_TYPES}
+        for t in ENTITY_TYPES:
+            self.rows[t].update({col: array('d') for col in GEOMETRY_COLUMNS[t]})
+            self.rows[t].update({col: array('i') for col in string_columns(t)})
+        self.text_chunks = []
+
+    def _code(self, s):
+        return self.strings.setdefault(s, len(self.strings))
+
+    def add(self, e):
+        """対象外の種別は無視する。追加した場合は True を返す"""
+        return self.add_attribs(e.dxftype(), e.dxf.all_existing_dxf_attribs())
+
+    def add_attribs(self, etype, attribs):
+        """dxf属性名 -> 値 の辞書 (all_existing_dxf_attribs() と同じ形) から1件追加する"""
+        if etype not in self.rows: return False
+        rows = self.rows[etype]
+        # 値を全て変換してから追記する (途中で例外になっても列の長さがずれないように)
+        handle = attribs.get('handle')
+        handle, color = int(handle, 16) if handle else 0, int(attribs.get('color', 256))
+        geometry = []
+        for col, (attr, dim, default) in GEOMETRY_COLUMNS[etype].items():
+            value = attribs.get(attr, default)
+            geometry.append((col, (tuple(value) + (0.0, 0.0, 0.0))[:3] if dim else (float(value),)))  # 2次元座標はZ=0で補う
+        rows['handle'].append(handle); rows['color'].append(color)
+        for col, values in geometry: rows[col].extend(values)
+        for col in string_columns(etype):
+            rows[col].append(self._code(attribs.get(col, STRING_COLUMNS[col])))
+        if etype == 'TEXT':
+            self.text_chunks.append(str(attribs.get('text', '')).encode('utf-8'))
+        return True
+
+    def extend(self, etype, columns, texts=()):
+        """列名 -> 配列 (文字列の列はこの builder の文字列表のコード) からまとめて追加する。etype='INSERT' はブロック参照の一覧"""
+        rows = self.insert_rows if etype == 'INSERT' else self.rows[etype]
+        for col, values in rows.items():
+            values.frombytes(np.ascontiguousarray(columns[col], dtype=np.dtype(values.typecode)).tobytes())
+        if etype == 'TEXT':
+            self.text_chunks.extend(str(t).encode('utf-8') for t in texts)
+
+    def build_columns(self):
+        """種別ごとの列の配列 (EntityTable の columns と同じ形)"""
+        columns = {}
+        for etype in ENTITY_TYPES:
+            rows = self.rows[etype]
+            cols = {'handle': np.frombuffer(rows['handle'], dtype=np.uint64).copy(), 'color': np.frombuffer(rows['color'], dtype=np.int16).copy()}
+            for col, (_, dim, _) in GEOMETRY_COLUMNS[etype].items():
+                arr = np.frombuffer(rows[col], dtype=np.float64).copy()
+                cols[col] = arr.reshape(-1, dim) if dim else arr
+            for col in string_columns(etype):
+                cols[col] = np.frombuffer(rows[col], dtype=np.int32).copy()
+            columns[etype] = cols
+        lengths = np.array([len(c) for c in self.text_chunks], dtype=np.int64)
+        columns['TEXT']['text_offsets'] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        columns['TEXT']['text_data'] = np.frombuffer(b''.join(self.text_chunks), dtype=np.uint8).copy()
+        return columns
+
+    def build(self):
+        inserts = {col: np.frombuffer(self.insert_rows[col], dtype=np.dtype(typecode)).copy() for col, (typecode, _) in INSERT_COLUMNS.items()}
+        inserts['insert'] = inserts['insert'].reshape(-1, 3)
+        strings = sorted(self.strings, key=self.strings.get)
+        return EntityTable(self.build_columns(), strings, inserts)
+
+class EntityTable:
+    """図形種別ごとの属性配列をまとめた表
+
+    全種別を ENTITY_TYPES の順に連結した通し番号 (gid) でも参照できる。
+    解析対象の LINE/CIRCLE/ARC は先頭に並ぶため、その gid は 0 から連続する。
+    """
+
+    def __init__(self, columns, strings, inserts=None):
+        self.columns = columns
+        self.strings = list(strings)
+        self.counts = {t: len(columns[t]['handle']) for t in ENTITY_TYPES}
+        for t in ENTITY_TYPES:  # 後から追加した文字列の列が無い表 (古い .npz など) は既定値で補う
+            for col in string_columns(t):
+                if col in columns[t]: continue
+                if STRING_COLUMNS[col] not in self.strings: self.strings.append(STRING_COLUMNS[col])
+                columns[t][col] = np.full(self.counts[t], self.strings.index(STRING_COLUMNS[col]), dtype=np.int32)
+        self.inserts = inserts if inserts is not None else \
+            {col: np.zeros((0, dim) if dim else 0, dtype=np.dtype(typecode)) for col, (typecode, dim) in INSERT_COLUMNS.items()}
+        self.offsets, total = {}, 0
+        for t in ENTITY_TYPES:
+            self.offsets[t] = total; total += self.counts[t]
+        self.size = total
+
+    @classmethod
+    def from_entities(cls, entities):
+        builder = EntityTableBuilder()
+        for e in entities: builder.add(e)
+        return builder.build()
+
+    @classmethod
+    def from_modelspace(cls, msp):
+        return cls.from_entities(msp)
+
+    def save(self, file):
+        """全列を非圧縮の .npz に保存する (pickle を使わないので読み込みも安全)"""
+        arrays = {f"{etype}/{col}": arr for etype, cols in self.columns.items() for col, arr in cols.items()}
+        arrays.update({f"INSERT/{col}": arr for col, arr in self.inserts.items()})
+        np.savez(file, strings=np.array(self.strings, dtype=str), **arrays)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file, allow_pickle=False) as data:
+            columns = {etype: {} for etype in ENTITY_TYPES}
+            inserts = {}
+            for key in data.files:
+                if key == 'strings': continue
+                etype, col = key.split('/', 1)
+                (inserts if etype == 'INSERT' else columns[etype])[col] = data[key]
+            return cls(columns, data['strings'].tolist(), inserts or None)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for cols in self.columns.values() for arr in cols.values())
+
+    def column(self, etype, name):
+        return self.columns[etype][name]
+
+    def ids(self, etype):
+        """指定種別の gid 一覧"""
+        return np.arange(self.offsets[etype], self.offsets[etype] + self.counts[etype])
+
+    def locate(self, gid):
+        for etype in reversed(ENTITY_TYPES):
+            if gid >= self.offsets[etype]: return etype, int(gid - self.offsets[etype])
+        raise IndexError(gid)
+
+    def entity(self, gid):
+        etype, row = self.locate(gid)
+        return EntityView(self, etype, row)
+
+    def handle(self, gid):
+        etype, row = self.locate(gid)
+        return format(int(self.columns[etype]['handle'][row]), 'X')
+
+    def all_handles(self):
+        """gid 順のハンドル (uint64) の配列"""
+        return np.concatenate([self.columns[t]['handle'] for t in ENTITY_TYPES])
+
+    def handles(self, gids):
+        """gid の配列をハンドル文字列のリストに変換する"""
+        return [format(int(h), 'X') for h in self.all_handles()[np.asarray(gids, dtype=np.int64)]]
+
+    def subset(self, keep):
+        """gid の bool 配列で選んだ図形だけの EntityTable (ブロック参照の一覧はそのまま)"""
+        columns = {}
+        for etype in ENTITY_TYPES:
+            mask = keep[self.offsets[etype]:self.offsets[etype] + self.counts[etype]]
+            columns[etype] = {col: arr[mask] for col, arr in self.columns[etype].items() if col not in ('text_offsets', 'text_data')}
+        offsets, data = self.columns['TEXT']['text_offsets'], self.columns['TEXT']['text_data']
+        mask = keep[self.offsets['TEXT']:]
+        lengths = np.diff(offsets)
+        columns['TEXT']['text_offsets'] = np.concatenate([[0], np.cumsum(lengths[mask])]).astype(np.int64)
+        columns['TEXT']['text_data'] = data[np.repeat(mask, lengths)]
+        return EntityTable(columns, self.strings, self.inserts)
+
+    def text(self, row):
+        offsets = self.columns['TEXT']['text_offsets']
+        return self.columns['TEXT']['text_data'][offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+    def texts(self):
+        return [self.text(i) for i in range(self.counts['TEXT'])]
+
+    # --- 一括幾何計算 ---
+    def centroids(self, etype):
+        """代表点のXY座標 (線分は中点、円・円弧は中心、文字は挿入点)"""
+        cols = self.columns[etype]
+        if etype == 'LINE': return (cols['start'][:, :2] + cols['end'][:, :2]) / 2
+        if etype == 'TEXT': return cols['insert'][:, :2]
+        return cols['center'][:, :2]
+
+    def sizes(self, etype):
+        """検索半径の基準となる大きさ (線分は長さの半分、円・円弧は半径、文字は高さ)"""
+        cols = self.columns[etype]
+        if etype == 'LINE': return np.linalg.norm(cols['end'] - cols['start'], axis=1) / 2
+        if etype == 'TEXT': return cols['height']
+        return cols['radius']
+
+class EntityView:
+    """EntityTable の1行を辞書のように参照する軽量ビュー"""
+    __slots__ = ('table', 'etype', 'row')
+
+    def __init__(self, table, etype, row):
+        self.table, self.etype, self.row = table, etype, row
+
+    def __getitem__(self, key):
+        if key == 'entity': return self.etype
+        if key == 'handle': return format(int(self.table.columns[self.etype]['handle'][self.row]), 'X')
+        if key == 'text' and self.etype == 'TEXT': return self.table.text(self.row)
+        value = self.table.columns[self.etype][key][self.row]
+        return self.table.strings[value] if key in STRING_COLUMNS else value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        extra = ['text'] if self.etype == 'TEXT' else []
+        return ['entity', 'handle', 'color', *string_columns(self.etype), *GEOMETRY_COLUMNS[self.etype], *extra]
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __eq__(self, other):
+        return isinstance(other, EntityView) and (self.table, self.etype, self.row) == (other.table, other.etype, other.row)
+
+    def __hash__(self):
+        return hash((id(self.table), self.etype, self.row))
+
+    def __repr__(self):
+        return f"EntityView({self.etype}, handle={self['handle']})"
@@ -0,0 +1,38 @@
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# --- バックグラウンドジョブ ---
+# 解析や Excel/DXF 出力のような重い処理をリクエストの外で実行する。外部のブローカーは使わず、
+# プロセス内のスレッドプールで実行し、状態は呼び出し側が渡す update(job_id, **fields) で
+# DBのジョブ表 (app.py の Job) に書き込む。同時に実行する重い処理の数はスレッド数で制限する。
+
+JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_ERROR = 'queued', 'running', 'done', 'error'
+
+class JobQueue:
+    """ジョブ関数を最大 max_workers 件まで同時に実行するキュー
+
+    ジョブ関数は progress(割合, メッセージ) を受け取り、結果ファイルの情報
+    (result_path, result_name, result_mimetype などの辞書) を返す。辞書に message があれば
+    完了時のメッセージとして残す。
+    """
+
+    def __init__(self, max_workers, update):
+        self.update = update
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, job_id, fn):
+        return self.executor.submit(self._run, job_id, fn)
+
+    def _run(self, job_id, fn):
+        try:
+            self.update(job_id, status=JOB_RUNNING, progress=0.0)
+            result = fn(lambda fraction, message=None: self.update(job_id, progress=float(fraction), message=message))
+            self.update(job_id, **{'status': JOB_DONE, 'progress': 1.0, 'message': None, **(result or {})})
+        except Exception as e:
+            traceback.print_exc()
+            self.update(job_id, status=JOB_ERROR, message=str(e))
+
+def job_result_path(directory, job_id, ext):
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{job_id}{ext}")
@@ -0,0 +1,113 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# --- 処理時間の計測 ---
+# 解析・出力の各段階 (DXFの読み込み、図形データの構築、インデックス構築、近傍検索、判定、出力) の
+# 回数と合計時間を、プロセス内の Metrics に集計する。百分位数は直近 RESERVOIR_SIZE 件の計測値から求める。
+# check_* 関数は関数ごとに、判定したアンカー数・合格数・合計時間を数える。1件ずつ判定する場合に
+# 百分位数の計算に残す個別の時間は SAMPLE_EVERY 回に1回だけなので、常に有効にしておいても負荷は小さい。
+# capture() の中では、同じスレッドの計測値をリクエスト (ジョブ) 単位でも集計する。
+# ワーカープロセス (parallel_matcher) の中の計測値は集計されない。
+
+RESERVOIR_SIZE = 1024
+SAMPLE_EVERY = 16
+
+class _Series:
+    """1つの計測項目の回数・合計時間と、直近の計測値"""
+
+    def __init__(self):
+        self.count, self.total, self.samples, self.next = 0, 0.0, [], 0
+
+    def add(self, seconds, count=1):
+        self.count += count; self.total += seconds
+
+    def sample(self, seconds):
+        if len(self.samples) < RESERVOIR_SIZE: self.samples.append(seconds)
+        else: self.samples[self.next] = seconds; self.next = (self.next + 1) % RESERVOIR_SIZE
+
+    def percentiles(self, scale):
+        if not self.samples: return {'p50': None, 'p95': None, 'p99': None}
+        p50, p95, p99 = np.percentile(self.samples, [50, 95, 99]) * scale
+        return {'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3)}
+
+class Metrics:
+    """段階ごとの処理時間と check_* 関数ごとの判定数を集計する (スレッドセーフ)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages, self.checks, self.passed, self.batch, self.rejected = {}, {}, {}, {}, {}
+
+    def _targets(self):
+        return [self, *getattr(self._local, 'captures', [])]
+
+    def record(self, name, seconds):
+        for target in self._targets():
+            with target._lock:
+                series = target.stages.setdefault(name, _Series())
+                series.add(seconds); series.sample(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try: yield
+        finally: self.record(name, time.perf_counter() - t0)
+
+    def record_check(self, name, calls, passed, seconds, samples=(), batch=False, rejected=0):
+        """check_* 関数の判定結果を記録する。samples は1件あたりの判定時間 (秒) の計測値、
+        rejected は近傍数の下限を満たさず check_* 関数を呼ばなかったアンカー数"""
+        for target in self._targets():
+            with target._lock:
+                series = target.checks.setdefault(name, _Series())
+                series.add(seconds, calls)
+                for s in samples: series.sample(s)
+                target.passed[name] = target.passed.get(name, 0) + passed
+                target.batch[name] = batch
+                target.rejected[name] = target.rejected.get(name, 0) + rejected
+
+    @contextmanager
+    def capture(self):
+        """with 内で同じスレッドが記録した計測値を、別の Metrics にも集計して返す"""
+        captured = Metrics()
+        if not hasattr(self._local, 'captures'): self._local.captures = []
+        captures = self._local.captures
+        captures.append(captured)
+        try: yield captured
+        finally: captures.remove(captured)
+
+    def snapshot(self):
+        """JSON にできる集計結果。時間は段階ごとにミリ秒、check_* 関数は1件あたりマイクロ秒"""
+        with self._lock:
+            stages = {name: {'count': s.count, 'total_ms': round(s.total * 1000, 3), 'mean_ms': round(s.total / s.count * 1000, 3) if s.count else None,
+                             **{f"{k}_ms": v for k, v in s.percentiles(1000).items()}} for name, s in sorted(self.stages.items())}
+            checks = {name: {'calls': s.count, 'passed': self.passed[name], 'pass_rate': round(self.passed[name] / s.count, 4) if s.count else None,
+                             'rejected': self.rejected[name], 'total_ms': round(s.total * 1000, 3), 'batch': self.batch[name],
+                             **{f"{k}_us": v for k, v in s.percentiles(1e6).items()}} for name, s in sorted(self.checks.items())}
+        return {'stages': stages, 'checks': checks}
+
+    def reset(self):
+        with self._lock: self.stages, self.checks, self.passed, self.batch, self.rejected = {}, {}, {}, {}, {}
+
+metrics = Metrics()
+
+@contextmanager
+def profiled(path):
+    """with 内の処理 (呼び出したスレッドのみ) を cProfile で計測し、path に pstats 形式で保存する"""
+    profile = cProfile.Profile()
+    profile.enable()
+    try: yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+def profile_summary(path, limit=30):
+    """保存したプロファイルの累積時間の上位 limit 件を文字列で返す"""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,156 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from entity_store import EntityTable
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import ANALYZED_TYPES, anchor_candidates, build_index, plan_shapes
+from spatial_index import GridIndex
+
+# --- 空間タイル分割による並列解析 ---
+# check_* 関数は純Pythonのため、1プロセスでは1コアしか使えない。図面をタイルに分け、
+# タイル内のアンカーの判定だけをワーカープロセスで並列に行う。各タイルは最大の検索半径ぶんの
+# のりしろ (halo) を含めた範囲の図形で近傍を求めるので、判定結果はタイル分割によらない。
+# 同じ図形を重複して数えないための「使用済み」の判定はアンカーの gid 順に依存するため、
+# ワーカーは合格したアンカーとその近傍だけを返し、メインプロセスで逐次解析と同じ順に集計する。
+# 図形データは SharedMemory 上に1度だけ配置し、ワーカーへは配置情報 (名前とオフセット) だけを渡す。
+
+TILES_PER_WORKER = 4  # 負荷の偏りをならすため、ワーカー数より多めにタイルを作る
+
+class SharedTable:
+    """EntityTable の全列を1つの SharedMemory にまとめて配置する (with 文で解放する)"""
+
+    def __init__(self, table):
+        layout, size = {}, 0
+        for etype, cols in table.columns.items():
+            for col, arr in cols.items():
+                size = -(-size // 8) * 8  # 8バイト境界にそろえる
+                layout[f"{etype}/{col}"] = (size, arr.dtype.str, arr.shape)
+                size += arr.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for key, (offset, dtype, shape) in layout.items():
+            etype, col = key.split('/', 1)
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)[...] = table.columns[etype][col]
+        self.manifest = {'name': self.shm.name, 'layout': layout, 'strings': table.strings}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shm.close(); self.shm.unlink()
+
+def attach_table(manifest):
+    """SharedMemory 上の列を複製せずに参照する EntityTable を作る。(SharedMemory, EntityTable) を返す"""
+    shm = shared_memory.SharedMemory(name=manifest['name'])
+    columns = {}
+    for key, (offset, dtype, shape) in manifest['layout'].items():
+        etype, col = key.split('/', 1)
+        columns.setdefault(etype, {})[col] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+    return shm, EntityTable(columns, manifest['strings'])
+
+# ワーカープロセス内で、直前に使った共有図形データを使い回す
+_attached = {}
+
+def _worker_table(manifest):
+    if manifest['name'] not in _attached:
+        for shm, _, _ in _attached.values(): shm.close()
+        _attached.clear()
+        shm, table = attach_table(manifest)
+        points = np.concatenate([table.centroids(t) for t in ANALYZED_TYPES]).reshape(-1, 2)
+        _attached[manifest['name']] = (shm, table, points)
+    _, table, points = _attached[manifest['name']]
+    return table, points
+
+class _TileIndex:
+    """タイル (のりしろ込み) の図形だけで構築したインデックス。検索結果は全体の gid で返す"""
+
+    def __init__(self, points, gids):
+        self.points = points  # 検索の中心 (アンカーの代表点) は全体の gid で引く
+        self.gids, self.index = gids, GridIndex(points[gids])
+
+    def query_radius_batch(self, centers, radii):
+        offsets, indices, distances = self.index.query_radius_batch(centers, radii)
+        return offsets, self.gids[indices], distances  # gids は昇順なので各クエリ内の並び順も保たれる
+
+def analyze_tile(manifest, shape_keys, anchors, halo):
+    """1タイル分のアンカーを判定し、図形キー -> (合格したアンカーの gid, 近傍の offsets, 近傍の gid) を返す"""
+    table, points = _worker_table(manifest)
+    results = {}
+    for anchor_type, keys in plan_shapes(shape_keys).items():
+        tile_anchors = anchors[anchor_type]
+        if not len(tile_anchors): continue
+        anchor_points = points[tile_anchors]
+        lo, hi = anchor_points.min(axis=0) - halo, anchor_points.max(axis=0) + halo
+        inside = np.nonzero(np.all((points >= lo) & (points <= hi), axis=1))[0]
+        index = _TileIndex(points, inside)
+        results.update(anchor_candidates(keys, table, index, anchor_type, tile_anchors))
+    return results
+
+def halo_width(table, shape_keys):
+    """タイルののりしろ: 選択された図形定義の検索半径 (アンカーの大きさ × search_radius_ratio) の最大値"""
+    widths = [table.sizes(SHAPE_DEFINITIONS[k]['anchor_type']).max(initial=0.0) * SHAPE_DEFINITIONS[k]['search_radius_ratio'] for k in shape_keys]
+    return float(max(widths, default=0.0))
+
+def split_tiles(table, shape_keys, n_tiles):
+    """アンカーを代表点の位置で約 n_tiles 個の正方形タイルに分ける。タイルごとに アンカー種別 -> gid 配列 を返す"""
+    points = build_index(table).points
+    types = list(plan_shapes(shape_keys))
+    anchors = np.concatenate([table.ids(t) for t in types]) if types else np.zeros(0, dtype=np.int64)
+    if not len(anchors): return []
+    origin = points[anchors].min(axis=0)
+    extent = np.maximum(points[anchors].max(axis=0) - origin, 1e-9)
+    side = max(int(np.ceil(np.sqrt(n_tiles))), 1)
+    cell = np.minimum(((points[anchors] - origin) / extent * side).astype(np.int64), side - 1)
+    tile_of = cell[:, 0] * side + cell[:, 1]
+    tiles = []
+    for tile in np.unique(tile_of):
+        mine = anchors[tile_of == tile]
+        tiles.append({t: mine[(mine >= table.offsets[t]) & (mine < table.offsets[t] + table.counts[t])] for t in types})
+    return tiles
+
+def greedy_detections(anchors, neighbor_lists):
+    """合格したアンカーを gid 順に並べ、逐次解析 (match_shape) と同じ規則で使用済みの図形を除いて検出を決める。
+    検出ごとに (アンカーの gid, その検出で新たに使った gid のリスト) を返す"""
+    detections, consumed = [], set()
+    for k in np.argsort(anchors, kind='stable'):
+        a = int(anchors[k])
+        if a in consumed: continue  # タイル境界をまたいで構成図形を共有する検出もここで除かれる
+        used = [gid for gid in [a, *neighbor_lists[k].tolist()] if gid not in consumed]
+        consumed.update(used); detections.append((a, used))
+    return detections
+
+def merge_matches(parts):
+    """タイルごとの合格アンカーをまとめて数え、(数, 検出図形の gid 配列) を返す"""
+    anchors = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    neighbor_lists = [rows[offsets[i]:offsets[i + 1]] for _, offsets, rows in parts for i in range(len(offsets) - 1)]
+    detections = greedy_detections(anchors, neighbor_lists)
+    return len(detections), np.array([gid for _, used in detections for gid in used], dtype=np.int64)
+
+_executors = {}
+
+def get_executor(workers):
+    """ワーカー数ごとのプロセスプールを使い回す"""
+    if workers not in _executors:
+        _executors[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executors[workers]
+
+def parallel_candidates(table, shape_keys, workers):
+    """全アンカーをタイルに分けて並列に判定し、図形キー -> タイルごとの (合格アンカー, offsets, 近傍) のリスト を返す"""
+    tiles = split_tiles(table, shape_keys, workers * TILES_PER_WORKER)
+    halo = halo_width(table, shape_keys)
+    with SharedTable(table) as shared:
+        executor = get_executor(workers)
+        futures = [executor.submit(analyze_tile, shared.manifest, shape_keys, tile, halo) for tile in tiles]
+        tile_results = [f.result() for f in futures]
+    return {shape_key: [r[shape_key] for r in tile_results if shape_key in r] for shape_key in shape_keys}
+
+def find_shapes_parallel(table, shape_keys, workers):
+    """find_shapes() の並列版。結果は find_shapes() と一致する"""
+    candidates = parallel_candidates(table, shape_keys, workers)
+    results = {}
+    for shape_key in shape_keys:
+        count, gids = merge_matches(candidates[shape_key])
+        results[shape_key] = {'name': SHAPE_DEFINITIONS[shape_key]['name'], 'count': count, 'handles': table.handles(gids)}
+    return results
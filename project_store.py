@@ -0,0 +1,116 @@
+import ast
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from entity_store import ENTITY_TYPES, GEOMETRY_COLUMNS, STRING_COLUMNS, EntityTableBuilder, string_columns
+from metrics import metrics
+from shape_matcher import DETECTOR_VERSION, find_pedestrian_lights, find_vehicle_lights
+from text_index import INDEX_VERSION, TextIndex
+
+# --- 明細書プロジェクトの図形データ ---
+# プロジェクトの図形データは EntityTable の .npz を正とし、Excel は出力時にだけ作る。
+# 以前のプロジェクトは DXF を変換した Excel (converted_excel_path) だけを持つため、
+# table_from_workbook() で一度だけ EntityTable に移行する。
+
+# Excelのシート名と図形種別の対応
+SHEET_TYPES = {'line': 'LINE', 'circle': 'CIRCLE', 'arc': 'ARC', 'text': 'TEXT'}
+EXPORT_CHUNK_ROWS = 5000  # Excel を逐次出力するときに一度に書き出す行数
+
+def format_points(points):
+    """(n, 3) の座標配列を、ezdxf の Vec3 と同じ "(x, y, z)" 形式の文字列リストにする"""
+    return [f"({x}, {y}, {z})" for x, y, z in points.tolist()]
+
+def parse_point(value):
+    """"(x, y, z)" 形式の文字列を座標タプルに戻す。読めない値は原点とする"""
+    try: return tuple(float(v) for v in ast.literal_eval(str(value)))
+    except (ValueError, SyntaxError, TypeError): return (0.0, 0.0, 0.0)
+
+def sheet_columns(table, etype, colors=None, start=0, stop=None):
+    """1シートの列名 -> 値 (行 start〜stop)。table_frames() と xlsx の逐次出力 (table_sheets()) で同じ列構成にする"""
+    cols, stop = table.columns[etype], table.counts[etype] if stop is None else min(stop, table.counts[etype])
+    strings = np.array(table.strings, dtype=object)
+    data = {'handle': [format(h, 'X') for h in cols['handle'][start:stop].tolist()]}
+    for col in string_columns(etype): data[col] = strings[cols[col][start:stop]]
+    data['color'] = cols['color'][start:stop] if colors is None else colors[table.ids(etype)[start:stop]]
+    for col, (_, dim, _) in GEOMETRY_COLUMNS[etype].items():
+        data[col] = format_points(cols[col][start:stop]) if dim else cols[col][start:stop]
+    if etype == 'TEXT': data['text'] = [table.text(i) for i in range(start, stop)]
+    return data
+
+def table_frames(table, colors=None):
+    """シート名 -> DataFrame の辞書を作る。colors は gid ごとの色番号 (省略時は図形自身の色)"""
+    return {sheet: pd.DataFrame(sheet_columns(table, etype, colors)) for sheet, etype in SHEET_TYPES.items() if table.counts[etype]}
+
+def table_sheets(table, colors=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """xlsx_stream.iter_xlsx() に渡すシートのリスト [(シート名, 列名, chunk_rows 行ずつの列の値の反復子), ...]"""
+    def chunks(etype):
+        for start in range(0, table.counts[etype], chunk_rows): yield sheet_columns(table, etype, colors, start, start + chunk_rows)
+    return [(sheet, list(sheet_columns(table, etype, colors, 0, 0)), chunks(etype)) for sheet, etype in SHEET_TYPES.items() if table.counts[etype]]
+
+def text_search_mask(table, query, text_index=None):
+    """TEXT の各行が検索語を含むか (全角英数は半角にし、大文字小文字は区別しない)"""
+    return (text_index or TextIndex.from_table(table)).mask(query)
+
+def search_item(table, item_type, params, text_index=None):
+    """明細項目の検索条件に一致する図形の (数, gid 配列) を返す。text_index はプロジェクトの文字検索インデックス"""
+    with metrics.stage(f"search.{item_type}"): return _search_item(table, item_type, params, text_index)
+
+def _search_item(table, item_type, params, text_index):
+    if item_type == 'text_search':
+        rows = (text_index or TextIndex.from_table(table)).search(params.get('query', ''))
+        return len(rows), table.ids('TEXT')[rows]
+    if item_type == 'shape_search':
+        if params.get('shape') == 'vehicle': return find_vehicle_lights(table)
+        if params.get('shape') == 'pedestrian': return find_pedestrian_lights(table)
+    return 0, np.zeros(0, dtype=np.int64)
+
+def search_key(item_type, params):
+    """検索条件 (項目の種類と検索パラメータ) のハッシュ。保存した検索結果のキーにする"""
+    return hashlib.sha256(json.dumps([item_type, params], sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def search_version(item_type):
+    """検索結果を作った処理の版。変わったら保存済みの結果は使わない"""
+    return f"text-{INDEX_VERSION}" if item_type == 'text_search' else f"shape-{DETECTOR_VERSION}"
+
+def table_searcher(table, text_index=None):
+    """search_item() を table に固定した検索関数 search(item_type, params)。文字検索インデックスは最初のテキスト探索で作る"""
+    index = [text_index]
+    def search(item_type, params):
+        if item_type == 'text_search' and index[0] is None: index[0] = TextIndex.from_table(table)
+        return search_item(table, item_type, params, index[0])
+    return search
+
+def item_colors(table, items, search=None):
+    """明細項目 (ReportItem) の検索結果に色を付けた gid ごとの色番号。後の項目ほど優先する
+
+    search(item_type, params) は (数, gid 配列) を返す検索関数 (省略時は table_searcher(table))。
+    """
+    search = search or table_searcher(table)
+    colors = np.concatenate([table.columns[t]['color'] for t in ENTITY_TYPES]).astype(np.int64)
+    for item in items:
+        _, gids = search(item.item_type, json.loads(item.search_params) if item.search_params else {})
+        colors[gids] = item.color
+    return colors
+
+def _is_hex(value):
+    try: int(value, 16); return True
+    except (TypeError, ValueError): return False
+
+def table_from_workbook(path):
+    """旧形式のプロジェクト (DXFを変換したExcel) から EntityTable を作る"""
+    builder = EntityTableBuilder()
+    # '0' のようなレイヤー名やハンドルは数値として書き込まれているため文字列として読む
+    sheets = pd.read_excel(path, sheet_name=None, dtype={col: str for col in ('handle', *STRING_COLUMNS)})
+    for sheet, etype in SHEET_TYPES.items():
+        if sheet not in sheets: continue
+        point_cols = [col for col, (_, dim, _) in GEOMETRY_COLUMNS[etype].items() if dim]
+        for record in sheets[sheet].to_dict('records'):
+            attribs = {k: v for k, v in record.items() if pd.notna(v)}
+            for col in point_cols: attribs[col] = parse_point(attribs.get(col))
+            if not _is_hex(attribs.get('handle', '')): attribs.pop('handle', None)
+            if 'color' in attribs: attribs['color'] = int(attribs['color'])
+            builder.add_attribs(etype, attribs)
+    return builder.build()
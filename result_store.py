@@ -0,0 +1,51 @@
+import os
+import threading
+
+import numpy as np
+
+from entity_store import ENTITY_TYPES
+
+# --- 図形解析結果の保存 ---
+# 解析結果 (図形ごとの検出図形のハンドル) は大きな図面で数万件になる。Flask のセッション (署名付きCookie) に
+# 入れるとリクエストのたびに署名・送受信され、Cookie の上限も超えてしまう。ハンドルは図形キーごとの uint64 配列として
+# <結果ID>.npz に保存し、件数や名前などの要約は DB (app.py の AnalysisResult) に、セッションには結果IDだけを置く。
+
+PAGE_SIZE = 1000  # ハンドルを一度に返す件数の既定値
+MAX_PAGE_SIZE = 10000
+
+def split_results(results):
+    """解析結果を (図形キー -> ハンドル以外の値, 図形キー -> ハンドルの uint64 配列) に分ける"""
+    summary, handles = {}, {}
+    for key, data in results.items():
+        summary[key] = {k: v for k, v in data.items() if k != 'handles'}
+        handles[key] = np.array([int(h, 16) for h in data.get('handles', [])], dtype=np.uint64)
+    return summary, handles
+
+def save_handles(path, handles):
+    """図形キー -> ハンドル配列を path (.npz) に保存する (書き込み途中のファイルは読まれない)"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f: np.savez(f, **handles)
+    os.replace(tmp_path, path)
+
+def load_handles(path, shape_key):
+    """1つの図形キーのハンドル配列を読み込む (他の図形キーの配列は読まない)"""
+    with np.load(path, allow_pickle=False) as data:
+        return data[shape_key] if shape_key in data.files else np.zeros(0, dtype=np.uint64)
+
+def handle_page(path, shape_key, offset=0, limit=PAGE_SIZE):
+    """1つの図形キーのハンドルを offset から limit 件、(全件数, ハンドル文字列のリスト) で返す"""
+    handles = load_handles(path, shape_key)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return len(handles), [format(h, 'X') for h in handles[offset:offset + limit].tolist()]
+
+def handle_gids(table, handles):
+    """ハンドル配列を図面 (EntityTable) の gid 配列に変換する。図面に無いハンドルは除く。
+    ブロック参照を展開した図形は INSERT のハンドルを共有するので、同じハンドルの図形はすべて返す"""
+    return np.flatnonzero(np.isin(table.all_handles(), handles)).astype(np.int64)
+
+def result_colors(table, path, shape_colors):
+    """図形キー -> 色番号 で、検出図形に色を付けた gid ごとの色番号 (他の図形は元の色)。後の図形キーほど優先する"""
+    colors = np.concatenate([table.columns[t]['color'] for t in ENTITY_TYPES]).astype(np.int64)
+    for shape_key, color in shape_colors.items():
+        colors[handle_gids(table, load_handles(path, shape_key))] = color
+    return colors
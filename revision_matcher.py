@@ -0,0 +1,178 @@
+import numpy as np
+
+from entity_store import GEOMETRY_COLUMNS
+from metrics import metrics
+from parallel_matcher import greedy_detections, parallel_candidates
+from shape_definitions import SHAPE_DEFINITIONS
+from shape_matcher import ANALYZED_TYPES, DETECTOR_VERSION, anchor_candidates, build_index, plan_shapes
+
+# --- 改訂図面の差分解析 ---
+# 改訂された図面は図形の数%しか変わらないことが多い。前の版の解析で判定を通ったアンカー
+# (重複の除去前の候補とその近傍) と、図形ごとの照合キー (種別・ハンドル・幾何の値) を保存しておき、
+# 新しい版では照合キーが一致しない図形 (追加・変更・削除) の新旧の位置が検索半径に入るアンカーだけを
+# 判定し直す。それ以外のアンカーは近傍も判定結果も前の版と同じなので、候補をそのまま引き継ぐ。
+# 最後に全候補を gid 順に並べ、逐次解析と同じ規則で使用済みの図形を除くため、結果は全体の解析と一致する。
+
+STATE_VERSION = 1  # 保存形式を変えたら上げる
+KEY_WORDS = 2 + max(sum(dim or 1 for _, dim, _ in GEOMETRY_COLUMNS[t].values()) for t in ANALYZED_TYPES)  # 種別・ハンドル・幾何の値
+
+def entity_keys(table):
+    """解析対象の図形ごとの照合キー (種別・ハンドル・幾何の値のバイト列) を gid 順に返す"""
+    parts = []
+    for code, etype in enumerate(ANALYZED_TYPES):
+        cols, n = table.columns[etype], table.counts[etype]
+        words = np.zeros((n, KEY_WORDS), dtype=np.uint64)
+        words[:, 0], words[:, 1] = code, cols['handle']
+        geometry = np.column_stack([cols[col].reshape(n, dim or 1) for col, (_, dim, _) in GEOMETRY_COLUMNS[etype].items()])
+        words[:, 2:2 + geometry.shape[1]] = np.ascontiguousarray(geometry, dtype=np.float64).view(np.uint64)
+        parts.append(words)
+    return np.ascontiguousarray(np.concatenate(parts)).view(f'V{KEY_WORDS * 8}').ravel()
+
+def key_handles(keys):
+    return keys.view(np.uint64).reshape(-1, KEY_WORDS)[:, 1]
+
+def match_entities(old_keys, new_keys):
+    """前の版と今の版に1つずつある (照合キーが同じ) 図形を対応付ける。
+    (前の版の gid -> 今の版の gid (対応が無ければ -1), 今の版で変わっていない図形の bool 配列) を返す"""
+    _, inverse = np.unique(np.concatenate([old_keys, new_keys]), return_inverse=True)
+    inverse = inverse.ravel()
+    inv_old, inv_new = inverse[:len(old_keys)], inverse[len(old_keys):]
+    m = int(inverse.max(initial=-1)) + 1
+    same = (np.bincount(inv_old, minlength=m) == 1) & (np.bincount(inv_new, minlength=m) == 1)
+    new_of_key = np.full(m, -1, dtype=np.int64); new_of_key[inv_new] = np.arange(len(new_keys))
+    old_to_new = np.where(same[inv_old], new_of_key[inv_old], -1)
+    return old_to_new, same[inv_new]
+
+def _sorted_candidates(parts):
+    """(合格アンカー, offsets, 近傍) の組をまとめ、アンカーの gid 順に並べ替える"""
+    anchors = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate([np.diff(p[1]) for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    starts = np.concatenate([p[1][:-1] + sum(len(q[2]) for q in parts[:i]) for i, p in enumerate(parts)]) if parts else np.zeros(0, dtype=np.int64)
+    rows = np.concatenate([p[2] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    order = np.argsort(anchors, kind='stable')
+    offsets = np.zeros(len(order) + 1, dtype=np.int64); np.cumsum(counts[order], out=offsets[1:])
+    take = np.repeat(starts[order] - offsets[:-1], counts[order]) + np.arange(offsets[-1])
+    return anchors[order].astype(np.int64), offsets, rows[take].astype(np.int64)
+
+class AnalysisState:
+    """解析した図面の照合キー・代表点と、図形キー -> 判定を通ったアンカーの候補 (gid 順の CSR) を保持する"""
+
+    def __init__(self, keys, points, candidates):
+        self.keys, self.points, self.candidates = keys, points, candidates
+
+    def save(self, file):
+        arrays = {'version': STATE_VERSION, 'detector_version': DETECTOR_VERSION, 'keys': self.keys, 'points': self.points}
+        for shape_key, (anchors, offsets, rows) in self.candidates.items():
+            arrays.update({f"{shape_key}/anchors": anchors, f"{shape_key}/offsets": offsets, f"{shape_key}/rows": rows})
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """保存した解析状態を読み込む。保存形式か検出処理の版が違う場合は None を返す"""
+        with np.load(file, allow_pickle=False) as data:
+            if int(data['version']) != STATE_VERSION or int(data['detector_version']) != DETECTOR_VERSION: return None
+            shape_keys = {name.split('/', 1)[0] for name in data.files if '/' in name}
+            candidates = {k: (data[f"{k}/anchors"], data[f"{k}/offsets"], data[f"{k}/rows"]) for k in shape_keys if k in SHAPE_DEFINITIONS}
+            return cls(data['keys'], data['points'], candidates)
+
+    def detections(self, shape_key):
+        return greedy_detections(*_neighbor_lists(self.candidates[shape_key]))
+
+def _neighbor_lists(candidates):
+    anchors, offsets, rows = candidates
+    return anchors, [rows[offsets[i]:offsets[i + 1]] for i in range(len(anchors))]
+
+def dirty_anchors(table, index, anchor_type, ratio, touched, unchanged):
+    """変更された図形の位置 touched (新旧の代表点) が検索半径内にあるアンカーと、変更されたアンカーの gid 配列"""
+    start, n = table.offsets[anchor_type], table.counts[anchor_type]
+    changed = start + np.nonzero(~unchanged[start:start + n])[0]
+    if not len(touched) or not n: return changed
+    radii = table.sizes(anchor_type) * ratio
+    _, indices, distances = index.query_radius_batch(touched, np.full(len(touched), radii.max()))
+    in_type = (indices >= start) & (indices < start + n)
+    indices, distances = indices[in_type], distances[in_type]
+    return np.union1d(changed, indices[distances <= radii[indices - start]]).astype(np.int64)
+
+def carry_candidates(candidates, old_to_new, clean):
+    """前の版の候補のうち、アンカーが判定し直し不要 (clean) なものを今の版の gid に付け替える"""
+    anchors, offsets, rows = candidates
+    new_anchors = old_to_new[anchors]
+    keep = np.nonzero(new_anchors >= 0)[0]
+    keep = keep[clean[new_anchors[keep]]]
+    counts = np.diff(offsets)[keep]
+    new_offsets = np.zeros(len(keep) + 1, dtype=np.int64); np.cumsum(counts, out=new_offsets[1:])
+    take = np.repeat(offsets[:-1][keep] - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+    new_rows = old_to_new[rows[take]]  # 近傍も変わっていないので必ず対応がある
+    owner = np.repeat(np.arange(len(keep)), counts)
+    new_rows = new_rows[np.lexsort((new_rows, owner))]  # 近傍は gid の昇順 (新しく検索した場合と同じ並び)
+    return new_anchors[keep], new_offsets, new_rows
+
+def analyze_revision(table, shape_keys, previous=None, workers=0, progress=None):
+    """選択された図形定義を探索し、(結果辞書, 解析状態, 統計) を返す。結果辞書は find_shapes() と同じ形
+
+    previous (前の版の AnalysisState) を渡すと、変わった図形の近くのアンカーだけを判定し直す。
+    previous が無く workers > 1 なら、全アンカーを parallel_matcher で並列に判定する。
+    統計は {'anchors': 判定対象のアンカー数, 'evaluated': 実際に判定したアンカー数, 'changed': 変わった図形数}。
+    progress を渡すと、アンカー種別を1つ処理するごとに進捗 (0〜1) を渡して呼ぶ。
+    """
+    index = build_index(table)
+    stats = {'anchors': 0, 'evaluated': 0, 'changed': 0}
+    with metrics.stage('revision.match'):
+        keys = entity_keys(table)
+        if previous is not None:
+            old_to_new, unchanged = match_entities(previous.keys, keys)
+            touched = np.concatenate([index.points[~unchanged], previous.points[old_to_new < 0]])
+            stats['changed'] = int((~unchanged).sum() + (old_to_new < 0).sum())
+    candidates = {}
+    if previous is None and workers > 1:
+        with metrics.stage('analysis.parallel'):
+            candidates = {k: _sorted_candidates(parts) for k, parts in parallel_candidates(table, shape_keys, workers).items()}
+        stats['anchors'] = stats['evaluated'] = sum(table.counts[SHAPE_DEFINITIONS[k]['anchor_type']] for k in shape_keys)
+    else:
+        plan = plan_shapes(shape_keys)
+        for i, (anchor_type, type_keys) in enumerate(plan.items()):
+            known = [k for k in type_keys if previous is not None and k in previous.candidates]
+            unknown = [k for k in type_keys if k not in known]
+            stats['anchors'] += table.counts[anchor_type] * len(type_keys)
+            if known:
+                ratio = max(SHAPE_DEFINITIONS[k]['search_radius_ratio'] for k in known)
+                dirty = dirty_anchors(table, index, anchor_type, ratio, touched, unchanged)
+                clean = np.ones(len(keys), dtype=bool); clean[dirty] = False
+                evaluated = anchor_candidates(known, table, index, anchor_type, dirty) if len(dirty) else {}
+                for k in known:
+                    parts = [carry_candidates(previous.candidates[k], old_to_new, clean)] + ([evaluated[k]] if k in evaluated else [])
+                    candidates[k] = _sorted_candidates(parts)
+                stats['evaluated'] += len(dirty) * len(known)
+            if unknown:
+                evaluated = anchor_candidates(unknown, table, index, anchor_type, table.ids(anchor_type))
+                for k in unknown: candidates[k] = _sorted_candidates([evaluated[k]])
+                stats['evaluated'] += table.counts[anchor_type] * len(unknown)
+            if progress: progress((i + 1) / len(plan))
+    results = {}
+    for shape_key in shape_keys:
+        with metrics.stage('analysis.dedup'): detections = greedy_detections(*_neighbor_lists(candidates[shape_key]))
+        gids = np.array([gid for _, used in detections for gid in used], dtype=np.int64)
+        results[shape_key] = {'name': SHAPE_DEFINITIONS[shape_key]['name'], 'count': len(detections), 'handles': table.handles(gids)}
+    if previous is not None and np.array_equal(previous.keys, keys):  # 同じ図面なら、今回選ばれなかった図形の候補も残す
+        candidates = {**previous.candidates, **candidates}
+    return results, AnalysisState(keys, index.points, candidates), stats
+
+def diff_detections(previous, state, shape_keys):
+    """前の版と今の版の検出を比べ、図形キー -> {'added': [アンカーのハンドル], 'removed': [...]} を返す
+
+    検出は構成図形の組で比べる (構成図形のどれかが追加・変更・削除されたら、前の検出は削除、今の検出は追加とみなす)。
+    前の版で探索していない図形定義は含めない。
+    """
+    old_to_new, _ = match_entities(previous.keys, state.keys)
+    old_handles, new_handles = key_handles(previous.keys), key_handles(state.keys)
+    report = {}
+    for shape_key in shape_keys:
+        if shape_key not in previous.candidates: continue
+        old = {}
+        for anchor, used in previous.detections(shape_key):
+            mapped = old_to_new[used]
+            old[tuple(sorted(mapped.tolist())) if (mapped >= 0).all() else ('removed', anchor)] = anchor
+        new = {tuple(sorted(used)): anchor for anchor, used in state.detections(shape_key)}
+        report[shape_key] = {'added': [format(int(new_handles[a]), 'X') for key, a in new.items() if key not in old],
+                             'removed': [format(int(old_handles[a]), 'X') for key, a in old.items() if key not in new]}
+    return report
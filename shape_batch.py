@@ -0,0 +1,192 @@
+import numpy as np
+
+# --- 図形チェックの一括判定 ---
+# shape_definitions.py の check_* 関数はアンカー1件ずつを判定する。ここでは同じ条件を
+# 全アンカーの近傍 (CSR形式) に対して NumPy で一度に評価する。一括判定が用意されていない
+# 図形 (円弧の整列判定など) は、探索エンジン側で従来の check_* 関数にフォールバックする。
+# 判定条件は対応する check_* 関数と完全に一致させること。
+
+class NeighborSets:
+    """アンカーごとの近傍 gid (アンカー自身を除く) を CSR 形式で保持し、種別ごとに絞り込む"""
+
+    def __init__(self, table, anchors, offsets, indices):
+        self.table = table
+        self.anchors = np.asarray(anchors, dtype=np.int64)
+        owner = np.repeat(np.arange(len(self.anchors)), np.diff(offsets))
+        keep = indices != self.anchors[owner]
+        self.owner, self.indices = owner[keep], indices[keep]
+        self.offsets = np.zeros(len(self.anchors) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.owner, minlength=len(self.anchors)), out=self.offsets[1:])
+        self._selected = {}
+
+    def __len__(self):
+        return len(self.anchors)
+
+    def neighbors(self, q):
+        """q 番目のアンカーの近傍 gid"""
+        return self.indices[self.offsets[q]:self.offsets[q + 1]]
+
+    def anchor_rows(self, etype):
+        return self.anchors - self.table.offsets[etype]
+
+    def select(self, etype):
+        """指定種別の近傍だけを (アンカー番号, 種別内の行番号) の配列で返す。近傍の並び順は保つ"""
+        if etype not in self._selected:
+            start = self.table.offsets[etype]
+            mask = (self.indices >= start) & (self.indices < start + self.table.counts[etype])
+            self._selected[etype] = (self.owner[mask], self.indices[mask] - start)
+        return self._selected[etype]
+
+    def count(self, etype):
+        owner, _ = self.select(etype)
+        return np.bincount(owner, minlength=len(self))
+
+    def nth(self, etype, k):
+        """各アンカーについて、指定種別の k 番目の近傍の行番号 (無ければ -1)"""
+        owner, rows = self.select(etype)
+        first = np.searchsorted(owner, owner, side='left')
+        rank = np.arange(len(owner)) - first
+        out = np.full(len(self), -1, dtype=np.int64)
+        out[owner[rank == k]] = rows[rank == k]
+        return out
+
+    def partition(self, etype):
+        """指定種別の近傍をアンカーごとの CSR (offsets, 種別内の行番号) で返す (キャッシュする)"""
+        key = ('partition', etype)
+        if key not in self._selected:
+            owner, rows = self.select(etype)
+            self._selected[key] = (np.searchsorted(owner, np.arange(len(self) + 1)), rows)
+        return self._selected[key]
+
+    def any(self, owner, flags):
+        """近傍ごとの真偽値を、アンカーごとの「いずれかが真」に集約する"""
+        return np.bincount(owner[flags], minlength=len(self)) > 0
+
+def _norm(v):
+    return np.linalg.norm(v, axis=-1)
+
+def _line_vectors(table, rows):
+    cols = table.columns['LINE']
+    return cols['end'][rows] - cols['start'][rows]
+
+def _concentric(table, anchor_rows, circle_rows):
+    """アンカー円と (1つだけの) 他の円の中心距離が 0.1 未満か"""
+    centers = table.columns['CIRCLE']['center']
+    return _norm(centers[anchor_rows] - centers[np.maximum(circle_rows, 0)]) < 0.1
+
+def batch_dedicated_pole(table, ns):
+    ok = ns.count('CIRCLE') == 1
+    if not ok.any(): return ok
+    return ok & _concentric(table, ns.anchor_rows('CIRCLE'), ns.nth('CIRCLE', 0))
+
+def batch_kanden_pole(table, ns):
+    ok = ns.count('LINE') == 2
+    if not ok.any(): return ok  # 以降は該当種別の配列が空でないことを前提に添字参照する
+    l0, l1 = np.maximum(ns.nth('LINE', 0), 0), np.maximum(ns.nth('LINE', 1), 0)
+    d0, d1 = _line_vectors(table, l0), _line_vectors(table, l1)
+    n0, n1 = _norm(d0), _norm(d1)
+    is_v0, is_v1 = np.abs(d0[:, 0]) < 0.1 * n0, np.abs(d1[:, 0]) < 0.1 * n1
+    is_h0, is_h1 = np.abs(d0[:, 1]) < 0.1 * n0, np.abs(d1[:, 1]) < 0.1 * n1
+    ok &= (is_v0 | is_v1) & (is_h0 | is_h1)
+    v, h = np.where(is_v0, l0, l1), np.where(is_h0, l0, l1)
+    cols = table.columns['LINE']
+    vs, ve, hs, he = cols['start'][v], cols['end'][v], cols['start'][h], cols['end'][h]
+    dist1 = np.minimum(_norm(vs - hs), _norm(vs - he))
+    dist2 = np.minimum(_norm(ve - hs), _norm(ve - he))
+    return ok & (np.minimum(dist1, dist2) < _norm(he - hs) * 0.1)
+
+def batch_lighting_pole(table, ns):
+    ok = (ns.count('LINE') == 3) & (ns.count('ARC') == 1)
+    anchor_centers = table.columns['CIRCLE']['center'][ns.anchor_rows('CIRCLE')]
+    anchor_radii = table.columns['CIRCLE']['radius'][ns.anchor_rows('CIRCLE')]
+    line_owner, line_rows = ns.select('LINE')
+    line_centers = (table.columns['LINE']['start'][line_rows] + table.columns['LINE']['end'][line_rows]) / 2
+    arc_owner, arc_rows = ns.select('ARC')
+    arc_centers = table.columns['ARC']['center'][arc_rows]
+    outside_line = _norm(line_centers - anchor_centers[line_owner]) > anchor_radii[line_owner]
+    outside_arc = _norm(arc_centers - anchor_centers[arc_owner]) > anchor_radii[arc_owner]
+    return ok & ~ns.any(line_owner, outside_line) & ~ns.any(arc_owner, outside_arc)
+
+def batch_lighting_type3(table, ns):
+    ok = (ns.count('CIRCLE') == 1) & (ns.count('LINE') == 2)
+    if not ok.any(): return ok
+    return ok & _concentric(table, ns.anchor_rows('CIRCLE'), ns.nth('CIRCLE', 0))
+
+def batch_lighting_type2(table, ns):
+    ok = (ns.count('CIRCLE') == 1) & (ns.count('LINE') == 1)
+    if not ok.any(): return ok
+    circles = table.columns['CIRCLE']
+    a, c = ns.anchor_rows('CIRCLE'), np.maximum(ns.nth('CIRCLE', 0), 0)
+    l = np.maximum(ns.nth('LINE', 0), 0)
+    start, end = table.columns['LINE']['start'][l], table.columns['LINE']['end'][l]
+    c1, r1, c2, r2 = circles['center'][a], circles['radius'][a], circles['center'][c], circles['radius'][c]
+    err1 = (_norm(start - c1) < r1 * 0.1) & (_norm(end - c2) < r2 * 0.1)
+    err2 = (_norm(start - c2) < r2 * 0.1) & (_norm(end - c1) < r1 * 0.1)
+    return ok & (err1 | err2)
+
+def batch_pedestrian_light_clasp(table, ns):
+    owner, rows = ns.select('LINE')
+    d = _line_vectors(table, rows)
+    is_h = np.abs(d[:, 1]) < np.abs(d[:, 0]) * 0.1
+    is_v = np.abs(d[:, 0]) < np.abs(d[:, 1]) * 0.1
+    n_h, n_v = np.bincount(owner[is_h], minlength=len(ns)), np.bincount(owner[is_v], minlength=len(ns))
+    return (ns.count('LINE') == 8) & (n_h >= 4) & (n_v >= 4)
+
+def batch_controller(table, ns):
+    return ns.count('LINE') == 5
+
+def batch_accessory_device(table, ns):
+    owner, rows = ns.select('LINE')
+    longest = np.zeros(len(ns))
+    np.maximum.at(longest, owner, _norm(_line_vectors(table, rows)))
+    radius = table.columns['CIRCLE']['radius'][ns.anchor_rows('CIRCLE')]
+    return (ns.count('LINE') == 5) & (np.abs(longest - radius * 2) < radius * 0.2)
+
+def batch_sensor_arm(table, ns):
+    return (ns.count('LINE') == 1) & (ns.count('ARC') == 1)
+
+def batch_handhole(table, ns):
+    owner, rows = ns.select('LINE')
+    anchor_rows = ns.anchor_rows('LINE')
+    owner = np.concatenate([np.arange(len(ns)), owner])
+    d = _line_vectors(table, np.concatenate([anchor_rows, rows]))
+    is_h = np.abs(d[:, 1]) < np.abs(d[:, 0]) * 0.15
+    is_v = np.abs(d[:, 0]) < np.abs(d[:, 1]) * 0.15
+    n_h, n_v = np.bincount(owner[is_h], minlength=len(ns)), np.bincount(owner[is_v], minlength=len(ns))
+    return (ns.count('LINE') == 3) & (n_h == 2) & (n_v == 2)
+
+# check_* 関数名 -> 一括判定関数。ここに無い図形は check_* 関数で1件ずつ判定する
+BATCH_CHECKS = {
+    'check_dedicated_pole': batch_dedicated_pole,
+    'check_kanden_pole': batch_kanden_pole,
+    'check_lighting_pole': batch_lighting_pole,
+    'check_lighting_type3': batch_lighting_type3,
+    'check_lighting_type2': batch_lighting_type2,
+    'check_pedestrian_light_clasp': batch_pedestrian_light_clasp,
+    'check_controller': batch_controller,
+    'check_accessory_device': batch_accessory_device,
+    'check_sensor_arm': batch_sensor_arm,
+    'check_handhole': batch_handhole,
+}
+
+# check_* 関数名 -> 判定で参照する近傍の種別。shape_matcher.compile_rule はこの種別について
+# entity_counts からアンカー自身を除いた数を近傍数の下限とし、check_* 関数にはこの種別の近傍だけを渡す。
+# 判定条件を変えて別の種別を参照するようにしたら、ここも合わせて変えること。
+CHECK_TYPES = {
+    'check_dedicated_pole': ('CIRCLE',),
+    'check_kanden_pole': ('LINE',),
+    'check_lighting_pole': ('LINE', 'ARC'),
+    'check_lighting_type3': ('LINE', 'CIRCLE'),
+    'check_lighting_type2': ('LINE', 'CIRCLE'),
+    'check_traffic_light_h3': ('ARC',),
+    'check_traffic_light_h3_double': ('ARC',),
+    'check_light_box_only_h3': ('ARC',),
+    'check_traffic_light_v3': ('ARC',),
+    'check_advance_light': ('ARC',),
+    'check_arrow_light_straight': ('ARC',),
+    'check_pedestrian_light_clasp': ('LINE',),
+    'check_controller': ('LINE',),
+    'check_accessory_device': ('LINE',),
+    'check_sensor_arm': ('LINE', 'ARC'),
+    'check_handhole': ('LINE',),
+}
@@ -1,5 +1,4 @@
 import numpy as np
-from itertools import combinations, permutations
 
 # --- ベクトル・幾何学計算のためのヘルパー関数群 ---
 def magnitude(v):
@@ -48,32 +47,113 @@ SHAPE_DEFINITIONS = {
 }
 
 # --- 判定ロジックの共通部分 ---
+# 円弧の整列判定: 同じ半径とみなせる円弧を、指定方向 (水平なら行、垂直なら列) ごとに
+# まとめ、行内を軸方向にソートしてから「次の円弧があるべき位置」を二分探索で探す。
+# 全組み合わせを試す方法 (O(n^k)) と違い、1行あたり O(m^2 log m) で済む。
+COLLINEAR_RADIUS_TOL = 0.1  # 同じ半径とみなす相対差
+COLLINEAR_SPACING = (0.9, 1.1)  # 等間隔とみなす間隔比
+COLLINEAR_ANGLE = 5  # 同一直線・指定方向とみなす角度 (度)
+COLLINEAR_ROW_GAP = 0.5  # 同じ行 (列) とみなす直交方向のずれの最小値 (半径比)
+
+def _is_collinear_group(centers, axis_vector):
+    """軸方向に並べた中心座標が、等間隔かつ同一直線上で指定方向に並んでいるか"""
+    vectors = [centers[i+1] - centers[i] for i in range(len(centers) - 1)]
+    magnitudes = [magnitude(v) for v in vectors]
+    if any(m < 1e-6 for m in magnitudes): return False
+    # 等間隔かチェック
+    if not all(COLLINEAR_SPACING[0] < (magnitudes[i] / magnitudes[0]) < COLLINEAR_SPACING[1] for i in range(1, len(magnitudes))): return False
+    # 同一直線上にあり、指定方向を向いているかチェック
+    angles = [angle_between(v, vectors[0]) for v in vectors[1:]] + [angle_between(vectors[0], axis_vector)]
+    return all(a < COLLINEAR_ANGLE or a > 180 - COLLINEAR_ANGLE for a in angles)
+
+def _collinear_groups(arcs, num, is_horizontal, base_r, limit=None):
+    """半径をそろえた円弧の中から、等間隔に並ぶ num 個のグループを重複なく探す"""
+    if len(arcs) < num: return []
+    axis = 0 if is_horizontal else 1
+    centers = np.array([np.asarray(a['center'], dtype=np.float64) for a in arcs])
+    axis_vector = np.zeros(centers.shape[1]); axis_vector[axis] = 1.0
+    lo_ratio = COLLINEAR_SPACING[0] * np.cos(np.radians(2 * COLLINEAR_ANGLE)) * 0.95
+    hi_ratio = COLLINEAR_SPACING[1] / np.cos(np.radians(COLLINEAR_ANGLE)) * 1.05
+
+    # 直交方向の座標で行 (列) に分ける。傾いた並びは1間隔ごとに 間隔 × tan(傾き) ずれる (傾きは軸に対して最初の間隔が
+    # COLLINEAR_ANGLE、以降の間隔はさらに COLLINEAR_ANGLE まで) ので、軸方向の広がりから1間隔の最大の長さを求め、
+    # それだけずれても同じ行に残るように切れ目を決める
+    perp = centers[:, 1 - axis]
+    max_step = np.ptp(centers[:, axis]) * hi_ratio / ((num - 1) * lo_ratio) if num > 1 else 0.0
+    row_gap = max(base_r * COLLINEAR_ROW_GAP, max_step * np.tan(np.radians(2 * COLLINEAR_ANGLE)))
+    order = np.argsort(perp, kind='stable')
+    rows = np.split(order, np.nonzero(np.diff(perp[order]) > row_gap)[0] + 1)
+
+    groups, used = [], np.zeros(len(arcs), dtype=bool)
+    for row in rows:
+        if len(row) < num: continue
+        row = row[np.lexsort((row, centers[row, axis]))]  # 軸方向の座標順 (同じなら元の順)
+        xs = centers[row, axis]
+
+        def extend(chain, step):
+            if len(chain) == num:
+                return chain if _is_collinear_group(centers[row[chain]], axis_vector) else None
+            lo = max(np.searchsorted(xs, xs[chain[-1]] + step * lo_ratio, side='left'), chain[-1] + 1)
+            hi = np.searchsorted(xs, xs[chain[-1]] + step * hi_ratio, side='right')
+            for k in range(lo, hi):
+                if used[row[k]]: continue
+                found = extend(chain + [k], step)
+                if found: return found
+            return None
+
+        for i in range(len(row)):
+            # 2番目の候補 j を一括で絞り込む: 軸方向に進み、向きが指定方向に近く、3番目以降の探索範囲が空でない
+            js = np.arange(i + 1, len(row))
+            js = js[~used[row[js]]]
+            steps = xs[js] - xs[i]
+            vectors = centers[row[js]] - centers[row[i]]
+            aligned = (steps > 0) & (steps >= np.linalg.norm(vectors, axis=1) * np.cos(np.radians(COLLINEAR_ANGLE * 1.01)))
+            if num > 2:
+                lo = np.searchsorted(xs, xs[js] + steps * lo_ratio, side='left')
+                hi = np.searchsorted(xs, xs[js] + steps * hi_ratio, side='right')
+                aligned &= hi > np.maximum(lo, js + 1)
+            for j in js[aligned]:
+                if used[row[i]]: break
+                if used[row[j]]: continue
+                chain = extend([i, j], xs[j] - xs[i])
+                if chain is None: continue
+                members = sorted(row[chain])
+                used[members] = True
+                groups.append(tuple(arcs[m] for m in members))
+                if limit and len(groups) >= limit: return groups
+    return groups
+
+def _similar_arcs(arcs):
+    """半径の中央値に近い円弧だけを取り出し、(円弧リスト, 中央値) を返す"""
+    radii = [a['radius'] for a in arcs if a['radius'] > 0]
+    if not radii: return [], 0.0
+    base_r = np.median(radii)
+    return [a for a in arcs if abs(a['radius'] - base_r) < base_r * COLLINEAR_RADIUS_TOL], base_r
+
+def _radius_buckets(arcs):
+    """半径の近い円弧ごとに分ける (各組の最小半径から COLLINEAR_RADIUS_TOL 以内)"""
+    buckets = []
+    for a in sorted((a for a in arcs if a['radius'] > 0), key=lambda a: a['radius']):
+        if buckets and a['radius'] < buckets[-1][0]['radius'] * (1 + COLLINEAR_RADIUS_TOL): buckets[-1].append(a)
+        else: buckets.append([a])
+    return buckets
+
 def find_collinear_arcs(arcs, num, is_horizontal=True):
     """同一直線上に等間隔に並ぶ、同じ半径の円弧のグループを見つける"""
     if len(arcs) < num: return None
-    radii = [a['radius'] for a in arcs if a['radius'] > 0]
-    if not radii: return None
-    base_r = np.median(radii)
-    similar_arcs = [a for a in arcs if abs(a['radius'] - base_r) < base_r * 0.1]
-    if len(similar_arcs) < num: return None
-    
-    sort_key = 0 if is_horizontal else 1 # 水平ならx, 垂直ならyでソート
-    for group in combinations(similar_arcs, num):
-        centers = sorted([arc['center'] for arc in group], key=lambda p: p[sort_key])
-        vectors = [centers[i+1] - centers[i] for i in range(num - 1)]
-        magnitudes = [magnitude(v) for v in vectors]
-        if any(m < 1e-6 for m in magnitudes): continue
-        
-        # 等間隔かチェック
-        dist_ratio_ok = all(0.9 < (magnitudes[i] / magnitudes[0]) < 1.1 for i in range(1, len(magnitudes)))
-        if not dist_ratio_ok: continue
-
-        # 同一直線上にあるかチェック
-        angle_ok = all(angle_between(vectors[i], vectors[0]) < 5 or angle_between(vectors[i], vectors[0]) > 175 for i in range(1, len(vectors)))
-        if not angle_ok: continue
-        
-        return group # 条件に合うグループが見つかればそれを返す
-    return None
+    similar_arcs, base_r = _similar_arcs(arcs)
+    groups = _collinear_groups(similar_arcs, num, is_horizontal, base_r, limit=1)
+    return groups[0] if groups else None
+
+def find_all_collinear_arcs(arcs, num, is_horizontal=True):
+    """等間隔に並ぶ同じ半径の円弧のグループを、互いに重ならないようにすべて見つける
+
+    find_collinear_arcs と異なり半径の中央値で絞り込まず、半径の近い円弧ごとに探す。
+    """
+    groups = []
+    for bucket in _radius_buckets(arcs):
+        groups += _collinear_groups(bucket, num, is_horizontal, np.median([a['radius'] for a in bucket]))
+    return groups
 
 # --- 各図形の定義に対応するチェック関数 ---
 def check_dedicated_pole(anchor, neighbors):
@@ -95,7 +175,7 @@ def check_lighting_pole(anchor, neighbors):
     lines = [e for e in neighbors if e['entity'] == 'LINE']; arcs = [e for e in neighbors if e['entity'] == 'ARC']
     if len(lines) != 3 or len(arcs) != 1: return False
     for comp in lines + arcs:
-        c = comp.get('center', get_line_center(comp))
+        c = comp['center'] if comp['entity'] == 'ARC' else get_line_center(comp)
         if magnitude(c - anchor['center']) > anchor['radius']: return False
     return True
 
@@ -121,14 +201,8 @@ def check_traffic_light_h3_double(anchor, neighbors):
     """両面横型3位式: 3つずつの円弧のグループが2つある"""
     arcs = [e for e in neighbors if e['entity'] == 'ARC']
     if len(arcs) < 6: return False
-    
-    group1 = find_collinear_arcs(arcs, 3, is_horizontal=True)
-    if group1 is None: return False
-    
-    remaining_arcs = [arc for arc in arcs if arc not in group1]
-    group2 = find_collinear_arcs(remaining_arcs, 3, is_horizontal=True)
-    
-    return group2 is not None
+    similar_arcs, base_r = _similar_arcs(arcs)
+    return len(_collinear_groups(similar_arcs, 3, True, base_r, limit=2)) == 2
 
 def check_light_box_only_h3(anchor, neighbors):
     """灯箱のみ: アンカー含め、3つの円弧が同一直線上にある"""
@@ -0,0 +1,231 @@
+import time
+
+import numpy as np
+
+import shape_definitions
+from entity_store import EntityView
+from metrics import SAMPLE_EVERY, metrics
+from shape_batch import BATCH_CHECKS, CHECK_TYPES, NeighborSets
+from shape_definitions import SHAPE_DEFINITIONS, find_all_collinear_arcs
+from spatial_index import GridIndex
+
+# --- 図形探索エンジン ---
+# 図面ごとに一度だけ空間インデックスを構築し、各図形定義のアンカーについて
+# 「アンカーの大きさ × search_radius_ratio」以内の図形を近傍として check_* 関数に渡す。
+# 図形データは EntityTable (entity_store.py) で受け取り、代表点や大きさは配列で一括計算する。
+# 判定は shape_batch.py の一括判定を優先し、無い図形だけ check_* 関数を1件ずつ呼ぶ。
+# 複数の図形定義を選択した場合は、アンカー種別ごとに最大半径で一度だけ検索して共有する。
+# check_* 関数を1件ずつ呼ぶ前に、図形定義の entity_counts から求めた種別ごとの近傍数の下限 (compile_rule) を
+# 全アンカーについて一括で調べ、満たさないアンカーは呼ばずに不合格とする。check_* 関数には
+# 判定で参照する種別の近傍だけを、種別ごとに分けた CSR (NeighborSets.partition) から渡す。
+
+ANALYZED_TYPES = ('LINE', 'CIRCLE', 'ARC')
+DETECTOR_VERSION = 1  # 検出結果が変わる変更 (図形定義・判定・重複除去の規則) をしたら上げる。保存済みの検索結果は作り直される
+
+def build_index(table):
+    """解析対象 (LINE/CIRCLE/ARC) の代表点でグリッドインデックスを構築する。点の番号は gid と一致する"""
+    with metrics.stage('index.build'):
+        points = np.concatenate([table.centroids(t) for t in ANALYZED_TYPES]).reshape(-1, 2)
+        return GridIndex(points)
+
+def neighbor_sets(definition, table, index):
+    """図形定義のアンカー種別の全アンカーについて近傍を一括検索する"""
+    anchor_type = definition['anchor_type']
+    anchors = table.ids(anchor_type)
+    radii = table.sizes(anchor_type) * definition['search_radius_ratio']
+    with metrics.stage(f"neighbors.query.{anchor_type}"):
+        offsets, indices, _ = index.query_radius_batch(index.points[anchors], radii)
+        return NeighborSets(table, anchors, offsets, indices)
+
+def plan_shapes(shape_keys):
+    """選択された図形定義をアンカー種別ごとにまとめる (アンカー種別 -> 図形キーのリスト、選択順を保つ)"""
+    plan = {}
+    for shape_key in shape_keys:
+        plan.setdefault(SHAPE_DEFINITIONS[shape_key]['anchor_type'], []).append(shape_key)
+    return plan
+
+def filter_radius(offsets, indices, distances, radii):
+    """CSR形式の検索結果を、クエリごとの半径 radii 以内に絞り込む (各クエリ内の並び順は保つ)"""
+    owner = np.repeat(np.arange(len(radii)), np.diff(offsets))
+    keep = distances <= radii[owner]
+    new_offsets = np.zeros(len(radii) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner[keep], minlength=len(radii)), out=new_offsets[1:])
+    return new_offsets, indices[keep], distances[keep]
+
+def shared_neighbor_sets(shape_keys, table, index, anchors=None):
+    """同じアンカー種別の図形定義について、最大の検索半径で一度だけ近傍検索し、
+    図形ごとの近傍を距離で絞り込んで返す (図形キー -> NeighborSets)
+
+    距離は検索半径によらず同じ値なので、図形ごとに検索した場合と結果は完全に一致する。
+    anchors (アンカー種別 -> gid 配列) を渡すと、そのアンカーだけを検索する。
+    """
+    result = {}
+    for anchor_type, keys in plan_shapes(shape_keys).items():
+        if anchors is None: type_anchors, sizes = table.ids(anchor_type), table.sizes(anchor_type)
+        else:
+            type_anchors = anchors[anchor_type]
+            sizes = table.sizes(anchor_type)[type_anchors - table.offsets[anchor_type]]
+        max_ratio = max(SHAPE_DEFINITIONS[k]['search_radius_ratio'] for k in keys)
+        with metrics.stage(f"neighbors.query.{anchor_type}"):
+            offsets, indices, distances = index.query_radius_batch(index.points[type_anchors], sizes * max_ratio)
+        for shape_key in keys:
+            with metrics.stage(f"neighbors.filter.{shape_key}"):
+                radii = sizes * SHAPE_DEFINITIONS[shape_key]['search_radius_ratio']
+                sub_offsets, sub_indices, _ = filter_radius(offsets, indices, distances, radii)
+                result[shape_key] = NeighborSets(table, type_anchors, sub_offsets, sub_indices)
+    return result
+
+def compile_rule(definition):
+    """図形定義から (判定で参照する近傍の種別 (None ならすべて), 種別 -> 近傍数の下限) を作る
+
+    下限は entity_counts からアンカー自身の分を除いた数で、check_* 関数が参照する種別 (shape_batch.CHECK_TYPES) に限る。
+    """
+    types = CHECK_TYPES.get(definition['check_function'])
+    if types is None: return None, {}
+    counts = definition['entity_counts']
+    return types, {t: max(counts.get(t, 0) - (t == definition['anchor_type']), 0) for t in types}
+
+def feasible_anchors(definition, ns):
+    """近傍の種別ごとの数が下限を満たすアンカーの bool 配列"""
+    ok = np.ones(len(ns), dtype=bool)
+    for etype, minimum in compile_rule(definition)[1].items():
+        if minimum: ok &= ns.count(etype) >= minimum
+    return ok
+
+def scalar_check(check, table, ns, q, types=None):
+    """q 番目のアンカーを check_* 関数で判定する。types を渡すとその種別の近傍だけを gid 順に渡す"""
+    if types is None: return check(table.entity(ns.anchors[q]), [table.entity(j) for j in ns.neighbors(q)])
+    neighbors = []
+    for etype in ANALYZED_TYPES:  # 種別は gid の範囲の順なので、並べると gid 順になる
+        if etype not in types: continue
+        offsets, rows = ns.partition(etype)
+        neighbors += [EntityView(table, etype, int(r)) for r in rows[offsets[q]:offsets[q + 1]]]
+    return check(table.entity(ns.anchors[q]), neighbors)
+
+def batch_check(batch, name, table, ns):
+    """一括判定を実行し、判定数・合格数・時間を metrics に記録する"""
+    t0 = time.perf_counter()
+    matched = batch(table, ns)
+    seconds = time.perf_counter() - t0
+    metrics.record_check(name, len(ns), int(np.count_nonzero(matched)), seconds, [seconds / len(ns)], batch=True)
+    return matched
+
+def evaluate_anchors(definition, table, ns, use_batch=True, use_rules=True):
+    """全アンカーの判定結果を bool 配列で返す。一括判定が無い図形は、近傍数の下限を満たすアンカーだけ check_* 関数を1件ずつ呼ぶ"""
+    name = definition['check_function']
+    batch = BATCH_CHECKS.get(name) if use_batch else None
+    if batch and len(ns): return batch_check(batch, name, table, ns)
+    check = getattr(shape_definitions, name)
+    types = compile_rule(definition)[0] if use_rules else None
+    candidates = np.nonzero(feasible_anchors(definition, ns))[0] if use_rules else range(len(ns))
+    matched, samples = np.zeros(len(ns), dtype=bool), []
+    t0 = time.perf_counter()
+    for i, q in enumerate(candidates):
+        if i % SAMPLE_EVERY: matched[q] = scalar_check(check, table, ns, q, types); continue
+        t = time.perf_counter(); matched[q] = scalar_check(check, table, ns, q, types); samples.append(time.perf_counter() - t)
+    metrics.record_check(name, len(candidates), int(np.count_nonzero(matched)), time.perf_counter() - t0, samples, rejected=len(ns) - len(candidates))
+    return matched
+
+def anchor_candidates(shape_keys, table, index, anchor_type, anchors):
+    """同じアンカー種別の図形定義について、指定したアンカーだけを判定する。
+    図形キー -> (合格したアンカーの gid, 近傍の offsets, 近傍の gid) を返す (重複の除去はしない)"""
+    neighbors = shared_neighbor_sets(shape_keys, table, index, anchors={anchor_type: anchors})
+    results = {}
+    for shape_key in shape_keys:
+        ns = neighbors[shape_key]
+        q = np.nonzero(evaluate_anchors(SHAPE_DEFINITIONS[shape_key], table, ns))[0] if len(ns) else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(q) + 1, dtype=np.int64); np.cumsum(np.diff(ns.offsets)[q], out=offsets[1:])
+        rows = np.concatenate([ns.neighbors(i) for i in q]) if len(q) else np.zeros(0, dtype=np.int64)
+        results[shape_key] = (ns.anchors[q], offsets, rows)
+    return results
+
+def match_shape(shape_key, table, index, use_batch=True, ns=None, use_rules=True):
+    """1つの図形定義を全アンカーに適用し、(検出数, 検出図形の gid 配列) を返す
+
+    一度検出に使われた図形をアンカーとする候補は数えないため、
+    複数の構成図形がアンカーになり得る図形 (ハンドホール等) も1つとして数える。
+    一括判定がある図形は全アンカーを NumPy で先に判定し、無い図形は未使用のアンカーだけを
+    check_* 関数で判定する (近傍数の下限を満たさないアンカーは呼ばない)。ns を渡した場合は近傍検索を省略する。
+    """
+    definition = SHAPE_DEFINITIONS[shape_key]
+    if ns is None: ns = neighbor_sets(definition, table, index)
+    name = definition['check_function']
+    batch = BATCH_CHECKS.get(name) if use_batch else None
+    matched = batch_check(batch, name, table, ns) if batch and len(ns) else None
+    check = getattr(shape_definitions, name)
+    types = compile_rule(definition)[0] if use_rules else None
+
+    if matched is not None: candidates = np.nonzero(matched)[0]
+    else: candidates = np.nonzero(feasible_anchors(definition, ns))[0] if use_rules else range(len(ns))
+    count, found, consumed = 0, [], set()
+    calls, passed, samples, seconds = 0, 0, [], 0.0
+    for q in candidates:
+        a = ns.anchors[q]
+        if a in consumed: continue
+        if matched is None:
+            t = time.perf_counter(); ok = scalar_check(check, table, ns, q, types); dt = time.perf_counter() - t
+            seconds += dt; calls += 1; passed += ok
+            if calls % SAMPLE_EVERY == 1: samples.append(dt)
+            if not ok: continue
+        count += 1
+        for gid in [a, *ns.neighbors(q)]:
+            if gid not in consumed:
+                consumed.add(gid); found.append(gid)
+    if matched is None: metrics.record_check(name, calls, passed, seconds, samples, rejected=len(ns) - len(candidates))
+    return count, np.array(found, dtype=np.int64)
+
+def find_shapes(table, shape_keys, progress=None):
+    """選択された図形定義をまとめて探索し、画面表示用の結果辞書を返す
+
+    近傍検索はアンカー種別ごとに1回だけ行う (shared_neighbor_sets)。
+    progress を渡すと、図形定義を1つ処理するごとに進捗 (0〜1) を渡して呼ぶ。
+    """
+    index = build_index(table)
+    neighbors = shared_neighbor_sets(shape_keys, table, index)
+    results = {}
+    for i, shape_key in enumerate(shape_keys):
+        with metrics.stage(f"match.{shape_key}"):
+            count, gids = match_shape(shape_key, table, index, ns=neighbors.pop(shape_key, None))
+        results[shape_key] = {'name': SHAPE_DEFINITIONS[shape_key]['name'], 'count': count, 'handles': table.handles(gids)}
+        if progress: progress((i + 1) / len(shape_keys))
+    return results
+
+# --- 明細書エディタの図形探索 ---
+VEHICLE_LIGHT_LINK_RATIO = 3.0  # 同じ灯器の円弧とみなす中心間距離 (半径比)
+
+def connected_components(n, offsets, indices):
+    """CSR形式の近傍関係を無向グラフとみなし、連結成分ごとのラベル (最小の番号) を返す"""
+    labels = np.arange(n)
+    owner = np.repeat(np.arange(n), np.diff(offsets))
+    while True:
+        new = labels.copy()
+        np.minimum.at(new, owner, labels[indices])
+        np.minimum.at(new, indices, labels[owner])
+        new = new[new]  # ラベルの付け替えを飛び越して収束を早める
+        if np.array_equal(new, labels): return labels
+        labels = new
+
+def find_vehicle_lights(table):
+    """図面全体から車両灯器 (等間隔に3つ並ぶ同じ半径の円弧。横型→縦型の順) を探し、(数, 円弧の gid 配列) を返す
+
+    近接する円弧のまとまりごとに find_all_collinear_arcs を適用するため、図面が大きくても
+    整列判定の対象は局所的な円弧に限られる。
+    """
+    centers, radii = table.centroids('ARC'), table.sizes('ARC')
+    offsets, indices, _ = GridIndex(centers).query_radius_batch(centers, radii * VEHICLE_LIGHT_LINK_RATIO)
+    labels = connected_components(len(centers), offsets, indices)
+    order = np.argsort(labels, kind='stable')
+    count, found = 0, []
+    for rows in np.split(order, np.nonzero(np.diff(labels[order]))[0] + 1):
+        if len(rows) < 3: continue
+        arcs = [table.entity(gid) for gid in table.ids('ARC')[rows]]
+        groups = find_all_collinear_arcs(arcs, 3, is_horizontal=True)
+        used = {arc for group in groups for arc in group}
+        groups += find_all_collinear_arcs([a for a in arcs if a not in used], 3, is_horizontal=False)
+        count += len(groups)
+        found += [table.offsets['ARC'] + arc.row for group in groups for arc in group]
+    return count, np.array(found, dtype=np.int64)
+
+def find_pedestrian_lights(table):
+    """図面全体から歩行者用灯器 (pedestrian_light_clasp) を探し、(数, 構成図形の gid 配列) を返す"""
+    return match_shape('pedestrian_light_clasp', table, build_index(table))
@@ -0,0 +1,119 @@
+import numpy as np
+
+# --- 一様グリッドによる空間インデックス ---
+# 点を (列, 行) のセルに割り当て、セルキー = 列 * 行数 + 行 でソートしておく。
+# 同じ列の連続した行はキー空間でも連続するため、円の外接矩形に含まれるセルは
+# 「列ごとに1区間」として searchsorted だけで取り出せる。
+# セルはキーとして存在するだけなので、遠くに離れた図形があって列・行の数が大きくなってもメモリは増えない。
+
+BATCH_CHUNK_SIZE = 4096  # 一括検索で一度に展開するクエリ数 (候補配列のメモリ上限)
+BATCH_CANDIDATE_LIMIT = 4_000_000  # 1回に展開する候補点の上限。超えるクエリの塊は半分に分けて検索する
+EXTENT_PERCENTILES = (1.0, 99.0)  # セル幅を決める範囲 (離れた少数の図形で図面全体が1セルにならないように)
+MAX_CELLS_PER_AXIS = 2 ** 30  # セルキー (列 * 行数 + 行) が int64 に収まるための1軸あたりのセル数の上限
+
+def _default_cell_size(points):
+    """1セルあたり平均数点になるセル幅を、点の大部分 (EXTENT_PERCENTILES の範囲) の広さと点数から決める"""
+    n = len(points)
+    if n == 0: return 1.0
+    full = float((points.max(axis=0) - points.min(axis=0)).max())
+    lo, hi = np.percentile(points, EXTENT_PERCENTILES, axis=0)
+    extent = hi - lo
+    inside = np.count_nonzero(np.all((points >= lo) & (points <= hi), axis=1))
+    if inside == 0:  # 点が少なく範囲内に1点も残らない場合は全体の広さと点数で決める
+        extent, inside = points.max(axis=0) - points.min(axis=0), n
+    area = float(extent[0]) * float(extent[1])
+    if area > 0: size = 2.0 * np.sqrt(area / inside)
+    elif extent.max() > 0: size = 2.0 * float(extent.max()) / inside  # 点がほぼ一直線に並ぶ場合
+    else: size = full
+    size = max(size, full / MAX_CELLS_PER_AXIS)
+    return size if np.isfinite(size) and size > 0 else 1.0
+
+class GridIndex:
+    """2次元点群に対する半径検索用の一様グリッドインデックス"""
+
+    def __init__(self, points, cell_size=None):
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+        n = len(self.points)
+        if n:
+            self.origin = self.points.min(axis=0)
+            extent = self.points.max(axis=0) - self.origin
+        else:
+            self.origin, extent = np.zeros(2), np.zeros(2)
+        self.cell_size = float(cell_size) if cell_size else _default_cell_size(self.points)
+        self.nx = int(extent[0] // self.cell_size) + 1
+        self.ny = int(extent[1] // self.cell_size) + 1
+        cells = np.floor((self.points - self.origin) / self.cell_size).astype(np.int64)
+        keys = cells[:, 0] * self.ny + cells[:, 1]
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+        self.sorted_points = self.points[self.order]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell_ranges(self, centers, radii):
+        """検索円の外接矩形をセル範囲 (列・行の最小/最大) に変換する。範囲外は空になる"""
+        lo = np.floor((centers - radii[:, None] - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((centers + radii[:, None] - self.origin) / self.cell_size).astype(np.int64)
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, [self.nx - 1, self.ny - 1])
+        return lo, hi
+
+    def query_radius(self, center, radius):
+        """center から radius 以内にある点のインデックスを昇順で返す"""
+        offsets, indices, _ = self.query_radius_batch(np.asarray(center, dtype=np.float64).reshape(1, -1)[:, :2], [radius])
+        return indices
+
+    def query_radius_batch(self, centers, radii, return_sorted=True):
+        """複数の円を一括検索し、CSR形式 (offsets, indices, distances) で返す
+
+        クエリ q の結果は indices[offsets[q]:offsets[q+1]] で、各クエリ内は
+        元のインデックス順に並ぶ (return_sorted=True の場合)。
+        """
+        centers = np.ascontiguousarray(centers, dtype=np.float64).reshape(-1, 2)
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), (len(centers),))
+        m = len(centers)
+        counts = np.zeros(m, dtype=np.int64)
+        if m == 0 or len(self.points) == 0:
+            return np.zeros(m + 1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        parts_idx, parts_dist = [], []
+        for start in range(0, m, BATCH_CHUNK_SIZE):
+            stop = min(start + BATCH_CHUNK_SIZE, m)
+            qid, idx, dist = self._query_chunk(centers[start:stop], radii[start:stop])
+            if return_sorted:
+                order = np.lexsort((idx, qid))
+                qid, idx, dist = qid[order], idx[order], dist[order]
+            counts[start:stop] = np.bincount(qid, minlength=stop - start)
+            parts_idx.append(idx); parts_dist.append(dist)
+        offsets = np.zeros(m + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return offsets, np.concatenate(parts_idx), np.concatenate(parts_dist)
+
+    def _query_chunk(self, centers, radii):
+        """クエリの塊を検索して (クエリ番号, 点のインデックス, 距離) を返す。候補が多すぎる塊は分けて検索する"""
+        lo, hi = self._cell_ranges(centers, radii)
+        ncols = np.where((hi[:, 0] >= lo[:, 0]) & (hi[:, 1] >= lo[:, 1]), hi[:, 0] - lo[:, 0] + 1, 0)
+        # クエリごとの列を展開し、列ごとのキー区間を searchsorted で取り出す
+        col_q = np.repeat(np.arange(len(centers)), ncols)
+        col_start = np.repeat(np.cumsum(ncols) - ncols, ncols)
+        cols = lo[col_q, 0] + (np.arange(len(col_q)) - col_start)
+        left = np.searchsorted(self.sorted_keys, cols * self.ny + lo[col_q, 1], side='left')
+        right = np.searchsorted(self.sorted_keys, cols * self.ny + hi[col_q, 1], side='right')
+        span = right - left
+        if len(centers) > 1 and span.sum() > BATCH_CANDIDATE_LIMIT:
+            half = len(centers) // 2
+            first, second = self._query_chunk(centers[:half], radii[:half]), self._query_chunk(centers[half:], radii[half:])
+            return np.concatenate([first[0], second[0] + half]), np.concatenate([first[1], second[1]]), np.concatenate([first[2], second[2]])
+        # 区間を候補点の位置に展開して距離で絞り込む
+        cand_q = np.repeat(col_q, span)
+        cand_start = np.repeat(np.cumsum(span) - span, span)
+        pos = np.repeat(left, span) + (np.arange(len(cand_q)) - cand_start)
+        dist = np.hypot(*(self.sorted_points[pos] - centers[cand_q]).T)
+        hit = dist <= radii[cand_q]
+        return cand_q[hit], self.order[pos[hit]], dist[hit]
+
+def brute_force_radius(points, center, radius):
+    """比較用: 全点との距離を計算する総当たりの半径検索"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    dist = np.hypot(*(points - np.asarray(center, dtype=np.float64)[:2]).T)
+    return np.nonzero(dist <= radius)[0]
@@ -0,0 +1,98 @@
+import os
+
+import mojimoji
+import numpy as np
+
+from metrics import metrics
+
+# --- 文字検索インデックス ---
+# 明細項目のテキスト探索は、全ての TEXT を全角→半角に変換してから部分一致を調べていたため、
+# 項目の追加や出力のたびに全件の変換と走査が必要だった。プロジェクト作成時に一度だけ
+# 正規化した文字列 (全角英数→半角、casefold) と、1文字・2文字の n-gram -> 行番号 の転置インデックスを作り、
+# 検索語の n-gram の行番号の積集合を候補として、候補の文字列だけで部分一致を確かめる。
+# インデックスは図形データ (.npz) と同じ場所に <名前>.text.npz として保存する。
+
+NGRAM = 2
+INDEX_VERSION = 1  # 正規化や保存形式を変えたら上げる。古いインデックスは作り直される
+
+def normalize_text(s):
+    """検索用の正規化: 全角英数記号を半角にし (かなはそのまま)、大文字小文字をそろえる"""
+    return mojimoji.zen_to_han(s, kana=False).casefold()
+
+def text_index_path(store_path):
+    return os.path.splitext(store_path)[0] + '.text.npz'
+
+def _encode(strings):
+    data = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64); np.cumsum([len(b) for b in data], out=offsets[1:])
+    return np.frombuffer(b''.join(data), dtype=np.uint8).copy(), offsets
+
+def _decode(data, offsets):
+    raw = data.tobytes()
+    return [raw[a:b].decode('utf-8') for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+class TextIndex:
+    """TEXT の行番号 (EntityTable の TEXT 内の行) を返す部分一致検索インデックス"""
+
+    def __init__(self, texts, grams, offsets, rows):
+        self.texts = texts  # 正規化済みの文字列
+        self.grams, self.offsets, self.rows = grams, offsets, rows  # n-gram (昇順) ごとの行番号 (CSR)
+
+    @classmethod
+    def build(cls, texts):
+        normalized = [normalize_text(t) for t in texts]
+        postings = {}
+        for row, s in enumerate(normalized):
+            for gram in {s[i:i + n] for n in range(1, NGRAM + 1) for i in range(len(s) - n + 1)}:
+                postings.setdefault(gram, []).append(row)  # 行の昇順に追加される
+        grams = sorted(postings)
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64); np.cumsum([len(postings[g]) for g in grams], out=offsets[1:])
+        rows = np.fromiter((r for g in grams for r in postings[g]), dtype=np.int32, count=int(offsets[-1]))
+        return cls(normalized, np.array(grams, dtype=f'U{NGRAM}'), offsets, rows)
+
+    @classmethod
+    def from_table(cls, table):
+        with metrics.stage('text_index.build'): return cls.build(table.texts())
+
+    def save(self, file):
+        data, text_offsets = _encode(self.texts)
+        np.savez(file, version=INDEX_VERSION, text_data=data, text_offsets=text_offsets, grams=self.grams, offsets=self.offsets, rows=self.rows)
+
+    @classmethod
+    def load(cls, file):
+        """保存したインデックスを読み込む。版が違う場合は None を返す"""
+        with np.load(file, allow_pickle=False) as data:
+            if int(data['version']) != INDEX_VERSION: return None
+            return cls(_decode(data['text_data'], data['text_offsets']), data['grams'], data['offsets'], data['rows'])
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _postings(self, gram):
+        k = int(np.searchsorted(self.grams, gram))
+        if k == len(self.grams) or self.grams[k] != gram: return None
+        return self.rows[self.offsets[k]:self.offsets[k + 1]]
+
+    def search(self, query):
+        """query を含む行番号の昇順の配列 (正規化した文字列どうしの部分一致)"""
+        q = normalize_text(query)
+        if not q: return np.arange(len(self), dtype=np.int64)
+        n = min(len(q), NGRAM)
+        lists = []
+        for gram in {q[i:i + n] for i in range(len(q) - n + 1)}:
+            rows = self._postings(gram)
+            if rows is None: return np.zeros(0, dtype=np.int64)
+            lists.append(rows)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for rows in lists[1:]:
+            if not len(candidates): break
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        candidates = candidates.astype(np.int64)
+        if len(q) <= NGRAM: return candidates  # n-gram が一致すれば部分一致している
+        return candidates[[q in self.texts[i] for i in candidates.tolist()]] if len(candidates) else candidates
+
+    def mask(self, query):
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.search(query)] = True
+        return mask
@@ -0,0 +1,109 @@
+import re
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+# --- Excel (xlsx) の逐次出力 ---
+# pandas.ExcelWriter (openpyxl) は全シートの DataFrame とブック全体のオブジェクトをメモリに作り、
+# BytesIO に保存してから応答にコピーするため、20万行の出力では同じ内容が何重にもメモリに載る。
+# openpyxl の write-only モードもシートを一時ファイルに書き、save() で最後にまとめて zip にするので、
+# 保存が終わるまで1バイトも送れない。ここでは xlsx (zip に入ったXML) を自分で組み立て、
+# 行をまとめて (chunk ごとに) シートのXMLとして zip に書き、書けた分のバイト列をその都度返す。
+# zipfile はシーク出来ない出力にはデータ記述子付きで書くので、ファイルの大きさを先に知らなくてよい。
+# 文字列はセル内の文字列 (inlineStr) として書き、共有文字列表は作らない。
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+COMPRESS_LEVEL = 6
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+CONTENT_TYPES = (XML_HEADER + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                 '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                 '<Default Extension="xml" ContentType="application/xml"/>'
+                 '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                 '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                 '{sheets}</Types>')
+ROOT_RELS = (XML_HEADER + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+             f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+STYLES = (XML_HEADER + f'<styleSheet xmlns="{MAIN_NS}"><fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+          '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+          '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+          '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+          '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+          '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>')
+SHEET_START = XML_HEADER + f'<worksheet xmlns="{MAIN_NS}"><sheetData>'
+SHEET_END = '</sheetData></worksheet>'
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')  # XML 1.0 に書けない制御文字 (DXF の文字に混ざることがある)
+
+class _Chunks:
+    """zipfile の出力先。書かれたバイト列を溜め、take() で取り出す (シーク出来ない出力として扱われる)"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def _string_cells(values):
+    cells = []
+    for s in values:
+        s = ILLEGAL_XML_CHARS.sub('', str(s))
+        space = ' xml:space="preserve"' if s != s.strip() else ''
+        cells.append(f'<c t="inlineStr"><is><t{space}>{escape(s)}</t></is></c>')
+    return cells
+
+def _number_cells(values):
+    values = np.asarray(values)
+    finite = np.isfinite(values) if values.dtype.kind == 'f' else np.ones(len(values), dtype=bool)
+    return [f'<c><v>{v!r}</v></c>' if ok else '<c/>' for v, ok in zip(values.tolist(), finite.tolist())]
+
+def column_cells(values):
+    """1列の値をセルのXMLのリストにする (数値の配列は数値、それ以外は文字列のセル)"""
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iuf': return _number_cells(values)
+    return _string_cells(values)
+
+def rows_xml(columns, first_row):
+    """列名 -> 値 の辞書を first_row 行目からの <row> のXMLにする"""
+    cells = [column_cells(values) for values in columns.values()]
+    return ''.join(f'<row r="{r}">{"".join(row)}</row>' for r, row in enumerate(zip(*cells), first_row))
+
+def iter_xlsx(sheets, compresslevel=COMPRESS_LEVEL):
+    """sheets ([(シート名, 列名のリスト, 列名 -> 値 の辞書の反復子), ...]) を xlsx にし、バイト列を少しずつ返す
+
+    1行目は列名。シートが無い場合は空のシートを1つ作る。
+    """
+    sheets = list(sheets) or [('Sheet1', [], iter(()))]
+    out = _Chunks()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        overrides = ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                            for i in range(1, len(sheets) + 1))
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES.format(sheets=overrides))
+        zf.writestr('_rels/.rels', ROOT_RELS)
+        zf.writestr('xl/workbook.xml', XML_HEADER + f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+                    + ''.join(f'<sheet name={quoteattr(name)} sheetId="{i}" r:id="rId{i}"/>' for i, (name, _, _) in enumerate(sheets, 1)) + '</sheets></workbook>')
+        zf.writestr('xl/_rels/workbook.xml.rels', XML_HEADER + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    + ''.join(f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(sheets) + 1))
+                    + f'<Relationship Id="rId{len(sheets) + 1}" Type="{REL_NS}/styles" Target="styles.xml"/></Relationships>')
+        zf.writestr('xl/styles.xml', STYLES)
+        yield out.take()
+        for i, (_, header, chunks) in enumerate(sheets, 1):
+            with zf.open(f'xl/worksheets/sheet{i}.xml', 'w') as f:
+                f.write((SHEET_START + (f'<row r="1">{"".join(_string_cells(header))}</row>' if header else '')).encode('utf-8'))
+                row = 2
+                for columns in chunks:
+                    xml = rows_xml(columns, row)
+                    row += len(next(iter(columns.values()), ()))
+                    f.write(xml.encode('utf-8'))
+                    if out.parts: yield out.take()
+                f.write(SHEET_END.encode('utf-8'))
+    yield out.take()  # 最後のシートの残りと zip の目次